@@ -0,0 +1,114 @@
+"""Synthetic datasets shaped like real instrument data, at several sizes.
+
+Every generator is deterministic so results can be compared between runs.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+SIZES = ("small", "medium", "large")
+
+
+def _time(n_times: int) -> xr.DataArray:
+    return xr.DataArray(
+        pd.date_range("2022-01-01", periods=n_times, freq="s"),
+        dims="time",
+        attrs={"long_name": "Time"},
+    )
+
+
+def _attrs(name: str) -> Dict[str, str]:
+    return {
+        "datastream": f"bench.{name}.b1",
+        "title": f"Synthetic {name} dataset",
+        "history": "Generated by benchmarks/datasets.py",
+    }
+
+
+def timeseries(n_times: int, n_vars: int = 20) -> xr.Dataset:
+    """A long 1D time series, e.g., from a met station."""
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        coords={"time": _time(n_times)},
+        data_vars={
+            f"var_{i}": ("time", rng.random(n_times), {"units": "1"})
+            for i in range(n_vars)
+        },
+        attrs=_attrs("timeseries"),
+    )
+
+
+def time_height(n_times: int, n_heights: int, n_vars: int = 4) -> xr.Dataset:
+    """A wide time x height grid, e.g., from a lidar or radar profiler."""
+    rng = np.random.default_rng(0)
+    shape = (n_times, n_heights)
+    return xr.Dataset(
+        coords={
+            "time": _time(n_times),
+            "height": ("height", np.arange(n_heights) * 30.0, {"units": "m"}),
+        },
+        data_vars={
+            f"var_{i}": (("time", "height"), rng.random(shape), {"units": "1"})
+            for i in range(n_vars)
+        },
+        attrs=_attrs("time_height"),
+    )
+
+
+def many_scalars(n_times: int, n_scalars: int = 500) -> xr.Dataset:
+    """A short time series with hundreds of scalar variables (calibration constants,
+    instrument settings, locations, ...)."""
+    rng = np.random.default_rng(0)
+    data_vars = {f"scalar_{i}": ((), rng.random()) for i in range(n_scalars)}
+    data_vars["signal"] = ("time", rng.random(n_times))
+    return xr.Dataset(
+        coords={"time": _time(n_times)},
+        data_vars=data_vars,
+        attrs=_attrs("many_scalars"),
+    )
+
+
+def mixed(n_times: int, n_heights: int, n_wavelengths: int = 20) -> xr.Dataset:
+    """Several dimension groups in one dataset: scalars, time, height, wavelength,
+    time x height and time x wavelength, e.g., from a spectral radiometer."""
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        coords={
+            "time": _time(n_times),
+            "height": ("height", np.arange(n_heights) * 30.0, {"units": "m"}),
+            "wavelength": ("wavelength", np.linspace(400, 1000, n_wavelengths)),
+        },
+        data_vars={
+            "lat": ((), 46.3),
+            "lon": ((), -119.3),
+            "surface_temp": ("time", rng.random(n_times)),
+            "qc_surface_temp": ("time", rng.integers(0, 4, n_times, dtype="int32")),
+            "range_resolution": ("height", rng.random(n_heights)),
+            "filter_width": ("wavelength", rng.random(n_wavelengths)),
+            "backscatter": (("time", "height"), rng.random((n_times, n_heights))),
+            "radiance": (("time", "wavelength"), rng.random((n_times, n_wavelengths))),
+        },
+        attrs=_attrs("mixed"),
+    )
+
+
+# (dataset name, size) -> function that builds it
+DATASETS: Dict[Tuple[str, str], Callable[[], xr.Dataset]] = {
+    ("timeseries", "small"): lambda: timeseries(10_000),
+    ("timeseries", "medium"): lambda: timeseries(100_000),
+    ("timeseries", "large"): lambda: timeseries(1_000_000),
+    ("time_height", "small"): lambda: time_height(1_000, 100),
+    ("time_height", "medium"): lambda: time_height(10_000, 200),
+    ("time_height", "large"): lambda: time_height(50_000, 500),
+    ("many_scalars", "small"): lambda: many_scalars(100),
+    ("many_scalars", "medium"): lambda: many_scalars(1_000, 2_000),
+    ("many_scalars", "large"): lambda: many_scalars(10_000, 5_000),
+    ("mixed", "small"): lambda: mixed(1_000, 50),
+    ("mixed", "medium"): lambda: mixed(10_000, 100),
+    ("mixed", "large"): lambda: mixed(50_000, 250),
+}
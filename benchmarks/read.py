@@ -0,0 +1,156 @@
+"""Benchmarks the read options of `ncconvert.utils.open_dataset` on each input type.
+
+Each case opens one synthetic file with some options and reads it either all at once
+("load", like the CLI's default) or in slices along time ("slices", like streamed
+conversions with --chunks, --memory-limit or row_group_size). Cases run in fresh
+processes, since the netcdf4 engine's chunk cache setting is process-wide, and the best
+of `repeat` runs is reported along with its speedup over the first case of its input:
+
+    python -m benchmarks.read --repeat 3
+
+The inputs are a netCDF3 file, an uncompressed netCDF4 file, a compressed netCDF4 file
+whose chunks span the whole time axis (so every slice along time decompresses every
+chunk again unless the chunks fit in the chunk cache), and a netCDF4 file of packed
+int16 variables with scale_factor and _FillValue.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+SIZES = {"small": (20_000, 256), "medium": (40_000, 512)}
+
+
+def _grid(n_times: int, n_heights: int) -> xr.Dataset:
+    # Smooth data, so it compresses like real measurements rather than like noise
+    time = pd.date_range("2022-01-01", periods=n_times, freq="s")
+    height = np.arange(n_heights) * 30.0
+    values = np.sin(np.arange(n_times) / 500)[:, None] + height[None, :] / 1e4
+    return xr.Dataset(
+        coords={"time": time, "height": ("height", height, {"units": "m"})},
+        data_vars={
+            f"var_{i}": (("time", "height"), (values + i).astype("float32"))
+            for i in range(2)
+        },
+    )
+
+
+def _write_netcdf3(ds: xr.Dataset, path: Path) -> None:
+    ds.to_netcdf(path, format="NETCDF3_64BIT")
+
+
+def _write_netcdf4(ds: xr.Dataset, path: Path) -> None:
+    ds.to_netcdf(path, engine="netcdf4")
+
+
+def _write_netcdf4_zlib(ds: xr.Dataset, path: Path) -> None:
+    # Each chunk holds every time step of a quarter of the heights
+    chunks = (ds.sizes["time"], ds.sizes["height"] // 4)
+    encoding = {
+        name: {"zlib": True, "complevel": 1, "chunksizes": chunks}
+        for name in ds.data_vars
+    }
+    ds.to_netcdf(path, engine="netcdf4", encoding=encoding)
+
+
+def _write_netcdf4_packed(ds: xr.Dataset, path: Path) -> None:
+    encoding = {
+        name: {"dtype": "int16", "scale_factor": 0.001, "_FillValue": -32768}
+        for name in ds.data_vars
+    }
+    ds.to_netcdf(path, engine="netcdf4", encoding=encoding)
+
+
+# (input, read mode, open_dataset options); the first case of each input is the baseline
+CASES: List[Tuple[str, str, Dict[str, Any]]] = [
+    ("netcdf3", "load", {}),
+    ("netcdf3", "load", {"engine": "scipy", "mmap": False}),
+    ("netcdf3", "load", {"engine": "scipy", "mmap": True}),
+    ("netcdf4", "load", {}),
+    ("netcdf4", "load", {"engine": "h5netcdf"}),
+    ("netcdf4-zlib", "load", {}),
+    ("netcdf4-zlib", "load", {"engine": "h5netcdf"}),
+    ("netcdf4-zlib", "slices", {}),
+    ("netcdf4-zlib", "slices", {"chunk_cache": 2**28}),
+    ("netcdf4-zlib", "slices", {"engine": "h5netcdf"}),
+    ("netcdf4-packed", "load", {}),
+    ("netcdf4-packed", "load", {"mask_and_scale": False}),
+    ("netcdf4-packed", "load", {"decode_times": False}),
+]
+
+INPUTS: Dict[str, Callable[[xr.Dataset, Path], None]] = {
+    "netcdf3": _write_netcdf3,
+    "netcdf4": _write_netcdf4,
+    "netcdf4-zlib": _write_netcdf4_zlib,
+    "netcdf4-packed": _write_netcdf4_packed,
+}
+
+
+def _run_case(path: Path, mode: str, options: Dict[str, Any], queue: mp.Queue) -> None:
+    from ncconvert.utils import open_dataset
+
+    start = time.perf_counter()
+    with open_dataset(path, **options) as ds:
+        if mode == "load":
+            ds.load()
+        else:
+            step = max(ds.sizes["time"] // 20, 1)
+            for i in range(0, ds.sizes["time"], step):
+                ds.isel(time=slice(i, i + step)).load()
+    queue.put(time.perf_counter() - start)
+
+
+def run_case(path: Path, mode: str, options: Dict[str, Any], repeat: int) -> float:
+    ctx = mp.get_context("spawn")
+    times = []
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_case, args=(path, mode, options, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Read case {mode} {options} on {path} failed")
+        times.append(queue.get())
+    return min(times)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark netCDF read options.")
+    parser.add_argument("--inputs", nargs="+", default=list(INPUTS), choices=INPUTS)
+    parser.add_argument("--size", default="small", choices=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    dataset = _grid(*SIZES[args.size])
+    print(f"{'input':<15} {'read':<7} {'options':<45} {'time':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.inputs:
+            path = Path(tmp_dir) / f"{name}.nc"
+            INPUTS[name](dataset, path)
+            baseline = None
+            for input_name, mode, options in CASES:
+                if input_name != name:
+                    continue
+                wall_time = run_case(path, mode, options, args.repeat)
+                if baseline is None or mode != baseline[0]:
+                    baseline = (mode, wall_time)
+                print(
+                    f"{name:<15} {mode:<7} {str(options or 'default'):<45}"
+                    f" {wall_time:>7.3f} s {baseline[1] / wall_time:>7.2f}x",
+                    flush=True,
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Benchmarks every ncconvert converter on synthetic datasets.
+
+For each (dataset, size, converter) case this records the wall time of the
+conversion, the peak memory it used, and the total size of the files it wrote. Each
+case runs in a fresh process that opens the dataset from a netCDF file, like the CLI
+does, so peak memory is measured independently of other cases. Peak memory is the
+growth in max RSS during the conversion (including reading the data).
+
+Results can be saved as a named baseline and later runs compared against it:
+
+    python -m benchmarks.run --sizes small medium --save before
+    # ... make changes ...
+    python -m benchmarks.run --sizes small medium --compare before
+
+Converters are given by name, optionally with keyword arguments, e.g.,
+"to_parquet:engine=arrow" or "to_csv:chunk_size=100000".
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .datasets import DATASETS, SIZES
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+
+DEFAULT_CONVERTERS = [
+    "to_csv",
+    "to_faceted_dim_csv",
+    "to_csv_collection",
+    "to_parquet",
+    "to_parquet_collection",
+    "to_parquet_dataset",
+    "to_long_csv",
+    "to_long_parquet",
+    "to_arrow_ipc",
+    "to_arrow_ipc_collection",
+]
+
+
+def parse_converter(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """Splits e.g. 'to_parquet:engine=arrow,row_group_size=1000' into the converter
+    name and its keyword arguments."""
+    name, _, args = spec.partition(":")
+    kwargs: Dict[str, Any] = {}
+    for item in filter(None, args.split(",")):
+        key, _, value = item.partition("=")
+        kwargs[key] = int(value) if value.lstrip("-").isdigit() else value
+    return name, kwargs
+
+
+def max_rss_bytes() -> int:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _run_case(netcdf_file: Path, spec: str, output_dir: Path, queue: mp.Queue) -> None:
+    import xarray as xr
+
+    from ncconvert.cli import AVAILABLE_METHODS
+
+    name, kwargs = parse_converter(spec)
+    converter = AVAILABLE_METHODS[name]
+
+    with xr.open_dataset(netcdf_file) as dataset:
+        rss_before = max_rss_bytes()
+        start = time.perf_counter()
+        data_files, metadata_file = converter(
+            dataset, output_dir / netcdf_file.name, metadata=True, **kwargs
+        )
+        wall_time = time.perf_counter() - start
+        peak_rss = max_rss_bytes() - rss_before
+
+    outputs = list(data_files) if isinstance(data_files, tuple) else [data_files]
+    if metadata_file is not None:
+        outputs.append(metadata_file)
+    output_bytes = sum(Path(p).stat().st_size for p in outputs)
+
+    queue.put(
+        {"wall_time": wall_time, "peak_rss": peak_rss, "output_bytes": output_bytes}
+    )
+
+
+def run_case(netcdf_file: Path, spec: str, repeat: int) -> Dict[str, float]:
+    """Runs the case `repeat` times, each in a fresh process, and keeps the best
+    (lowest) wall time and peak memory to reduce noise."""
+    ctx = mp.get_context("spawn")
+    runs: List[Dict[str, float]] = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            queue = ctx.Queue()
+            process = ctx.Process(
+                target=_run_case, args=(netcdf_file, spec, Path(output_dir), queue)
+            )
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Benchmark case {spec} on {netcdf_file} failed")
+            runs.append(queue.get())
+    return {
+        "wall_time": min(r["wall_time"] for r in runs),
+        "peak_rss": min(r["peak_rss"] for r in runs),
+        "output_bytes": runs[0]["output_bytes"],
+    }
+
+
+def run(
+    datasets: List[str], sizes: List[str], converters: List[str], repeat: int
+) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as input_dir:
+        for (dataset_name, size), make_dataset in DATASETS.items():
+            if dataset_name not in datasets or size not in sizes:
+                continue
+            netcdf_file = Path(input_dir) / f"{dataset_name}.{size}.nc"
+            make_dataset().to_netcdf(netcdf_file)
+            for spec in converters:
+                case = f"{dataset_name}-{size}/{spec}"
+                results[case] = run_case(netcdf_file, spec, repeat)
+                print(_format_row(case, results[case]), flush=True)
+            netcdf_file.unlink()
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Prints each case's change relative to the baseline and returns the cases whose
+    wall time or peak memory grew by more than `threshold` (e.g., 0.1 = 10%)."""
+    regressions = []
+    print(f"\n{'case':<55} {'time':>8} {'memory':>8} {'bytes':>8}")
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        ratios = {
+            key: result[key] / baseline[case][key] if baseline[case][key] else 1.0
+            for key in ("wall_time", "peak_rss", "output_bytes")
+        }
+        flag = ""
+        if max(ratios["wall_time"], ratios["peak_rss"]) > 1 + threshold:
+            regressions.append(case)
+            flag = "  <-- regression"
+        print(
+            f"{case:<55} {ratios['wall_time']:>7.2f}x {ratios['peak_rss']:>7.2f}x"
+            f" {ratios['output_bytes']:>7.2f}x{flag}"
+        )
+    return regressions
+
+
+def _format_row(case: str, result: Dict[str, float]) -> str:
+    return (
+        f"{case:<55} {result['wall_time']:>9.3f} s"
+        f" {result['peak_rss'] / 2**20:>9.1f} MiB"
+        f" {result['output_bytes'] / 2**20:>9.1f} MiB"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark ncconvert converters on synthetic datasets."
+    )
+    dataset_names = sorted({name for name, _ in DATASETS})
+    parser.add_argument("--datasets", nargs="+", default=dataset_names)
+    parser.add_argument("--sizes", nargs="+", default=["small"], choices=SIZES)
+    parser.add_argument("--converters", nargs="+", default=DEFAULT_CONVERTERS)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--save", metavar="NAME", help="Save results as a baseline.")
+    parser.add_argument("--compare", metavar="NAME", help="Compare to a baseline.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative growth in time or memory that counts as a regression.",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<55} {'wall time':>11} {'peak memory':>13} {'output':>13}")
+    results = run(args.datasets, args.sizes, args.converters, args.repeat)
+
+    if args.save:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        document = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        baseline_path = BASELINES_DIR / f"{args.save}.json"
+        baseline_path.write_text(json.dumps(document, indent=4))
+        print(f"\nSaved results to {baseline_path}")
+
+    if args.compare:
+        baseline_path = BASELINES_DIR / f"{args.compare}.json"
+        baseline = json.loads(baseline_path.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than the threshold")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Benchmarks how long the ncconvert CLI takes to start.
+
+Workflow managers call the CLI once per file, so for small files the time spent
+importing python modules can dominate. Each case runs in a fresh interpreter, `repeat`
+times, and reports the best and median wall time along with which of the heavy
+dependencies (xarray, pandas, pyarrow, netCDF4) were imported:
+
+    python -m benchmarks.startup --repeat 20
+
+"python" is the interpreter's own startup time, "import" imports ncconvert.cli, "help"
+runs `ncconvert --help`, and "convert" converts one small netCDF file with to_csv.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HEAVY_MODULES = ["xarray", "pandas", "pyarrow", "netCDF4"]
+
+# Reports the heavy modules that were imported when the interpreter exits, even if the
+# CLI exits with SystemExit
+_REPORT = (
+    "import atexit, sys\n"
+    f"atexit.register(lambda: print(','.join(m for m in {HEAVY_MODULES!r}"
+    " if m in sys.modules), file=sys.stderr))\n"
+)
+
+CASES = {
+    "python": "pass",
+    "import": "import ncconvert.cli",
+    "help": "from ncconvert.cli import app\napp(['--help'])",
+    "convert": (
+        "from ncconvert.cli import app\n"
+        "app(['to_csv', '{input}', '--output-dir', '{output}'])"
+    ),
+}
+
+
+def run_case(code: str) -> tuple[float, str]:
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", _REPORT + code], capture_output=True, text=True
+    )
+    wall_time = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup case failed:\n{process.stderr}")
+    # The last line of stderr is the list of imported heavy modules
+    lines = process.stderr.strip().splitlines()
+    return wall_time, lines[-1] if lines else ""
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ncconvert CLI startup.")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=CASES)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    import xarray as xr
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = Path(tmp_dir) / "small.nc"
+        xr.Dataset(
+            {"temperature": ("time", np.arange(10.0))},
+            coords={"time": np.arange(10)},
+        ).to_netcdf(input_file)
+
+        print(f"{'case':<10} {'best':>9} {'median':>9}  imported")
+        results: Dict[str, List[float]] = {}
+        for case in args.cases:
+            code = CASES[case].format(input=input_file, output=Path(tmp_dir) / "out")
+            results[case] = []
+            for _ in range(args.repeat):
+                wall_time, imported = run_case(code)
+                results[case].append(wall_time)
+            print(
+                f"{case:<10} {min(results[case]):>7.3f} s"
+                f" {statistics.median(results[case]):>7.3f} s  {imported or '-'}",
+                flush=True,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,80 @@
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
 from ._version import __version__
-from .csv import to_csv, to_csv_collection
-from .parquet import to_parquet, to_parquet_collection
+
+# Converters are imported on first access so that importing ncconvert (e.g., to start
+# the CLI) doesn't import xarray, pandas and pyarrow until they are needed
+_LAZY_ATTRIBUTES = {
+    "to_arrow_ipc": "arrow",
+    "to_arrow_ipc_collection": "arrow",
+    "to_feather": "arrow",
+    "to_feather_collection": "arrow",
+    "to_csv": "csv",
+    "to_csv_collection": "csv",
+    "to_long_csv": "csv",
+    "compact_parquet_dataset": "parquet",
+    "to_long_parquet": "parquet",
+    "to_parquet": "parquet",
+    "to_parquet_collection": "parquet",
+    "to_parquet_dataset": "parquet",
+    "Profiler": "profiling",
+    "register": "registry",
+    "load_metadata": "utils",
+    "open_dataset": "utils",
+}
+
+# A literal list so that linters can check it; keep it in sync with _LAZY_ATTRIBUTES
+__all__ = [
+    "Profiler",
+    "__version__",
+    "compact_parquet_dataset",
+    "load_metadata",
+    "open_dataset",
+    "register",
+    "to_arrow_ipc",
+    "to_arrow_ipc_collection",
+    "to_csv",
+    "to_csv_collection",
+    "to_feather",
+    "to_feather_collection",
+    "to_long_csv",
+    "to_long_parquet",
+    "to_parquet",
+    "to_parquet_collection",
+    "to_parquet_dataset",
+]
+
+if TYPE_CHECKING:
+    from .arrow import (
+        to_arrow_ipc,
+        to_arrow_ipc_collection,
+        to_feather,
+        to_feather_collection,
+    )
+    from .csv import to_csv, to_csv_collection, to_long_csv
+    from .parquet import (
+        compact_parquet_dataset,
+        to_long_parquet,
+        to_parquet,
+        to_parquet_collection,
+        to_parquet_dataset,
+    )
+    from .profiling import Profiler
+    from .registry import register
+    from .utils import load_metadata, open_dataset
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
@@ -1,4 +1,4 @@
 if __name__ == "__main__":
-    from ncconvert.cli import app
+    from ncconvert.cli import main
 
-    app()
+    main()
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import xarray as xr
+
+from .planner import _estimate_group_memory
+from .profiling import _count_rows, _describe, _get_group_workers, _get_profiler
+from .storage import OutputPath, _as_path, _get_size, _makedirs, _open_output
+from .utils import (
+    _dump_metadata,
+    _get_dim_group_path,
+    _get_dimension_groups,
+    _is_chunked,
+    _iter_arrow_tables,
+    _iter_group_tables,
+    _map_concurrently,
+    _select_dataset,
+    _supports_arrow_engine,
+    _to_dataframe,
+    _to_dataframe_chunks,
+)
+
+
+def to_arrow_ipc(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[Path, Path | None]:
+    """Writes an xarray dataset to an Arrow IPC file (.arrow).
+
+    The output file will be indexed by the cartesian product of the dataset's indexes
+    (coordinate variables), with the same columns as `ncconvert.to_parquet`. Unlike
+    parquet, uncompressed IPC files can be memory-mapped and read without copying,
+    e.g., with `pyarrow.ipc.open_file(pyarrow.memory_map(path))`.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write.
+        filepath (str | Path): Where to write the file. This should be the path to a
+            file, not the path to a folder. The extension is replaced with ".arrow".
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        chunk_size (int | None, optional): If provided, the dataset is streamed to the
+            file in slices along its leading dimension, each written as record batches
+            of at most about this many rows. This bounds peak memory by the chunk size
+            instead of the size of the dataset. Datasets backed by dask arrays are
+            always streamed, one dask chunk of the leading dimension at a time unless
+            chunk_size is given. Defaults to None.
+        compression (str | None, optional): "lz4" or "zstd" to compress the file's
+            buffers. Compressed files can still be memory-mapped, but each buffer is
+            decompressed when it is read. Defaults to None (uncompressed).
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem (e.g., credentials) if `filepath` is a URL such as
+            "s3://bucket/name.arrow". Outputs are then streamed to the filesystem in
+            buffered blocks (e.g., as a multipart upload) without a local copy, and
+            URLs are returned instead of paths. Defaults to None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[Path, Path | None]: The path to the written Arrow IPC file and associated
+            metadata file.
+    """
+    return _to_ipc(dataset, filepath, ".arrow", metadata, **kwargs)
+
+
+def to_arrow_ipc_collection(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[tuple[Path, ...], Path | None]:
+    """Writes an xarray dataset to a collection of Arrow IPC files (.arrow).
+
+    Output files are split such that each file contains the cartesian product of each
+    unique pairing of coordinate dimensions, like `ncconvert.to_parquet_collection`.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write.
+        filepath (str | Path): The base path for where to write the files. This should
+            be the path to a file, not the path to a folder. This does not need to
+            include a file extension; one will be added if not provided.
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file next to the output file(s). Defaults to True.
+        chunk_size (int | None, optional): If provided, each file is streamed in record
+            batches of about this many rows. See `to_arrow_ipc`. Defaults to None.
+        compression (str | None, optional): "lz4" or "zstd". See `to_arrow_ipc`.
+            Defaults to None (uncompressed).
+        group_workers (int, optional): The number of threads to build and write the
+            files with concurrently. See `ncconvert.to_csv_collection`. Defaults to 1.
+        group_memory_budget (int | None, optional): With group_workers, the bytes of
+            memory the files being built and written at the same time may use. See
+            `ncconvert.to_csv_collection`. Defaults to None (no budget).
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_arrow_ipc`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[tuple[Path, ...], Path | None]: The paths to the written Arrow IPC files
+            and associated metadata file.
+    """
+    return _to_ipc_collection(dataset, filepath, "arrow", metadata, **kwargs)
+
+
+def to_feather(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[Path, Path | None]:
+    """Writes an xarray dataset to a Feather (v2) file (.feather).
+
+    Feather v2 is the Arrow IPC file format, so this writes the same file as
+    `to_arrow_ipc` with a ".feather" extension, which pandas.read_feather(),
+    pyarrow.feather.read_table(memory_map=True) and R's arrow package recognize. See
+    `to_arrow_ipc` for the arguments and return value.
+    """
+    return _to_ipc(dataset, filepath, ".feather", metadata, **kwargs)
+
+
+def to_feather_collection(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[tuple[Path, ...], Path | None]:
+    """Writes an xarray dataset to a collection of Feather (v2) files (.feather).
+
+    See `to_arrow_ipc_collection` for the arguments and return value.
+    """
+    return _to_ipc_collection(dataset, filepath, "feather", metadata, **kwargs)
+
+
+def _to_ipc(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    extension: str,
+    metadata: bool,
+    **kwargs: Any,
+) -> tuple[Path, Path | None]:
+    dataset = _select_dataset(dataset, kwargs)
+    chunk_size = kwargs.get("chunk_size")
+    options = _get_ipc_write_options(kwargs.get("compression"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+
+    dim_order = list(dataset.dims)
+    if _supports_arrow_engine(dataset, dim_order):
+        filepath = filepath.with_suffix(extension)
+        tables = _iter_arrow_tables(dataset, dim_order, chunk_size)
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            tables = _count_rows(tables, stage)
+            _write_ipc_chunks(sink, tables, chunk_size, options)
+    elif chunk_size or _is_chunked(dataset):
+        filepath, chunks = _to_dataframe_chunks(
+            dataset, filepath, extension, chunk_size
+        )
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_ipc_chunks(sink, chunks, chunk_size, options)
+    else:
+        with profiler.stage("to_dataframe") as stage:
+            filepath, df = _to_dataframe(dataset, filepath, extension)
+            _describe(stage, df)
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            _write_ipc_chunks(sink, iter([df]), chunk_size, options)
+    stage["bytes"] = _get_size(filepath)
+
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return filepath, metadata_path
+
+
+def _to_ipc_collection(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    extension: str,
+    metadata: bool,
+    **kwargs: Any,
+) -> tuple[tuple[Path, ...], Path | None]:
+    dataset = _select_dataset(dataset, kwargs)
+    chunk_size = kwargs.get("chunk_size")
+    options = _get_ipc_write_options(kwargs.get("compression"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+
+    def _write_group(
+        fpath: OutputPath, chunks: Iterator[pd.DataFrame | pa.Table]
+    ) -> OutputPath:
+        with profiler.stage("write", output=fpath.name) as stage, _open_output(
+            fpath
+        ) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_ipc_chunks(sink, chunks, chunk_size, options)
+        stage["bytes"] = _get_size(fpath)
+        return fpath
+
+    dim_groups = _get_dimension_groups(dataset)
+    chunked_groups = tuple(
+        (
+            _get_dim_group_path(filepath, dim_group, extension),
+            _iter_group_tables(dataset[variable_names], dim_group, chunk_size),
+        )
+        for dim_group, variable_names in dim_groups.items()
+    )
+    filepaths = _map_concurrently(
+        _write_group,
+        chunked_groups,
+        _get_group_workers(kwargs),
+        _estimate_group_memory(dataset, dim_groups, chunk_size),
+        kwargs.get("group_memory_budget"),
+    )
+
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return tuple(filepaths), metadata_path
+
+
+def _write_ipc_chunks(
+    filepath: Path | IO[bytes],
+    chunks: Iterator[pd.DataFrame | pa.Table],
+    chunk_size: int | None,
+    options: pa.ipc.IpcWriteOptions,
+) -> None:
+    """Appends each DataFrame (or pyarrow Table) chunk to a single Arrow IPC file as
+    record batches of at most `chunk_size` rows."""
+    writer: pa.ipc.RecordBatchFileWriter | None = None
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, pa.Table):
+                table = chunk
+            elif writer is None:
+                table = pa.Table.from_pandas(chunk)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema)
+            if writer is None:
+                writer = pa.ipc.new_file(filepath, table.schema, options=options)
+            writer.write_table(table, max_chunksize=chunk_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _get_ipc_write_options(compression: str | None) -> pa.ipc.IpcWriteOptions:
+    if compression not in (None, "lz4", "zstd"):
+        raise ValueError(
+            f"compression must be 'lz4', 'zstd' or None for Arrow IPC files, not"
+            f" '{compression}'"
+        )
+    return pa.ipc.IpcWriteOptions(compression=compression)
@@ -1,15 +1,34 @@
+import importlib.util
+import json
 import logging
+import queue
 import re
 import sys
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Protocol, Tuple, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import xarray as xr
 from typing_extensions import Annotated
 
 try:
-    import tqdm
     import typer
+
+    # Imported when used; only check that it is installed
+    if importlib.util.find_spec("tqdm") is None:
+        raise ImportError("No module named 'tqdm'")
 except ImportError:
     logging.exception("")
     print(
@@ -21,31 +40,33 @@ except ImportError:
     )
     sys.exit(1)
 
-from .csv import to_csv, to_csv_collection, to_faceted_dim_csv
-from .parquet import to_parquet, to_parquet_collection
-
-
-class Converter(Protocol):
-    def __call__(
-        self,
-        dataset: xr.Dataset,
-        filepath: Union[Path, str],
-        metadata: bool = False,
-        **kwargs: Optional[Any],
-    ) -> Tuple[Union[Tuple[Path, ...], Path], Optional[Path]]:
-        ...
-
-
-# Register to_* methods as options. For now this is a manual process
-AVAILABLE_METHODS: Dict[str, Converter] = {
-    to_csv.__name__: to_csv,
-    to_faceted_dim_csv.__name__: to_faceted_dim_csv,
-    to_csv_collection.__name__: to_csv_collection,
-    to_parquet.__name__: to_parquet,
-    to_parquet_collection.__name__: to_parquet_collection,
-}
+from .profiling import NULL_PROFILER, Profiler, _summarize
+from .registry import CONVERTERS, Converter  # noqa: F401
+from .shard import (
+    LOCK_DIRNAME,
+    FileLockedError,
+    _acquire_lock,
+    _get_lock_path,
+    _release_lock,
+    _shard_files,
+)
+
+# xarray, pandas, pyarrow and the converter modules are imported in the functions that
+# use them so that `ncconvert --help` and small conversions start quickly (see
+# benchmarks/startup.py)
+if TYPE_CHECKING:
+    import xarray as xr
+
+    from .watch import FileWatcher
+
+# Converters are registered in `ncconvert.registry`, including any that installed
+# packages declare under the "ncconvert.converters" entry point group
+AVAILABLE_METHODS: Mapping[str, Converter] = CONVERTERS
 _available_methods = list(AVAILABLE_METHODS)
 
+# How often `ncconvert watch` saves the manifest while files keep arriving, in seconds
+MANIFEST_SAVE_INTERVAL = 10.0
+
 
 def _expand_paths(filepaths: List[Path]) -> List[Path]:
     expanded_paths = []
@@ -65,6 +86,587 @@ def _expand_paths(filepaths: List[Path]) -> List[Path]:
     return expanded_paths
 
 
+ConversionResult = Tuple[Union[Tuple[Path, ...], Path], Optional[Path]]
+
+
+def _parse_chunks(value: Optional[str]) -> Union[None, str, int, Dict[str, Any]]:
+    # 'auto', a single chunk size for all dimensions, or e.g., 'time=1000,height=-1'
+    if value is None or value == "auto":
+        return value
+    if "=" not in value:
+        return int(value)
+    chunks: Dict[str, Any] = {}
+    for item in value.split(","):
+        dim, _, size = item.partition("=")
+        chunks[dim.strip()] = size.strip() if size.strip() == "auto" else int(size)
+    return chunks
+
+
+def _parse_isel(value: Optional[str]) -> Optional[Dict[str, Union[int, slice]]]:
+    # e.g., 'time=0:100,height=5' or 'time=::2'
+    if value is None:
+        return None
+    isel: Dict[str, Union[int, slice]] = {}
+    for item in value.split(","):
+        dim, _, index = item.partition("=")
+        if ":" in index:
+            parts = [int(p) if p.strip() else None for p in index.split(":")]
+            if len(parts) > 3:
+                raise ValueError(f"Could not parse index '{index}'")
+            isel[dim.strip()] = slice(*parts)
+        else:
+            isel[dim.strip()] = int(index)
+    return isel
+
+
+def _parse_shard(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    # e.g., '0/4' for the first of 4 shards
+    if value is None:
+        return None
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Could not parse shard '{value}', expected e.g. '0/4'")
+    if not 0 <= shard[0] < shard[1]:
+        raise ValueError(f"Shard index {shard[0]} is not in the range [0, {shard[1]})")
+    return shard
+
+
+def _parse_output_dir(output_dir: str, **local_only: bool) -> Any:
+    # Returns a Path, or for fsspec URLs a `_URL` that the converters stream outputs to.
+    # Manifests and lock files are only kept in local output dirs
+    from .storage import _as_path, _is_url
+
+    if _is_url(output_dir):
+        options = [f"--{name}" for name, used in local_only.items() if used]
+        if options:
+            raise typer.BadParameter(
+                f"{' and '.join(options)} need a local output dir",
+                param_hint="--output-dir",
+            )
+    return _as_path(output_dir)
+
+
+def _split_names(values: Optional[List[str]]) -> Optional[List[str]]:
+    # Names may be given as a comma-separated list, the option repeated, or both
+    if values is None:
+        return None
+    return [name.strip() for value in values for name in value.split(",") if name]
+
+
+def _parse_selection(
+    variables: Optional[List[str]],
+    drop_variables: Optional[List[str]],
+    time_start: Optional[str],
+    time_end: Optional[str],
+    isel: Optional[str],
+) -> Dict[str, Any]:
+    # The selection is applied when each file is opened rather than by the converter,
+    # so that memory estimates and prefetching only cover the selected data
+    try:
+        return {
+            "variables": _split_names(variables),
+            "drop_variables": _split_names(drop_variables),
+            "time_start": time_start,
+            "time_end": time_end,
+            "isel": _parse_isel(isel),
+        }
+    except ValueError:
+        raise typer.BadParameter(f"Could not parse '{isel}'", param_hint="--isel")
+
+
+def _parse_open_kwargs(
+    engine: Optional[str],
+    chunk_cache: Optional[str],
+    mmap: Optional[bool],
+    chunks: Optional[str],
+    decoding: Dict[str, bool],
+) -> Dict[str, Any]:
+    # Checked here rather than by open_dataset() so they fail once, not for every file
+    from .planner import _parse_size
+
+    if engine not in (None, "netcdf4", "h5netcdf", "scipy"):
+        raise typer.BadParameter(
+            f"'{engine}' is not one of 'netcdf4', 'h5netcdf' or 'scipy'",
+            param_hint="--engine",
+        )
+    if chunk_cache is not None and engine not in (None, "netcdf4"):
+        raise typer.BadParameter(
+            "is only supported by the netcdf4 engine", param_hint="--chunk-cache"
+        )
+    if mmap is not None and engine != "scipy":
+        raise typer.BadParameter(
+            "is only supported by the scipy engine", param_hint="--mmap"
+        )
+    open_kwargs: Dict[str, Any] = {**decoding}
+    if engine is not None:
+        open_kwargs["engine"] = engine
+    if mmap is not None:
+        open_kwargs["mmap"] = mmap
+    if chunks is not None:
+        try:
+            open_kwargs["chunks"] = _parse_chunks(chunks)
+        except ValueError:
+            raise typer.BadParameter(
+                f"Could not parse chunks '{chunks}'", param_hint="--chunks"
+            )
+    if chunk_cache is not None:
+        try:
+            open_kwargs["chunk_cache"] = _parse_size(chunk_cache)
+        except ValueError:
+            raise typer.BadParameter(
+                f"Could not parse chunk cache size '{chunk_cache}'",
+                param_hint="--chunk-cache",
+            )
+    return open_kwargs
+
+
+def _get_decoding(mask_and_scale: bool, decode_times: bool) -> Dict[str, bool]:
+    # Only the decoding that is turned off is passed on and recorded in manifests
+    decoding = {"mask_and_scale": mask_and_scale, "decode_times": decode_times}
+    return {k: v for k, v in decoding.items() if not v}
+
+
+def _get_manifest_options(
+    convert_kwargs: Dict[str, Any],
+    selection: Dict[str, Any],
+    decoding: Dict[str, bool],
+) -> Dict[str, Any]:
+    # The options recorded in the manifest, so changing any of them converts files
+    # again. `ncconvert` and `ncconvert watch` share manifests, so both must record
+    # the same options. Unset selections (and decoding that is on) are left out so
+    # manifests from before these options still match
+    return {
+        **convert_kwargs,
+        **{k: v for k, v in selection.items() if v is not None},
+        **decoding,
+    }
+
+
+def _open_dataset(
+    file: Path, open_kwargs: Dict[str, Any], selection: Dict[str, Any]
+) -> "xr.Dataset":
+    # Opens the file lazily and selects the part to convert, so only that part is
+    # read. Dropped variables aren't decoded at all
+    from .utils import _select_dataset, open_dataset
+
+    ds = open_dataset(
+        file, drop_variables=selection.get("drop_variables"), **open_kwargs
+    )
+    try:
+        selected = _select_dataset(ds, selection)
+    except BaseException:
+        ds.close()
+        raise
+    if selected is not ds:
+        selected.set_close(ds.close)
+    return selected
+
+
+def _convert_file(
+    method: str,
+    file: Path,
+    output_dir: Path,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+    **kwargs: Any,
+) -> Tuple[ConversionResult, Optional[Dict[str, Any]]]:
+    # Module-level so it can be pickled and sent to worker processes. Returns the
+    # conversion result and, if run_options["profile"] is True, the profiler's report
+    lock_dir = run_options.get("lock_dir")
+    lock_path = _acquire_lock(lock_dir, file) if lock_dir is not None else None
+    try:
+        profiler = Profiler(file) if run_options.get("profile") else None
+        with profiler or nullcontext():
+            with (profiler or NULL_PROFILER).stage("open") as stage:
+                ds = _open_dataset(file, open_kwargs, run_options.get("selection", {}))
+                stage["bytes"] = file.stat().st_size
+            with ds:
+                result = _convert_dataset(
+                    method, ds, output_dir / file.name, run_options, profiler, **kwargs
+                )
+    finally:
+        if lock_path is not None:
+            _release_lock(lock_path)
+    return result, profiler.report() if profiler is not None else None
+
+
+def _convert_dataset(
+    method: str,
+    ds: "xr.Dataset",
+    filepath: Path,
+    run_options: Dict[str, Any],
+    profiler: Optional[Profiler],
+    **kwargs: Any,
+) -> ConversionResult:
+    from .planner import MemoryLimitError, _format_size, plan_conversion
+
+    if run_options.get("memory_limit") is not None:
+        plan = plan_conversion(
+            ds,
+            method,
+            run_options["memory_limit"],
+            run_options["on_memory_limit"],
+        )
+        if plan["strategy"] == "refuse":
+            raise MemoryLimitError(
+                f"{method} is estimated to need {_format_size(plan['peak_bytes'])}"
+                " of memory, more than the limit of"
+                f" {_format_size(run_options['memory_limit'])}"
+            )
+        method, kwargs = plan["method"], {**plan["kwargs"], **kwargs}
+    if profiler is not None:
+        kwargs["profiler"] = profiler
+    return AVAILABLE_METHODS[method](dataset=ds, filepath=filepath, **kwargs)
+
+
+def _read_dataset(
+    method: str,
+    file: Path,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+) -> "xr.Dataset":
+    # Opens the file and decodes its data into memory, unless it is opened lazily with
+    # dask or is too large to convert in one go (it is then read while converting)
+    from .planner import plan_conversion
+
+    ds = _open_dataset(file, open_kwargs, run_options.get("selection", {}))
+    if "chunks" in open_kwargs:
+        return ds
+    memory_limit = run_options.get("memory_limit")
+    if memory_limit is not None:
+        plan = plan_conversion(ds, method, memory_limit, run_options["on_memory_limit"])
+        if plan["strategy"] != "default":
+            return ds
+    try:
+        return ds.load()
+    except BaseException:
+        ds.close()
+        raise
+
+
+def _prefetch_datasets(
+    method: str,
+    files: List[Path],
+    prefetch: int,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+) -> Iterator[Tuple[Path, Optional["xr.Dataset"], Optional[BaseException]]]:
+    """Yields (file, dataset, error) for each file in order, reading up to `prefetch`
+    files ahead in a background thread.
+
+    The reader takes one of `prefetch` slots before it reads a file, and the slot is
+    given back when the caller takes the dataset. So besides the dataset the caller is
+    converting, at most `prefetch` datasets are read (or being read) ahead of it. The
+    caller must close each dataset.
+    """
+    read_queue: "queue.Queue[Any]" = queue.Queue()
+    slots = threading.Semaphore(prefetch)
+    stop = threading.Event()
+    lock_dir = run_options.get("lock_dir")
+
+    def take_slot() -> bool:
+        # Waits for the caller to take a dataset, giving up if it has stopped reading
+        while not stop.is_set():
+            if slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def read() -> None:
+        for file in files:
+            if not take_slot():
+                return
+            # The file is locked before it is read, and unlocked by the caller once
+            # it has been converted (see `_release_prefetched_lock`)
+            lock_path = None
+            try:
+                if lock_dir is not None:
+                    lock_path = _acquire_lock(lock_dir, file)
+                item = (
+                    file,
+                    _read_dataset(method, file, open_kwargs, run_options),
+                    None,
+                )
+            except Exception as e:
+                if lock_path is not None:
+                    _release_lock(lock_path)
+                item = (file, None, e)
+            read_queue.put(item)
+
+    reader = threading.Thread(target=read, name="ncconvert-reader", daemon=True)
+    reader.start()
+    try:
+        for _ in files:
+            item = read_queue.get()
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+        # Close datasets that were read but never handed to the caller
+        while not read_queue.empty():
+            file, ds, _ = read_queue.get_nowait()
+            if ds is not None:
+                ds.close()
+                _release_prefetched_lock(file, run_options)
+
+
+def _release_prefetched_lock(file: Path, run_options: Dict[str, Any]) -> None:
+    if run_options.get("lock_dir") is not None:
+        _release_lock(_get_lock_path(run_options["lock_dir"], file))
+
+
+def _run_prefetched_conversions(
+    method: str,
+    files: List[Path],
+    output_dir: Path,
+    prefetch: int,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+    **kwargs: Any,
+) -> Iterator[
+    Tuple[
+        Path,
+        Optional[ConversionResult],
+        Optional[Dict[str, Any]],
+        Optional[BaseException],
+    ]
+]:
+    datasets = _prefetch_datasets(method, files, prefetch, open_kwargs, run_options)
+    while True:
+        # The "open" stage is the time spent waiting for the reader thread, i.e., the
+        # read latency that prefetching did not hide
+        profiler = Profiler() if run_options.get("profile") else None
+        result: Optional[ConversionResult] = None
+        with profiler or nullcontext():
+            try:
+                with (profiler or NULL_PROFILER).stage("open") as stage:
+                    file, ds, error = next(datasets)
+            except StopIteration:
+                return
+            if ds is not None:
+                if profiler is not None:
+                    profiler.file = str(file)
+                    stage["bytes"] = file.stat().st_size
+                try:
+                    with ds:
+                        result = _convert_dataset(
+                            method,
+                            ds,
+                            output_dir / file.name,
+                            run_options,
+                            profiler,
+                            **kwargs,
+                        )
+                except Exception as e:
+                    error = e
+                finally:
+                    _release_prefetched_lock(file, run_options)
+        if error is not None:
+            yield file, None, None, error
+        else:
+            yield file, result, profiler.report() if profiler else None, None
+
+
+def _run_conversions(
+    method: str,
+    files: List[Path],
+    output_dir: Path,
+    workers: int,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+    prefetch: int = 0,
+    **kwargs: Any,
+) -> Iterator[
+    Tuple[
+        Path,
+        Optional[ConversionResult],
+        Optional[Dict[str, Any]],
+        Optional[BaseException],
+    ]
+]:
+    """Yields (file, result, profile report, error) for each file as soon as its
+    conversion finishes.
+
+    Errors are captured rather than raised so one bad file does not stop the batch.
+    With more than one worker, results are yielded in order of completion. With one
+    worker and `prefetch` > 0, the next files are read in a background thread while
+    the current one is converted. Extra keyword arguments are passed to the converter.
+    """
+    if workers <= 1 and prefetch > 0:
+        yield from _run_prefetched_conversions(
+            method, files, output_dir, prefetch, open_kwargs, run_options, **kwargs
+        )
+        return
+
+    if workers <= 1:
+        for file in files:
+            try:
+                result, report = _convert_file(
+                    method, file, output_dir, open_kwargs, run_options, **kwargs
+                )
+                yield file, result, report, None
+            except Exception as e:
+                yield file, None, None, e
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _convert_file,
+                method,
+                file,
+                output_dir,
+                open_kwargs,
+                run_options,
+                **kwargs,
+            ): file
+            for file in files
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], *future.result(), None
+            except Exception as e:
+                yield futures[future], None, None, e
+
+
+def _warm_up(method: str) -> None:
+    # Runs once in each worker process of `ncconvert watch` so the first file a worker
+    # converts doesn't also pay for importing xarray and the converter's module
+    import xarray  # noqa: F401
+
+    AVAILABLE_METHODS[method]
+
+
+def _watch_conversions(
+    method: str,
+    watcher: "FileWatcher",
+    output_dir: Path,
+    workers: int,
+    open_kwargs: Dict[str, Any],
+    run_options: Dict[str, Any],
+    skip: Optional[Callable[[Path], bool]] = None,
+    max_files: Optional[int] = None,
+    stop: Optional[threading.Event] = None,
+    idle: Optional[Callable[[], None]] = None,
+    **kwargs: Any,
+) -> Iterator[
+    Tuple[
+        Path,
+        Optional[ConversionResult],
+        Optional[Dict[str, Any]],
+        Optional[BaseException],
+    ]
+]:
+    """Yields (file, result, profile report, error) for each file the watcher reports,
+    as soon as its conversion finishes, until `stop` is set or `max_files` files have
+    been converted.
+
+    Files are converted in the order they settle, skipping those for which `skip`
+    returns True. With one worker, files are converted in this process; otherwise the
+    same worker processes are kept for every file, and at most two files per worker are
+    handed to them at a time so that a burst of files queues here, where files that
+    change again are not converted twice. `idle` is called whenever no files are
+    waiting or being converted.
+    """
+    from collections import deque
+
+    waiting: "deque[Path]" = deque()
+    submitted = 0
+
+    def accepting() -> bool:
+        return not (stop is not None and stop.is_set()) and (
+            max_files is None or submitted < max_files
+        )
+
+    def collect(timeout: float, busy: bool = False) -> None:
+        for file in watcher.poll(timeout):
+            if file not in waiting and not (skip is not None and skip(file)):
+                waiting.append(file)
+        if idle is not None and not (waiting or busy):
+            idle()
+
+    if workers <= 1:
+        while accepting():
+            collect(0.0 if waiting else watcher.poll_interval)
+            if waiting and accepting():
+                file = waiting.popleft()
+                submitted += 1
+                try:
+                    result, report = _convert_file(
+                        method, file, output_dir, open_kwargs, run_options, **kwargs
+                    )
+                    yield file, result, report, None
+                except Exception as e:
+                    yield file, None, None, e
+        return
+
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    running: Dict["Future[Any]", Path] = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_warm_up, initargs=(method,)
+    ) as executor:
+        try:
+            while accepting() or running:
+                if accepting():
+                    collect(
+                        0.05 if running or waiting else watcher.poll_interval,
+                        busy=bool(running),
+                    )
+                else:
+                    time.sleep(0.05)
+                while waiting and accepting() and len(running) < 2 * workers:
+                    file = waiting.popleft()
+                    submitted += 1
+                    future = executor.submit(
+                        _convert_file,
+                        method,
+                        file,
+                        output_dir,
+                        open_kwargs,
+                        run_options,
+                        **kwargs,
+                    )
+                    running[future] = file
+                for future in [f for f in running if f.done()]:
+                    file = running.pop(future)
+                    try:
+                        yield file, *future.result(), None
+                    except Exception as e:
+                        yield file, None, None, e
+        finally:
+            for future in running:
+                future.cancel()
+
+
+def _print_plans(
+    method: str,
+    files: List[Path],
+    open_kwargs: Dict[str, Any],
+    selection: Dict[str, Any],
+    memory_limit: Optional[int],
+    on_memory_limit: str,
+) -> None:
+    from .planner import _format_size, plan_conversion
+
+    typer.echo(
+        f"{'file':<40} {'method':<22} {'strategy':<9} {'rows':>13} {'columns':>8}"
+        f" {'memory':>10}"
+    )
+    for file in files:
+        with _open_dataset(file, open_kwargs, selection) as ds:
+            plan = plan_conversion(ds, method, memory_limit, on_memory_limit)
+        typer.echo(
+            f"{file.name:<40} {plan['method']:<22} {plan['strategy']:<9}"
+            f" {plan['rows']:>13,} {plan['columns']:>8,}"
+            f" {_format_size(plan['peak_bytes']):>10}"
+        )
+
+
 app = typer.Typer(no_args_is_help=True)
 
 
@@ -87,13 +689,15 @@ def ncconvert(
         ),
     ],
     output_dir: Annotated[
-        Path,
+        str,
         typer.Option(
-            dir_okay=True,
-            file_okay=False,
-            help="The output dir where the converted file(s) should be saved.",
+            help=(
+                "The output dir where the converted file(s) should be saved. This can"
+                " also be an fsspec URL, e.g., 's3://bucket/folder', which outputs are"
+                " streamed to without a local copy."
+            ),
         ),
-    ] = Path("./data"),
+    ] = "./data",
     metadata: Annotated[
         bool,
         typer.Option(help="Write dataset metadata to a .json file"),
@@ -102,26 +706,852 @@ def ncconvert(
         bool,
         typer.Option(help="Run in verbose mode."),
     ] = False,
+    workers: Annotated[
+        int,
+        typer.Option(
+            min=1,
+            help="The number of worker processes to convert files with in parallel.",
+        ),
+    ] = 1,
+    prefetch: Annotated[
+        int,
+        typer.Option(
+            min=0,
+            help=(
+                "With one worker, read and decode up to this many files ahead in a"
+                " background thread while the current file is converted and written."
+                " Memory grows by up to this many decoded files. Not supported with"
+                " --workers > 1."
+            ),
+        ),
+    ] = 0,
+    group_workers: Annotated[
+        int,
+        typer.Option(
+            min=1,
+            help=(
+                "For *_collection methods, the number of threads to build and write"
+                " each file's dimension groups with concurrently."
+            ),
+        ),
+    ] = 1,
+    group_memory_budget: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "With --group-workers, the memory the dimension groups being written at"
+                " the same time may use, e.g., '2GB'. Defaults to --memory-limit."
+            ),
+        ),
+    ] = None,
+    shard: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "Only convert this node's share of the files, e.g., '0/4' for the first"
+                " of 4 shards (such as $SLURM_ARRAY_TASK_ID/$SLURM_ARRAY_TASK_COUNT with"
+                " --array=0-3). Every node must be given the same files; run"
+                " 'ncconvert merge' afterwards to combine their manifests."
+            ),
+        ),
+    ] = None,
+    shard_by: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "How to assign files to shards: 'hash' (of each file's name) or 'size'"
+                " (balances the bytes per shard)."
+            ),
+        ),
+    ] = "hash",
+    lock: Annotated[
+        Optional[bool],
+        typer.Option(
+            help=(
+                "Take a lock file in the output dir for each input while it is"
+                " converted, and skip inputs another process holds the lock of."
+                " Defaults to on with --shard."
+            ),
+        ),
+    ] = None,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Skip input files that were already converted with the same method and"
+                " options and whose outputs still exist, as recorded in a manifest file"
+                " in the output dir."
+            ),
+        ),
+    ] = False,
+    content_hash: Annotated[
+        bool,
+        typer.Option(
+            "--hash",
+            help=(
+                "With --incremental, also record a sha256 hash of each input so inputs"
+                " that were touched or copied but not changed are still skipped."
+            ),
+        ),
+    ] = False,
+    shared_metadata: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Write metadata shared by files with the same structure once to a"
+                " _schema.<hash>.json file in the output dir, and only the values that"
+                " differ to each file's .json."
+            ),
+        ),
+    ] = False,
+    json_backend: Annotated[
+        str,
+        typer.Option(help="The json library to write metadata with: json or orjson."),
+    ] = "json",
+    compact_json: Annotated[
+        bool,
+        typer.Option(help="Write metadata json without indentation."),
+    ] = False,
+    csv_engine: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "How to format csv outputs: pandas, or pyarrow (much faster; floats"
+                " are written without a trailing '.0')."
+            ),
+        ),
+    ] = "pandas",
+    compression: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "Compress outputs as they are written: gzip or zstd (csv, parquet), or"
+                " lz4 or zstd (arrow ipc, feather). csv files get a .gz or .zst"
+                " extension; other formats compress inside the file."
+            ),
+        ),
+    ] = None,
+    compact: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Write parquet outputs with smaller dtypes (e.g., nullable integers for"
+                " integer variables with a _FillValue) and per-column encodings."
+            ),
+        ),
+    ] = False,
+    variables: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            help=(
+                "Only convert these data variables, e.g., 'temp,rh'. Data that isn't"
+                " selected is never read."
+            ),
+        ),
+    ] = None,
+    drop_variables: Annotated[
+        Optional[List[str]],
+        typer.Option(help="Leave these variables out, e.g., 'qc_temp,qc_rh'."),
+    ] = None,
+    time_start: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Only convert time steps from this time, e.g., '2022-04-05'."
+        ),
+    ] = None,
+    time_end: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Only convert time steps up to this time (inclusive), e.g., '2022-04-05T12'."
+        ),
+    ] = None,
+    isel: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "Only convert these positions along dimensions, e.g.,"
+                " 'height=0:10,time=::2'. A single index keeps its dimension."
+            ),
+        ),
+    ] = None,
+    engine: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "The library to read inputs with: netcdf4, h5netcdf (netCDF4 files"
+                " only) or scipy (netCDF3 files only). Defaults to xarray's default."
+            ),
+        ),
+    ] = None,
+    chunk_cache: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "The HDF5 chunk cache size of each variable with the netcdf4 engine,"
+                " e.g., '256MiB'. Raise it when compressed inputs are converted in"
+                " chunks (--chunks, --memory-limit) and their own chunks don't fit in"
+                " the default 64 MiB, so each chunk is only decompressed once."
+            ),
+        ),
+    ] = None,
+    mmap: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="With the scipy engine, whether to memory-map netCDF3 inputs.",
+        ),
+    ] = None,
+    mask_and_scale: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Replace _FillValue with NaN and apply scale_factor and add_offset."
+                " --no-mask-and-scale writes packed variables as stored, which is"
+                " faster and smaller; their metadata keeps the attributes to unpack"
+                " them with."
+            ),
+        ),
+    ] = True,
+    decode_times: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Decode time variables to datetimes. --no-decode-times writes them as"
+                " stored, e.g., seconds since the time in their units."
+            ),
+        ),
+    ] = True,
+    chunks: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "Open files lazily with dask using these chunks, e.g., 'auto' or"
+                " 'time=1000'. Data is then converted and written one dask chunk at a"
+                " time so files larger than memory can be converted."
+            ),
+        ),
+    ] = None,
+    profile: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help=(
+                "Record the wall time, peak memory, rows, columns and bytes of each"
+                " stage of each file's conversion, write them as a json report to this"
+                " path and print a summary of the slowest files and stages. The groups"
+                " of *_collection methods are written one at a time (--group-workers"
+                " is ignored) so each stage's peak memory is its own. Peak memory"
+                " counts Python and pyarrow allocations, but not those of other"
+                " native libraries (e.g., netCDF)."
+            ),
+        ),
+    ] = None,
+    dry_run: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Print the estimated rows, columns and peak memory of converting each"
+                " file, and how it would be converted, without converting anything."
+            ),
+        ),
+    ] = False,
+    memory_limit: Annotated[
+        Optional[str],
+        typer.Option(
+            help=(
+                "The memory each conversion may use, e.g., '4GB' or '512MiB'. The"
+                " memory needed is estimated from the dimension sizes and dtypes"
+                " before any data is read; see --on-memory-limit."
+            ),
+        ),
+    ] = None,
+    on_memory_limit: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "What to do with files estimated to need more than --memory-limit:"
+                " 'refuse' to convert them, 'chunk' to convert them in chunks that fit,"
+                " or 'split' to write one file per dimension group (e.g.,"
+                " to_csv_collection instead of to_csv), chunked if still needed."
+            ),
+        ),
+    ] = "chunk",
 ):
-    """Convert netCDF files to another format."""
-    convert_function = AVAILABLE_METHODS[method]
+    """Convert netCDF files to another format.
+
+    Run `ncconvert watch --help` to convert files as they arrive in a directory instead,
+    and `ncconvert merge --help` to combine the manifests of a sharded run (--shard).
+    """
+    if method not in AVAILABLE_METHODS:
+        raise typer.BadParameter(
+            f"'{method}' is not one of {_available_methods}", param_hint="METHOD"
+        )
+    if prefetch > 0 and workers > 1:
+        raise typer.BadParameter(
+            "can only be used with one worker (--workers 1)", param_hint="--prefetch"
+        )
+
+    output_folder = _parse_output_dir(
+        output_dir, incremental=incremental, lock=bool(lock)
+    )
 
-    file_iterator = tqdm.tqdm(files) if verbose else files
+    try:
+        shard_index = _parse_shard(shard)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--shard")
+    if shard_index is not None:
+        try:
+            files = _shard_files(files, *shard_index, by=shard_by)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--shard-by")
 
-    for file in file_iterator:
-        ds = xr.open_dataset(file)
-        output_filepath = output_dir / file.name
-        output_data_files, metadata_file = convert_function(
-            dataset=ds,
-            filepath=output_filepath,
-            metadata=metadata,
+    convert_kwargs: Dict[str, Any] = {
+        "metadata": metadata,
+        "shared_metadata": shared_metadata,
+        "json_backend": json_backend,
+        "compact_json": compact_json,
+        "csv_engine": csv_engine,
+        "compression": compression,
+        "compact": compact,
+    }
+
+    selection = _parse_selection(variables, drop_variables, time_start, time_end, isel)
+    decoding = _get_decoding(mask_and_scale, decode_times)
+    open_kwargs = _parse_open_kwargs(engine, chunk_cache, mmap, chunks, decoding)
+    manifest_options = _get_manifest_options(convert_kwargs, selection, decoding)
+
+    if incremental:
+        from .manifest import Manifest, _flatten_outputs
+
+    manifest = Manifest.load(output_folder, shard_index) if incremental else None
+    if manifest is not None:
+        n_files = len(files)
+        files = [
+            file
+            for file in files
+            if not manifest.is_current(file, method, manifest_options, content_hash)
+        ]
+        if verbose and len(files) < n_files:
+            typer.echo(f"Skipping {n_files - len(files)} up-to-date file(s)")
+
+    if on_memory_limit not in ("refuse", "chunk", "split"):
+        raise typer.BadParameter(
+            f"'{on_memory_limit}' is not one of 'refuse', 'chunk' or 'split'",
+            param_hint="--on-memory-limit",
+        )
+
+    from .planner import _parse_size
+
+    try:
+        memory_limit_bytes = _parse_size(memory_limit) if memory_limit else None
+    except ValueError:
+        raise typer.BadParameter(
+            f"Could not parse memory limit '{memory_limit}'",
+            param_hint="--memory-limit",
+        )
+    try:
+        group_memory_budget_bytes = (
+            _parse_size(group_memory_budget)
+            if group_memory_budget
+            else memory_limit_bytes
+        )
+    except ValueError:
+        raise typer.BadParameter(
+            f"Could not parse memory budget '{group_memory_budget}'",
+            param_hint="--group-memory-budget",
         )
-        if verbose and output_data_files:
-            typer.echo(f"Wrote data to {output_data_files}")
-        if verbose and metadata:
-            typer.echo(f"Wrote metadata to {metadata_file}")
+
+    if dry_run:
+        _print_plans(
+            method, files, open_kwargs, selection, memory_limit_bytes, on_memory_limit
+        )
+        return
+
+    run_options: Dict[str, Any] = {
+        "selection": selection,
+        "profile": profile is not None,
+        "memory_limit": memory_limit_bytes,
+        "on_memory_limit": on_memory_limit,
+        "lock_dir": (
+            output_folder / LOCK_DIRNAME
+            if (
+                lock
+                if lock is not None
+                else shard_index is not None and isinstance(output_folder, Path)
+            )
+            else None
+        ),
+    }
+    results = _run_conversions(
+        method,
+        files,
+        output_folder,
+        workers,
+        open_kwargs,
+        run_options,
+        prefetch=prefetch,
+        # Not part of convert_kwargs since they don't change the outputs
+        group_workers=group_workers,
+        group_memory_budget=group_memory_budget_bytes,
+        **convert_kwargs,
+    )
+    if verbose:
+        import tqdm
+
+    result_iterator = tqdm.tqdm(results, total=len(files)) if verbose else results
+
+    failures: List[Tuple[Path, BaseException]] = []
+    reports: List[Dict[str, Any]] = []
+    locked = 0
+    try:
+        for file, result, report, error in result_iterator:
+            if isinstance(error, FileLockedError):
+                locked += 1
+                continue
+            if error is not None:
+                failures.append((file, error))
+                continue
+            if report is not None:
+                reports.append(report)
+            output_data_files, metadata_file = result  # type: ignore
+            if verbose and output_data_files:
+                typer.echo(f"Wrote data to {output_data_files}")
+            if verbose and metadata:
+                typer.echo(f"Wrote metadata to {metadata_file}")
+            if manifest is not None:
+                outputs = _flatten_outputs(result)  # type: ignore
+                manifest.record(file, method, manifest_options, outputs, content_hash)
+    finally:
+        # Save progress even if the run is interrupted part-way through
+        if manifest is not None:
+            manifest.save()
+
+    if verbose and locked:
+        typer.echo(f"Skipped {locked} file(s) being converted by another process")
+
+    if profile is not None:
+        profile.parent.mkdir(parents=True, exist_ok=True)
+        profile.write_text(json.dumps({"files": reports}, indent=4))
+        typer.echo(_summarize(reports))
+
+    if failures:
+        typer.echo(f"Failed to convert {len(failures)} file(s):", err=True)
+        for file, error in failures:
+            typer.echo(f"  {file}: {type(error).__name__}: {error}", err=True)
+        raise typer.Exit(code=1)
 
     if verbose:
         typer.echo("Done!")
 
     return
+
+
+watch_app = typer.Typer(no_args_is_help=True)
+
+
+@watch_app.command(no_args_is_help=True)
+def watch(
+    method: Annotated[
+        str,
+        typer.Argument(
+            help=f"How to convert the netCDF file(s). Options are: {_available_methods}",
+        ),
+    ],
+    directories: Annotated[
+        List[Path],
+        typer.Argument(
+            ...,
+            exists=True,
+            file_okay=False,
+            resolve_path=True,
+            help="The directories to watch for netCDF files (not their subdirectories).",
+        ),
+    ],
+    output_dir: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "The output dir where the converted file(s) should be saved. This can"
+                " also be an fsspec URL, e.g., 's3://bucket/folder', which outputs are"
+                " streamed to without a local copy."
+            ),
+        ),
+    ] = "./data",
+    pattern: Annotated[
+        str,
+        typer.Option(help="Only convert files whose names match this glob pattern."),
+    ] = "*.nc",
+    settle: Annotated[
+        float,
+        typer.Option(
+            min=0,
+            help=(
+                "Only convert a file once its size and modification time haven't"
+                " changed for this many seconds, so files that are still being written"
+                " are not converted."
+            ),
+        ),
+    ] = 2.0,
+    poll_interval: Annotated[
+        float,
+        typer.Option(
+            min=0.01,
+            help="How often to list the directories when polling, in seconds.",
+        ),
+    ] = 1.0,
+    polling: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "List the directories every --poll-interval seconds instead of using"
+                " inotify, e.g., for network filesystems that don't report changes."
+                " Used automatically where inotify isn't available."
+            ),
+        ),
+    ] = False,
+    existing: Annotated[
+        bool,
+        typer.Option(
+            help="Also convert the files that are in the directories at startup."
+        ),
+    ] = True,
+    workers: Annotated[
+        int,
+        typer.Option(
+            min=1,
+            help=(
+                "The number of worker processes to convert files with in parallel. The"
+                " workers are started once and reused for every file."
+            ),
+        ),
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Skip files that were already converted with the same method and"
+                " options, as recorded in a manifest file in the output dir, e.g., by"
+                " an earlier run of ncconvert watch."
+            ),
+        ),
+    ] = False,
+    metadata: Annotated[
+        bool,
+        typer.Option(help="Write dataset metadata to a .json file"),
+    ] = True,
+    csv_engine: Annotated[
+        str,
+        typer.Option(help="How to format csv outputs: pandas or pyarrow."),
+    ] = "pandas",
+    compression: Annotated[
+        Optional[str],
+        typer.Option(help="Compress outputs as they are written, e.g., gzip or zstd."),
+    ] = None,
+    compact: Annotated[
+        bool,
+        typer.Option(help="Write parquet outputs with smaller dtypes and encodings."),
+    ] = False,
+    shared_metadata: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "Write metadata shared by files with the same structure once to a"
+                " _schema.<hash>.json file in the output dir."
+            ),
+        ),
+    ] = False,
+    json_backend: Annotated[
+        str,
+        typer.Option(help="The json library to write metadata with: json or orjson."),
+    ] = "json",
+    compact_json: Annotated[
+        bool,
+        typer.Option(help="Write metadata json without indentation."),
+    ] = False,
+    variables: Annotated[
+        Optional[List[str]],
+        typer.Option(help="Only convert these data variables, e.g., 'temp,rh'."),
+    ] = None,
+    drop_variables: Annotated[
+        Optional[List[str]],
+        typer.Option(help="Leave these variables out, e.g., 'qc_temp,qc_rh'."),
+    ] = None,
+    time_start: Annotated[
+        Optional[str],
+        typer.Option(help="Only convert time steps from this time."),
+    ] = None,
+    time_end: Annotated[
+        Optional[str],
+        typer.Option(help="Only convert time steps up to this time (inclusive)."),
+    ] = None,
+    isel: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Only convert these positions along dimensions, e.g., 'height=0:10'."
+        ),
+    ] = None,
+    engine: Annotated[
+        Optional[str],
+        typer.Option(
+            help="The library to read inputs with: netcdf4, h5netcdf or scipy."
+        ),
+    ] = None,
+    chunk_cache: Annotated[
+        Optional[str],
+        typer.Option(
+            help="The HDF5 chunk cache size of each variable with the netcdf4 engine."
+        ),
+    ] = None,
+    mmap: Annotated[
+        Optional[bool],
+        typer.Option(help="With the scipy engine, whether to memory-map inputs."),
+    ] = None,
+    mask_and_scale: Annotated[
+        bool,
+        typer.Option(
+            help="Replace _FillValue with NaN and apply scale_factor and add_offset."
+        ),
+    ] = True,
+    decode_times: Annotated[
+        bool,
+        typer.Option(help="Decode time variables to datetimes."),
+    ] = True,
+    chunks: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Open files lazily with dask using these chunks, e.g., 'time=1000'."
+        ),
+    ] = None,
+    memory_limit: Annotated[
+        Optional[str],
+        typer.Option(help="The memory each conversion may use, e.g., '4GB'."),
+    ] = None,
+    on_memory_limit: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "What to do with files estimated to need more than --memory-limit:"
+                " 'refuse', 'chunk' or 'split'."
+            ),
+        ),
+    ] = "chunk",
+    max_files: Annotated[
+        Optional[int],
+        typer.Option(
+            min=1,
+            help=(
+                "Exit after converting this many files, e.g., to have a service"
+                " manager restart the watcher periodically."
+            ),
+        ),
+    ] = None,
+    verbose: Annotated[
+        bool,
+        typer.Option(help="Run in verbose mode."),
+    ] = False,
+):
+    """Watch directories and convert netCDF files as they arrive.
+
+    Runs until interrupted (Ctrl+C or SIGTERM). Unlike running ncconvert on a schedule,
+    python and the converters are only started once, and the directories don't have to
+    be listed again to find new files. Files are read, selected and converted with the
+    same options as `ncconvert`, and --incremental shares its manifest.
+    """
+    if method not in AVAILABLE_METHODS:
+        raise typer.BadParameter(
+            f"'{method}' is not one of {_available_methods}", param_hint="METHOD"
+        )
+    if on_memory_limit not in ("refuse", "chunk", "split"):
+        raise typer.BadParameter(
+            f"'{on_memory_limit}' is not one of 'refuse', 'chunk' or 'split'",
+            param_hint="--on-memory-limit",
+        )
+
+    from .planner import _parse_size
+
+    try:
+        memory_limit_bytes = _parse_size(memory_limit) if memory_limit else None
+    except ValueError:
+        raise typer.BadParameter(
+            f"Could not parse memory limit '{memory_limit}'",
+            param_hint="--memory-limit",
+        )
+
+    output_folder = _parse_output_dir(output_dir, incremental=incremental)
+
+    convert_kwargs: Dict[str, Any] = {
+        "metadata": metadata,
+        "shared_metadata": shared_metadata,
+        "json_backend": json_backend,
+        "compact_json": compact_json,
+        "csv_engine": csv_engine,
+        "compression": compression,
+        "compact": compact,
+    }
+    selection = _parse_selection(variables, drop_variables, time_start, time_end, isel)
+    decoding = _get_decoding(mask_and_scale, decode_times)
+    open_kwargs = _parse_open_kwargs(engine, chunk_cache, mmap, chunks, decoding)
+    manifest_options = _get_manifest_options(convert_kwargs, selection, decoding)
+
+    if incremental:
+        from .manifest import Manifest, _flatten_outputs
+
+    manifest = Manifest.load(output_folder) if incremental else None
+    run_options: Dict[str, Any] = {
+        "selection": selection,
+        "memory_limit": memory_limit_bytes,
+        "on_memory_limit": on_memory_limit,
+    }
+
+    # Saving rewrites the whole manifest, so while files keep arriving it is saved at
+    # most every MANIFEST_SAVE_INTERVAL seconds, and otherwise once the watcher is idle
+    unsaved = 0
+    last_save = time.monotonic()
+
+    def save_manifest(force: bool = False) -> None:
+        nonlocal unsaved, last_save
+        if manifest is None or not unsaved:
+            return
+        if force or time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+            manifest.save()
+            unsaved = 0
+            last_save = time.monotonic()
+
+    # Stop taking new files on SIGTERM (e.g., from a service manager) and exit once the
+    # files being converted are done
+    import signal
+
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    from .watch import FileWatcher
+
+    failures = 0
+    with FileWatcher(
+        directories,
+        pattern=pattern,
+        settle=settle,
+        poll_interval=poll_interval,
+        polling=polling,
+        existing=existing,
+    ) as watcher:
+        if verbose:
+            how = "polling" if watcher.polling else "inotify"
+            typer.echo(f"Watching {len(directories)} directory(s) with {how}")
+        results = _watch_conversions(
+            method,
+            watcher,
+            output_folder,
+            workers,
+            open_kwargs,
+            run_options,
+            skip=(
+                (lambda f: manifest.is_current(f, method, manifest_options))
+                if manifest is not None
+                else None
+            ),
+            max_files=max_files,
+            stop=stop,
+            idle=lambda: save_manifest(force=True),
+            **convert_kwargs,
+        )
+        try:
+            for file, result, _, error in results:
+                if error is not None:
+                    failures += 1
+                    typer.echo(
+                        f"Failed to convert {file}: {type(error).__name__}: {error}",
+                        err=True,
+                    )
+                    continue
+                if verbose:
+                    typer.echo(f"Converted {file.name} to {result[0]}")  # type: ignore
+                if manifest is not None:
+                    outputs = _flatten_outputs(result)  # type: ignore
+                    manifest.record(file, method, manifest_options, outputs)
+                    unsaved += 1
+                    save_manifest()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            save_manifest(force=True)
+
+    if failures:
+        raise typer.Exit(code=1)
+
+
+merge_app = typer.Typer(no_args_is_help=True)
+
+
+@merge_app.command(no_args_is_help=True)
+def merge(
+    output_dir: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            file_okay=False,
+            help="The output dir that the shards of a sharded run (--shard) wrote to.",
+        ),
+    ],
+    profiles: Annotated[
+        Optional[List[Path]],
+        typer.Option(
+            "--profiles",
+            help=(
+                "Profile reports written by the shards (with --profile) to combine,"
+                " e.g., 'profiles/shard-*.json'."
+            ),
+        ),
+    ] = None,
+    profile: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Where to write the combined profile report.",
+        ),
+    ] = None,
+    verbose: Annotated[
+        bool,
+        typer.Option(help="Run in verbose mode."),
+    ] = False,
+):
+    """Combine the manifests and profiles of a sharded run.
+
+    Each shard of `ncconvert --shard i/N --incremental` records the files it converted
+    in its own manifest in the output dir. This merges them into the output dir's
+    manifest so later runs, sharded or not, skip those files.
+    """
+    from .manifest import merge_manifests
+
+    manifest, shard_paths = merge_manifests(output_dir)
+    if verbose:
+        typer.echo(
+            f"Merged {len(shard_paths)} shard manifest(s) into {manifest.path}"
+            f" ({len(manifest.entries)} file(s))"
+        )
+
+    if profiles:
+        reports = [
+            report
+            for path in _expand_paths(profiles)
+            for report in json.loads(path.read_text())["files"]
+        ]
+        if profile is not None:
+            profile.parent.mkdir(parents=True, exist_ok=True)
+            profile.write_text(json.dumps({"files": reports}, indent=4))
+        typer.echo(_summarize(reports))
+
+
+# The commands other than converting files, which are run as `ncconvert <name> ...`
+_SUBCOMMANDS = {"watch": watch_app, "merge": merge_app}
+
+
+def main() -> None:
+    """The ncconvert console script. `ncconvert watch ...` and `ncconvert merge ...` run
+    those commands, and anything else converts files, so `ncconvert METHOD FILES...`
+    keeps working."""
+    name = sys.argv[1] if len(sys.argv) > 1 else None
+    if name in _SUBCOMMANDS:
+        _SUBCOMMANDS[name](args=sys.argv[2:], prog_name=f"ncconvert {name}")
+    else:
+        app()
@@ -1,17 +1,53 @@
 from __future__ import annotations
 
+import csv
+import io
+import re
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, BinaryIO, Iterator
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 import xarray as xr
 
+from .planner import _estimate_group_memory
+from .profiling import _count_rows, _describe, _get_group_workers, _get_profiler
+from .storage import OutputPath, _as_path, _get_size, _makedirs, _open_output
 from .utils import (
     _dump_metadata,
+    _get_datetime_unit,
+    _get_datetime_units,
+    _get_dimension_groups,
+    _is_chunked,
+    _map_concurrently,
+    _select_dataset,
     _to_dataframe,
+    _to_dataframe_chunks,
     _to_dataframe_collection,
+    _to_dataframe_collection_chunks,
     _to_faceted_dim_dataframe,
+    _to_faceted_dim_dataframe_chunks,
+    _to_long_tables,
 )
 
+# Convert arrow integer and boolean columns with nulls to pandas' nullable types so
+# that they aren't written as floats
+_NULLABLE_DTYPES = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.uint8(): pd.UInt8Dtype(),
+    pa.uint16(): pd.UInt16Dtype(),
+    pa.uint32(): pd.UInt32Dtype(),
+    pa.uint64(): pd.UInt64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
 
 def to_csv(
     dataset: xr.Dataset,
@@ -29,24 +65,74 @@ def to_csv(
         filepath (str | Path): Where to write the file. This should be the path to a
             file, not the path to a folder. This should include the file extension.
         metadata (bool): If True, metadata from the xr.Dataset will be written to a
-            .json file next to the output file. Defaults to True.
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
         to_csv_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide to
             pandas.DataFrame.to_csv() as keyword arguments. Defaults to None.
+        chunk_size (int | None, optional): If provided, the dataset is converted and
+            appended to the csv file in slices along its leading dimension of about
+            this many rows each, which bounds peak memory by the chunk size. Datasets
+            backed by dask arrays are always converted this way, one dask chunk of the
+            leading dimension at a time unless chunk_size is given. The bytes written
+            are the same as in the default (non-chunked) mode. Defaults to None.
+        csv_engine (str, optional): How to format the csv text. "pandas" uses
+            pandas.DataFrame.to_csv(). "pyarrow" uses pyarrow's multithreaded csv
+            writer, which is much faster and writes the same bytes except that floats
+            are formatted without a trailing ".0" (e.g., "88" instead of "88.0"). It
+            supports the sep, header, index and na_rep="" to_csv_kwargs. Defaults to
+            "pandas".
+        compression (str | None, optional): "gzip" or "zstd" to compress the csv as it
+            is written, adding a ".gz" or ".zst" extension to the output file(s).
+            Defaults to None.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem (e.g., credentials) if `filepath` is a URL such as
+            "s3://bucket/name.csv". Outputs are then streamed to the filesystem in
+            buffered blocks (e.g., as a multipart upload) without a local copy, and
+            URLs are returned instead of paths. Defaults to None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
 
     Returns:
         tuple[Path, Path | None]: The path to the written csv file and associated
             metadata file.
     """
+    dataset = _select_dataset(dataset, kwargs)
     to_csv_kwargs = kwargs.get("to_csv_kwargs", {})
+    chunk_size = kwargs.get("chunk_size")
+    engine = _check_csv_engine(kwargs.get("csv_engine", "pandas"))
+    compression = _check_compression(kwargs.get("compression"))
+    profiler = _get_profiler(kwargs)
 
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+    filepath = filepath.with_suffix(".csv")
+    output_path = _get_output_path(filepath, compression)
 
-    filepath, df = _to_dataframe(dataset, filepath, ".csv")
-    df.to_csv(filepath, **to_csv_kwargs)  # type: ignore
+    if chunk_size or _is_chunked(dataset):
+        filepath, chunks = _to_dataframe_chunks(dataset, filepath, ".csv", chunk_size)
+        datetime_units = _get_datetime_units(dataset)
+        with profiler.stage("write") as stage, _open_output(output_path) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_csv_chunks(
+                sink, chunks, datetime_units, engine, compression, **to_csv_kwargs
+            )
+        stage["bytes"] = _get_size(output_path)
+    else:
+        with profiler.stage("to_dataframe") as stage:
+            filepath, df = _to_dataframe(dataset, filepath, ".csv")
+            _describe(stage, df)
+        with profiler.stage("write") as stage, _open_output(output_path) as sink:
+            _write_csv(sink, df, engine, compression, **to_csv_kwargs)
+        stage["bytes"] = _get_size(output_path)
 
-    metadata_path = _dump_metadata(dataset, filepath) if metadata else None
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
 
-    return Path(filepath), metadata_path
+    return output_path, metadata_path
 
 
 def to_csv_collection(
@@ -72,26 +158,106 @@ def to_csv_collection(
             be the path to a file, not the path to a folder. This does not need to
             include a file extension; one will be added if not provided.
         metadata (bool): If True, metadata from the xr.Dataset will be written to a
-            .json file next to the output file(s). Defaults to True.
+            .json file next to the output file(s). Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
         to_csv_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide to
             pandas.DataFrame.to_csv() as keyword arguments. Defaults to None.
+        chunk_size (int | None, optional): If provided, each file is converted and
+            written in slices of about this many rows. Datasets backed by dask arrays
+            are always converted this way. See `to_csv` for details. Defaults to None.
+        csv_engine (str, optional): How to format the csv text. "pandas" uses
+            pandas.DataFrame.to_csv(). "pyarrow" uses pyarrow's multithreaded csv
+            writer, which is much faster and writes the same bytes except that floats
+            are formatted without a trailing ".0" (e.g., "88" instead of "88.0"). It
+            supports the sep, header, index and na_rep="" to_csv_kwargs. Defaults to
+            "pandas".
+        compression (str | None, optional): "gzip" or "zstd" to compress the csv as it
+            is written, adding a ".gz" or ".zst" extension to the output file(s).
+            Defaults to None.
+        group_workers (int, optional): The number of threads to build and write the
+            files with concurrently. The returned paths are in the same order either
+            way. Defaults to 1.
+        group_memory_budget (int | None, optional): With group_workers, the bytes of
+            memory the files being built and written at the same time may use, as
+            estimated from their dimension sizes and dtypes. A file estimated to need
+            more than the budget is written on its own. Defaults to None (no budget).
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_csv`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
 
     Returns:
         tuple[tuple[Path, ...], Path | None]: The paths to the written csv files and
             associated metadata file.
     """
+    dataset = _select_dataset(dataset, kwargs)
     to_csv_kwargs = kwargs.get("to_csv_kwargs", {})
+    chunk_size = kwargs.get("chunk_size")
+    engine = _check_csv_engine(kwargs.get("csv_engine", "pandas"))
+    compression = _check_compression(kwargs.get("compression"))
+    group_workers = kwargs.get("group_workers") or 1
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
 
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    if group_workers > 1 or chunk_size or _is_chunked(dataset):
+        datetime_units = _get_datetime_units(dataset)
 
-    data_groups = _to_dataframe_collection(dataset, filepath, ".csv")
+        def _write_group(
+            fpath: OutputPath, chunks: Iterator[pd.DataFrame]
+        ) -> OutputPath:
+            fpath = _get_output_path(fpath, compression)
+            with profiler.stage("write", output=fpath.name) as stage, _open_output(
+                fpath
+            ) as sink:
+                chunks = _count_rows(chunks, stage)
+                _write_csv_chunks(
+                    sink,
+                    chunks,
+                    datetime_units,
+                    engine,
+                    compression,
+                    **to_csv_kwargs,
+                )
+            stage["bytes"] = _get_size(fpath)
+            return fpath
 
-    filepaths = []
-    for fpath, df in data_groups:
-        df.to_csv(fpath, **to_csv_kwargs)
-        filepaths.append(fpath)
+        # Each group's DataFrame is built while it is written, so with group_workers
+        # the groups are built and written concurrently
+        chunked_groups = _to_dataframe_collection_chunks(
+            dataset, filepath, ".csv", chunk_size
+        )
+        filepaths = _map_concurrently(
+            _write_group,
+            chunked_groups,
+            _get_group_workers(kwargs),
+            _estimate_group_memory(dataset, _get_dimension_groups(dataset), chunk_size),
+            kwargs.get("group_memory_budget"),
+        )
+    else:
+        filepaths = []
+        with profiler.stage("to_dataframe") as stage:
+            data_groups = _to_dataframe_collection(dataset, filepath, ".csv")
+            stage["rows"] = sum(len(df) for _, df in data_groups)
+            stage["columns"] = sum(df.shape[1] for _, df in data_groups)
+        for fpath, df in data_groups:
+            fpath = _get_output_path(fpath, compression)
+            with profiler.stage("write", output=fpath.name) as stage, _open_output(
+                fpath
+            ) as sink:
+                _write_csv(sink, df, engine, compression, **to_csv_kwargs)
+            _describe(stage, df)
+            stage["bytes"] = _get_size(fpath)
+            filepaths.append(fpath)
 
-    metadata_path = _dump_metadata(dataset, filepath) if metadata else None
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
 
     return tuple(filepaths), metadata_path
 
@@ -102,13 +268,372 @@ def to_faceted_dim_csv(
     metadata: bool = True,
     **kwargs: Any,
 ) -> tuple[Path, Path | None]:
+    """Writes an xarray dataset to a csv file indexed only by time.
+
+    Variables dimensioned by time are written as-is, scalars and variables dimensioned
+    by another dimension are repeated for each time step, and 2D variables are
+    flattened into one column per value of their second (non-time) dimension.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write. Must have a 'time' dimension.
+        filepath (str | Path): Where to write the file. This should be the path to a
+            file, not the path to a folder. This should include the file extension.
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        to_csv_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide to
+            pandas.DataFrame.to_csv() as keyword arguments. Defaults to None.
+        chunk_size (int | None, optional): If provided, the dataset is converted and
+            appended to the csv file this many time steps at a time. Datasets backed by
+            dask arrays are always converted this way, one dask chunk of 'time' at a
+            time unless chunk_size is given. The column layout is worked out once up
+            front and the bytes written are the same as in the default (non-chunked)
+            mode. Defaults to None.
+        csv_engine (str, optional): How to format the csv text. "pandas" uses
+            pandas.DataFrame.to_csv(). "pyarrow" uses pyarrow's multithreaded csv
+            writer, which is much faster and writes the same bytes except that floats
+            are formatted without a trailing ".0" (e.g., "88" instead of "88.0"). It
+            supports the sep, header, index and na_rep="" to_csv_kwargs. Defaults to
+            "pandas".
+        compression (str | None, optional): "gzip" or "zstd" to compress the csv as it
+            is written, adding a ".gz" or ".zst" extension to the output file(s).
+            Defaults to None.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_csv`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[Path, Path | None]: The path to the written csv file and associated
+            metadata file.
+    """
+    dataset = _select_dataset(dataset, kwargs)
     to_csv_kwargs = kwargs.get("to_csv_kwargs", {})
+    chunk_size = kwargs.get("chunk_size")
+    engine = _check_csv_engine(kwargs.get("csv_engine", "pandas"))
+    compression = _check_compression(kwargs.get("compression"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+    filepath = filepath.with_suffix(".csv")
+    output_path = _get_output_path(filepath, compression)
+
+    if chunk_size or _is_chunked(dataset):
+        filepath, chunks = _to_faceted_dim_dataframe_chunks(
+            dataset, filepath, ".csv", chunk_size
+        )
+        datetime_vars = [v for v in dataset.data_vars if dataset[v].dtype.kind == "M"]
+        _, datetime_df = _to_faceted_dim_dataframe(
+            dataset[["time", *datetime_vars]], filepath, ".csv"
+        )
+        datetime_units = _get_datetime_units(datetime_df)
+        with profiler.stage("write") as stage, _open_output(output_path) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_csv_chunks(
+                sink, chunks, datetime_units, engine, compression, **to_csv_kwargs
+            )
+        stage["bytes"] = _get_size(output_path)
+    else:
+        with profiler.stage("to_dataframe") as stage:
+            filepath, df = _to_faceted_dim_dataframe(dataset, filepath, ".csv")
+            _describe(stage, df)
+        with profiler.stage("write") as stage, _open_output(output_path) as sink:
+            _write_csv(sink, df, engine, compression, **to_csv_kwargs)
+        stage["bytes"] = _get_size(output_path)
+
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return output_path, metadata_path
+
+
+def to_long_csv(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[Path, Path | None]:
+    """Writes an xarray dataset to a csv file in long (tidy) format.
+
+    Each row holds one value of one variable: a "variable" column with the variable's
+    name, a column for each dimension of the dataset with the value's coordinates
+    (empty for dimensions the variable doesn't have), and a "value" column. Unlike
+    `to_csv`, variables are not broadcast across dimensions they don't have, so the
+    number of rows is the total number of values in the dataset rather than the product
+    of its dimension lengths.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write.
+        filepath (str | Path): Where to write the file. This should be the path to a
+            file, not the path to a folder. This should include the file extension.
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        to_csv_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide to
+            pandas.DataFrame.to_csv() as keyword arguments. Defaults to None.
+        chunk_size (int | None, optional): If provided, each variable is converted and
+            appended to the csv file in slices of about this many rows. Variables are
+            always converted one at a time. Defaults to None.
+        csv_engine (str, optional): How to format the csv text. "pandas" uses
+            pandas.DataFrame.to_csv(). "pyarrow" uses pyarrow's multithreaded csv
+            writer, which is much faster and writes the same bytes except that floats
+            are formatted without a trailing ".0" (e.g., "88" instead of "88.0"). It
+            supports the sep, header, index and na_rep="" to_csv_kwargs. Defaults to
+            "pandas".
+        compression (str | None, optional): "gzip" or "zstd" to compress the csv as it
+            is written, adding a ".gz" or ".zst" extension to the output file(s).
+            Defaults to None.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_csv`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[Path, Path | None]: The path to the written csv file and associated
+            metadata file.
+    """
+    dataset = _select_dataset(dataset, kwargs)
+    to_csv_kwargs = {"index": False, **kwargs.get("to_csv_kwargs", {})}
+    chunk_size = kwargs.get("chunk_size")
+    engine = _check_csv_engine(kwargs.get("csv_engine", "pandas"))
+    compression = _check_compression(kwargs.get("compression"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+    filepath = filepath.with_suffix(".csv")
+    output_path = _get_output_path(filepath, compression)
+
+    _, tables = _to_long_tables(dataset, chunk_size)
+    chunks = (table.to_pandas(types_mapper=_NULLABLE_DTYPES.get) for table in tables)
+    datetime_units = {
+        dim: unit
+        for dim, unit in _get_datetime_units(dataset).items()
+        if dim in dataset.dims
+    }
+    with profiler.stage("write") as stage, _open_output(output_path) as sink:
+        chunks = _count_rows(chunks, stage)
+        _write_csv_chunks(
+            sink, chunks, datetime_units, engine, compression, **to_csv_kwargs
+        )
+    stage["bytes"] = _get_size(output_path)
+
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return output_path, metadata_path
+
+
+def _write_csv(
+    filepath: Path | IO[bytes],
+    df: pd.DataFrame,
+    engine: str = "pandas",
+    compression: str | None = None,
+    **to_csv_kwargs: Any,
+) -> None:
+    """Writes a whole DataFrame to a csv file (or open binary file) with the given
+    engine and compression."""
+    if engine == "pandas" and compression is None and isinstance(filepath, Path):
+        df.to_csv(filepath, **to_csv_kwargs)
+        return
+    # pandas picks each datetime column's format itself when it writes the whole
+    # DataFrame; for pyarrow the datetime columns are cast to match
+    datetime_units = _get_datetime_units(df) if engine == "pyarrow" else {}
+    _write_csv_chunks(
+        filepath, iter([df]), datetime_units, engine, compression, **to_csv_kwargs
+    )
+
+
+def _write_csv_chunks(
+    filepath: Path | IO[bytes],
+    chunks: Iterator[pd.DataFrame],
+    datetime_units: dict[str, str],
+    engine: str = "pandas",
+    compression: str | None = None,
+    **to_csv_kwargs: Any,
+) -> None:
+    """Writes the header from the first DataFrame chunk and appends the rows of every
+    chunk to the same file handle, compressing them as they are written if
+    `compression` is given.
+
+    Datetime columns are formatted with the unit of the whole column (see
+    `_get_datetime_units`) so the output matches a single call to DataFrame.to_csv()."""
+    to_csv_kwargs = dict(to_csv_kwargs)
+    to_csv_kwargs.pop("mode", None)
+    header = to_csv_kwargs.pop("header", True)
+    encoding = to_csv_kwargs.pop("encoding", "utf-8")
+    if "date_format" in to_csv_kwargs:
+        datetime_units = {}
+    if engine == "pyarrow":
+        _check_arrow_csv_kwargs(encoding=encoding, **to_csv_kwargs)
+
+    with _open_csv(filepath, compression) as sink:
+        if engine == "pyarrow":
+            for i, df in enumerate(chunks):
+                if i == 0 and header:
+                    sink.write(_format_csv_header(df, **to_csv_kwargs).encode())
+                if not _write_arrow_csv_chunk(
+                    sink, df, datetime_units, **to_csv_kwargs
+                ):
+                    # Text that needs quoting is left to pandas, which quotes it the
+                    # same way the header is quoted
+                    df = _format_datetimes(df, datetime_units, "")
+                    text = df.to_csv(None, header=False, **to_csv_kwargs)
+                    sink.write(text.encode())
+            return
+
+        f = io.TextIOWrapper(sink, encoding=encoding, newline="")  # type: ignore
+        for i, df in enumerate(chunks):
+            df = _format_datetimes(df, datetime_units, to_csv_kwargs.get("na_rep", ""))
+            df.to_csv(f, header=header if i == 0 else False, **to_csv_kwargs)
+        f.flush()
+        f.detach()
+
+
+@contextmanager
+def _open_csv(
+    filepath: Path | IO[bytes], compression: str | None
+) -> Iterator[BinaryIO]:
+    if compression is not None:
+        where = str(filepath) if isinstance(filepath, Path) else filepath
+        sink: Any = pa.CompressedOutputStream(where, compression)
+    elif isinstance(filepath, Path):
+        sink = open(filepath, "wb")
+    else:
+        # Opened by `_open_output`, which also closes it
+        yield filepath  # type: ignore
+        return
+    with sink:
+        yield sink
+
+
+def _check_csv_engine(engine: str) -> str:
+    if engine not in ("pandas", "pyarrow"):
+        raise ValueError(f"csv_engine must be 'pandas' or 'pyarrow', not '{engine}'")
+    return engine
+
+
+def _check_compression(compression: str | None) -> str | None:
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError(
+            f"compression must be 'gzip', 'zstd' or None, not '{compression}'"
+        )
+    return compression
+
+
+def _get_output_path(filepath: OutputPath, compression: str | None) -> OutputPath:
+    extensions = {None: "", "gzip": ".gz", "zstd": ".zst"}
+    return filepath.with_name(filepath.name + extensions[compression])
+
+
+def _check_arrow_csv_kwargs(**to_csv_kwargs: Any) -> None:
+    unsupported = set(to_csv_kwargs) - {"sep", "index", "na_rep", "encoding"}
+    if to_csv_kwargs.get("na_rep", "") != "":
+        unsupported.add("na_rep")
+    if to_csv_kwargs.get("encoding", "utf-8").lower().replace("-", "") != "utf8":
+        unsupported.add("encoding")
+    if unsupported:
+        raise ValueError(
+            f"to_csv_kwargs {sorted(unsupported)} are not supported by the pyarrow csv"
+            " engine; use csv_engine='pandas' instead"
+        )
+
+
+def _format_csv_header(
+    df: pd.DataFrame, sep: str = ",", index: bool = True, **_: Any
+) -> str:
+    names = [*(df.index.names if index else []), *df.columns]
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=sep, lineterminator="\n").writerow(
+        ["" if name is None else str(name) for name in names]
+    )
+    return buffer.getvalue()
+
+
+def _write_arrow_csv_chunk(
+    sink: BinaryIO,
+    df: pd.DataFrame,
+    datetime_units: dict[str, str],
+    sep: str = ",",
+    index: bool = True,
+    **_: Any,
+) -> bool:
+    """Writes the DataFrame's rows (without a header) with pyarrow's csv writer, with
+    values formatted like pandas formats them (except floats). Returns False without
+    writing anything if any value needs quoting or can't be formatted like pandas."""
+    columns = [df.index.get_level_values(i) for i in range(df.index.nlevels)]
+    names = list(df.index.names) if index else []
+    if not index:
+        columns = []
+    columns.extend(df[column] for column in df.columns)
+    names.extend(df.columns)
+
+    arrays = []
+    for name, values in zip(names, columns):
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return False
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        if pa.types.is_timestamp(array.type):
+            unit = datetime_units.get(str(name)) or _get_datetime_unit(
+                np.asarray(values)
+            )
+            array = array.cast(pa.date32() if unit == "D" else pa.timestamp(unit))
+        elif pa.types.is_boolean(array.type):
+            array = pc.if_else(array, "True", "False")
+        elif pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            if pc.any(
+                pc.match_substring_regex(array, f'[{re.escape(sep)}"\r\n]')
+            ).as_py():
+                return False
+        elif not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)):
+            return False
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=[str(i) for i in range(len(arrays))])
+    options = pa_csv.WriteOptions(
+        include_header=False, delimiter=sep, quoting_style="none"
+    )
+    pa_csv.write_csv(table, sink, options)
+    return True
 
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
 
-    filepath, df = _to_faceted_dim_dataframe(dataset, filepath, ".csv")
-    df.to_csv(filepath, **to_csv_kwargs)  # type: ignore
+def _format_datetimes(
+    df: pd.DataFrame, datetime_units: dict[str, str], na_rep: str
+) -> pd.DataFrame:
+    def _format(values: np.ndarray, unit: str) -> np.ndarray:
+        if values.size == 0:
+            # np.char sizes its output from the longest string, which fails without any
+            return values.astype(object)
+        text = np.char.replace(np.datetime_as_string(values, unit=unit), "T", " ")
+        text = text.astype(object)
+        text[np.isnat(values)] = na_rep
+        return text
 
-    metadata_path = _dump_metadata(dataset, filepath) if metadata else None
+    if not datetime_units:
+        return df
 
-    return Path(filepath), metadata_path
+    df = df.copy(deep=False)
+    for name, unit in datetime_units.items():
+        if name in df.columns and df[name].dtype.kind == "M":
+            df[name] = _format(df[name].values, unit)
+        elif isinstance(df.index, pd.MultiIndex) and name in df.index.names:
+            level = df.index.names.index(name)
+            formatted = _format(df.index.levels[level].values, unit)
+            df.index = df.index.set_levels(formatted, level=level)
+        elif df.index.name == name and df.index.dtype.kind == "M":
+            df.index = pd.Index(_format(df.index.values, unit), name=name)
+    return df
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable
+
+from .storage import _atomic_write
+
+MANIFEST_FILENAME = ".ncconvert-manifest.json"
+
+# Sharded runs (`ncconvert --shard i/N`) each write their own manifest so that nodes
+# sharing an output dir don't overwrite each other's. `merge_manifests` combines them
+SHARD_MANIFEST_FILENAME = ".ncconvert-manifest.shard-{}-of-{}.json"
+
+
+class Manifest:
+    """Records which input files have been converted, and into which outputs, so that
+    re-runs over the same inputs can skip files whose outputs are still current.
+
+    Entries are keyed by the resolved input path and store the input's size, mtime and
+    (optionally) sha256 content hash, along with the conversion method, the options
+    used, and the paths and sizes of the files that were written.
+
+    Args:
+        path (Path): The path to the manifest file.
+        entries (dict[str, dict[str, Any]] | None, optional): Existing entries.
+            Defaults to None.
+    """
+
+    def __init__(self, path: Path, entries: dict[str, dict[str, Any]] | None = None):
+        self.path = path
+        self.entries: dict[str, dict[str, Any]] = entries or {}
+
+    @classmethod
+    def load(cls, output_dir: Path, shard: tuple[int, int] | None = None) -> Manifest:
+        """Loads the manifest in the output dir. If `shard` (index, count) is given,
+        the shard's own manifest is loaded on top of it and is the one that is saved.
+        """
+        path = Path(output_dir) / MANIFEST_FILENAME
+        entries = _read_entries(path)
+        if shard is not None:
+            path = Path(output_dir) / SHARD_MANIFEST_FILENAME.format(*shard)
+            entries.update(_read_entries(path))
+        return cls(path, entries)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _atomic_write(self.path) as tmp_path:
+            tmp_path.write_text(json.dumps(self.entries, indent=4, sort_keys=True))
+
+    def is_current(
+        self,
+        file: Path,
+        method: str,
+        options: dict[str, Any],
+        content_hash: bool = False,
+    ) -> bool:
+        """Returns True if `file` was already converted with the same method and options,
+        it has not changed since, and all of the outputs recorded for it still exist
+        with the same size.
+
+        The input is considered unchanged if its size and mtime match the recorded
+        ones. If `content_hash` is True, an input whose mtime changed (e.g., because it
+        was copied) is still considered unchanged if its sha256 hash matches."""
+        entry = self.entries.get(str(file))
+        if entry is None:
+            return False
+        if entry["method"] != method or entry["options"] != _jsonable(options):
+            return False
+
+        stat = file.stat()
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime_ns"] != stat.st_mtime_ns:
+            if not content_hash or entry.get("sha256") != _sha256(file):
+                return False
+
+        return all(
+            os.path.exists(output) and os.path.getsize(output) == size
+            for output, size in entry["outputs"].items()
+        )
+
+    def record(
+        self,
+        file: Path,
+        method: str,
+        options: dict[str, Any],
+        outputs: Iterable[Path],
+        content_hash: bool = False,
+    ) -> None:
+        stat = file.stat()
+        self.entries[str(file)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": _sha256(file) if content_hash else None,
+            "method": method,
+            "options": _jsonable(options),
+            "outputs": {str(p): os.path.getsize(p) for p in outputs},
+        }
+
+
+def merge_manifests(output_dir: Path) -> tuple[Manifest, list[Path]]:
+    """Combines the manifests written by sharded runs into the output dir's manifest,
+    saves it, and removes the shard manifests.
+
+    Returns:
+        tuple[Manifest, list[Path]]: The combined manifest and the paths of the shard
+            manifests that were merged into it.
+    """
+    manifest = Manifest.load(output_dir)
+    base = dict(manifest.entries)
+    shard_paths = sorted(
+        Path(output_dir).glob(SHARD_MANIFEST_FILENAME.format("*", "*"))
+    )
+    for path in shard_paths:
+        # Shard manifests include the entries of the manifest they started from, so
+        # only take the entries that the shard recorded, or a stale copy in one shard
+        # could replace an entry another shard updated
+        for key, entry in _read_entries(path).items():
+            if base.get(key) != entry:
+                manifest.entries[key] = entry
+    manifest.save()
+    for path in shard_paths:
+        path.unlink()
+    return manifest, shard_paths
+
+
+def _read_entries(path: Path) -> dict[str, dict[str, Any]]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _flatten_outputs(
+    result: tuple[tuple[Path, ...] | Path, Path | None],
+) -> list[Path]:
+    data_files, metadata_file = result
+    outputs = list(data_files) if isinstance(data_files, tuple) else [data_files]
+    if metadata_file is not None:
+        outputs.append(metadata_file)
+    return outputs
+
+
+def _jsonable(options: dict[str, Any]) -> dict[str, Any]:
+    # Round-trip through json so options compare equal to ones loaded from disk
+    return json.loads(json.dumps(options, default=str, sort_keys=True))
+
+
+def _sha256(file: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
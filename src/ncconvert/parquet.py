@@ -1,11 +1,51 @@
 from __future__ import annotations
 
+import itertools
+import json
+import uuid
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Iterator
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import xarray as xr
 
-from .utils import _dump_metadata, _to_dataframe, _to_dataframe_collection
+from .planner import _estimate_group_memory
+from .profiling import _count_rows, _describe, _get_group_workers, _get_profiler
+from .storage import (
+    OutputPath,
+    _as_path,
+    _atomic_write,
+    _create_exclusive,
+    _exists,
+    _get_size,
+    _hold_lock,
+    _is_url,
+    _makedirs,
+    _open_input,
+    _open_output,
+    _read_bytes,
+    _remove,
+    _write_bytes,
+)
+from .utils import (
+    _dump_metadata,
+    _get_dim_group_path,
+    _get_dimension_groups,
+    _is_chunked,
+    _iter_arrow_tables,
+    _iter_group_tables,
+    _map_concurrently,
+    _select_dataset,
+    _supports_arrow_engine,
+    _to_dataframe,
+    _to_dataframe_chunks,
+    _to_dataframe_collection,
+    _to_dataframe_collection_chunks,
+    _to_long_tables,
+)
 
 
 def to_parquet(
@@ -26,22 +66,89 @@ def to_parquet(
         to_parquet_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide
             to pandas.DataFrame.to_parquet() as keyword arguments. Defaults to None.
         metadata (bool): If True, metadata from the xr.Dataset will be written to a
-            .json file next to the output file. Defaults to True.
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        row_group_size (int | None, optional): If provided, the dataset is streamed to
+            the parquet file in slices along its leading dimension, each written as a
+            separate row group of at most about this many rows. This bounds peak
+            memory by the row group size instead of the size of the dataset. Datasets
+            backed by dask arrays are always streamed, one dask chunk of the leading
+            dimension per row group unless row_group_size is given. The data written is
+            the same as in the default (non-streaming) mode. Defaults to None.
+        engine (str, optional): How to convert the dataset into a table. "pandas" goes
+            through xr.Dataset.to_dataframe(). "arrow" builds a pyarrow.Table directly
+            from the variables' numpy arrays, which avoids building a pandas
+            MultiIndex and wraps contiguous data without copying it. Both engines write
+            the same columns and values. Defaults to "pandas".
+        compression (str | None, optional): The compression codec to use (e.g.,
+            "zstd" or "gzip") if one isn't given in to_parquet_kwargs. Defaults to
+            "snappy".
+        compact (bool, optional): If True, data columns are written with the smallest
+            dtype that holds their values, and each column's parquet encoding is
+            chosen from a sample of its values. See `_get_compact_dtypes` and
+            `_choose_parquet_encodings`. Defaults to False.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem (e.g., credentials) if `filepath` is a URL such as
+            "s3://bucket/name.parquet". Outputs are then streamed to the filesystem in
+            buffered blocks (e.g., as a multipart upload) without a local copy, and
+            URLs are returned instead of paths. Defaults to None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
 
     Returns:
         tuple[Path, Path | None]: The path to the written parquet file and associated
             metadata file.
     """
-    to_parquet_kwargs = kwargs.get("to_parquet_kwargs", {})
+    dataset = _select_dataset(dataset, kwargs)
+    to_parquet_kwargs = _get_to_parquet_kwargs(kwargs)
+    row_group_size = kwargs.get("row_group_size")
+    engine = _check_engine(kwargs.get("engine", "pandas"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
 
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    dim_order = list(dataset.dims)
+    dtypes: dict[str, str] = {}
+    if kwargs.get("compact"):
+        with profiler.stage("compact"):
+            dtypes = _get_compact_dtypes(dataset)
+            encodings = _choose_parquet_encodings(dataset, dim_order, dtypes)
+        to_parquet_kwargs = {**encodings, **to_parquet_kwargs}
 
-    filepath, df = _to_dataframe(dataset, filepath, ".parquet")
-    df.to_parquet(filepath, **to_parquet_kwargs)  # type: ignore
+    if engine == "arrow" and _supports_arrow_engine(dataset, dim_order):
+        filepath = filepath.with_suffix(".parquet")
+        tables = _iter_arrow_tables(
+            dataset, dim_order, row_group_size, to_parquet_kwargs.get("index"), dtypes
+        )
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            tables = _count_rows(tables, stage)
+            _write_parquet_chunks(sink, tables, row_group_size, **to_parquet_kwargs)
+    elif row_group_size or _is_chunked(dataset):
+        filepath, chunks = _to_dataframe_chunks(
+            dataset, filepath, ".parquet", row_group_size
+        )
+        chunks = (_astype(chunk, dtypes) for chunk in chunks)
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_parquet_chunks(sink, chunks, row_group_size, **to_parquet_kwargs)
+    else:
+        with profiler.stage("to_dataframe") as stage:
+            filepath, df = _to_dataframe(dataset, filepath, ".parquet")
+            df = _astype(df, dtypes)
+            _describe(stage, df)
+        with profiler.stage("write") as stage, _open_output(filepath) as sink:
+            df.to_parquet(sink, **to_parquet_kwargs)
+    stage["bytes"] = _get_size(filepath)
 
-    metadata_path = _dump_metadata(dataset, filepath) if metadata else None
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
 
-    return Path(filepath), metadata_path
+    return filepath, metadata_path
 
 
 def to_parquet_collection(
@@ -69,23 +176,728 @@ def to_parquet_collection(
         to_parquet_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide
             to pandas.DataFrame.to_parquet() as keyword arguments. Defaults to None.
         metadata (bool): If True, metadata from the xr.Dataset will be written to a
-            .json file next to the output file(s). Defaults to True.
+            .json file next to the output file(s). Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        row_group_size (int | None, optional): If provided, each file is streamed in
+            row groups of about this many rows. Datasets backed by dask arrays are
+            always streamed. See `to_parquet` for details. Defaults to None.
+        engine (str, optional): "pandas" or "arrow". See `to_parquet` for details.
+            Defaults to "pandas".
+        compression (str | None, optional): The compression codec to use (e.g.,
+            "zstd" or "gzip") if one isn't given in to_parquet_kwargs. Defaults to
+            "snappy".
+        group_workers (int, optional): The number of threads to build and write the
+            files with concurrently. See `ncconvert.to_csv_collection`. Defaults to 1.
+        group_memory_budget (int | None, optional): With group_workers, the bytes of
+            memory the files being built and written at the same time may use. See
+            `ncconvert.to_csv_collection`. Defaults to None (no budget).
+        compact (bool, optional): If True, data columns are written with the smallest
+            dtype that holds their values, and each column's parquet encoding is
+            chosen from a sample of its values. See `_get_compact_dtypes` and
+            `_choose_parquet_encodings`. Defaults to False.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_parquet`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
 
     Returns:
         tuple[tuple[Path, ...], Path | None]: The paths to the written parquet files and
             associated metadata file.
     """
-    to_parquet_kwargs = kwargs.get("to_parquet_kwargs", {})
+    dataset = _select_dataset(dataset, kwargs)
+    to_parquet_kwargs = _get_to_parquet_kwargs(kwargs)
+    row_group_size = kwargs.get("row_group_size")
+    engine = _check_engine(kwargs.get("engine", "pandas"))
+    group_workers = kwargs.get("group_workers") or 1
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+
+    dim_groups = _get_dimension_groups(dataset)
+    dtypes: dict[str, str] = {}
+    group_kwargs = {dim_group: to_parquet_kwargs for dim_group in dim_groups}
+    if kwargs.get("compact"):
+        with profiler.stage("compact"):
+            dtypes = _get_compact_dtypes(dataset)
+            for dim_group, variable_names in dim_groups.items():
+                encodings = _choose_parquet_encodings(
+                    dataset[variable_names], list(dim_group), dtypes
+                )
+                group_kwargs[dim_group] = {**encodings, **to_parquet_kwargs}
+    # The files are written in the same order as the dimension groups
+    write_kwargs = iter(group_kwargs.values())
+
+    def _write_group(
+        fpath: OutputPath,
+        chunks: Iterator[pd.DataFrame | pa.Table],
+        to_parquet_kwargs: dict[str, Any],
+    ) -> OutputPath:
+        with profiler.stage("write", output=fpath.name) as stage, _open_output(
+            fpath
+        ) as sink:
+            chunks = _count_rows(chunks, stage)
+            _write_parquet_chunks(sink, chunks, row_group_size, **to_parquet_kwargs)
+        stage["bytes"] = _get_size(fpath)
+        return fpath
+
+    if engine == "arrow" or group_workers > 1 or row_group_size or _is_chunked(dataset):
+        # Each group's table is built while it is written, so with group_workers the
+        # groups are built and written concurrently
+        if engine == "arrow":
+            chunked_groups = tuple(
+                (
+                    _get_dim_group_path(filepath, dim_group, "parquet"),
+                    _iter_group_tables(
+                        dataset[variable_names],
+                        dim_group,
+                        row_group_size,
+                        to_parquet_kwargs.get("index"),
+                        {n: dtypes[n] for n in variable_names if n in dtypes},
+                    ),
+                    next(write_kwargs),
+                )
+                for dim_group, variable_names in dim_groups.items()
+            )
+        else:
+            chunked_groups = tuple(
+                (
+                    fpath,
+                    (_astype(chunk, dtypes) for chunk in chunks),
+                    next(write_kwargs),
+                )
+                for fpath, chunks in _to_dataframe_collection_chunks(
+                    dataset, filepath, ".parquet", row_group_size
+                )
+            )
+        filepaths = _map_concurrently(
+            _write_group,
+            chunked_groups,
+            _get_group_workers(kwargs),
+            _estimate_group_memory(dataset, dim_groups, row_group_size),
+            kwargs.get("group_memory_budget"),
+        )
+    else:
+        filepaths = []
+        with profiler.stage("to_dataframe") as stage:
+            data_groups = [
+                (fpath, _astype(df, dtypes))
+                for fpath, df in _to_dataframe_collection(dataset, filepath, ".parquet")
+            ]
+            stage["rows"] = sum(len(df) for _, df in data_groups)
+            stage["columns"] = sum(df.shape[1] for _, df in data_groups)
+        for fpath, df in data_groups:
+            with profiler.stage("write", output=fpath.name) as stage, _open_output(
+                fpath
+            ) as sink:
+                df.to_parquet(sink, **next(write_kwargs))
+            _describe(stage, df)
+            stage["bytes"] = _get_size(fpath)
+            filepaths.append(fpath)
+
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return tuple(filepaths), metadata_path
+
+
+def to_long_parquet(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[Path, Path | None]:
+    """Writes an xarray dataset to a parquet file in long (tidy) format.
+
+    Each row holds one value of one variable: a "variable" column with the variable's
+    name (dictionary-encoded), a column for each dimension of the dataset with the
+    value's coordinates (null for dimensions the variable doesn't have), and a "value"
+    column. Unlike `to_parquet`, variables are not broadcast across dimensions they
+    don't have, so the number of rows is the total number of values in the dataset
+    rather than the product of its dimension lengths. See
+    `ncconvert.utils._to_long_tables` for the column types.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write.
+        filepath (str | Path): Where to write the file. This should be the path to a
+            file, not the path to a folder. This should include the file extension.
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file next to the output file. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        to_parquet_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide
+            to pyarrow.parquet.ParquetWriter as keyword arguments (e.g., compression).
+            Defaults to None.
+        row_group_size (int | None, optional): If provided, each variable is converted
+            and written in row groups of at most about this many rows. Variables are
+            always converted one at a time. Defaults to None.
+        compression (str | None, optional): The compression codec to use (e.g.,
+            "zstd" or "gzip") if one isn't given in to_parquet_kwargs. Defaults to
+            "snappy".
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_parquet`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[Path, Path | None]: The path to the written parquet file and associated
+            metadata file.
+    """
+    dataset = _select_dataset(dataset, kwargs)
+    to_parquet_kwargs = _get_to_parquet_kwargs(kwargs)
+    row_group_size = kwargs.get("row_group_size")
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    _makedirs(filepath.parent)
+    filepath = filepath.with_suffix(".parquet")
 
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    schema, tables = _to_long_tables(dataset, row_group_size)
+    with profiler.stage("write") as stage, _open_output(filepath) as sink:
+        tables = _count_rows(tables, stage)
+        _write_parquet_chunks(
+            sink, tables, row_group_size, schema=schema, **to_parquet_kwargs
+        )
+    stage["bytes"] = _get_size(filepath)
 
-    data_groups = _to_dataframe_collection(dataset, filepath, ".parquet")
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
+
+    return filepath, metadata_path
+
+
+def to_parquet_dataset(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    metadata: bool = True,
+    **kwargs: Any,
+) -> tuple[tuple[Path, ...], Path | None]:
+    """Appends an xarray dataset to a hive-partitioned parquet dataset.
+
+    Variables are split into the same dimension groups as in `to_parquet_collection`,
+    and each group is written to its own partition, e.g., `dim_group=time.height/`.
+    Groups dimensioned by time are further partitioned by the date of each row, e.g.,
+    `dim_group=time.height/date=2022-04-05/`. The parent folder of `filepath` is the
+    root of the parquet dataset, and each call adds one file named after `filepath`
+    to each partition the dataset has rows in, so converting many files into the same
+    folder builds up a single dataset per dimension group that query engines can read
+    as a whole (e.g., `pd.read_parquet("root/dim_group=time.height")`).
+
+    The schema of each dimension group is stored in its `_common_metadata` file the
+    first time the group is written. Later appends are written with that schema:
+    missing columns are filled with nulls and columns are cast to the stored types.
+    Converting the same file again replaces its rows: its files are overwritten, its
+    files in partitions it no longer has rows in are removed, and so are its rows in
+    files merged by `compact_parquet_dataset`. The files each input's rows are in are
+    listed in `_sources/<name>.json` under the root, so this only visits those files.
+    Different files may be appended at the same time, but not while the dataset is
+    compacted. Use `compact_parquet_dataset` to merge many small files in each
+    partition into fewer, larger ones.
+
+    Args:
+        dataset (xr.Dataset): The dataset to write.
+        filepath (str | Path): The path of the input file in the output folder, e.g.,
+            `root/name.nc`. Its name is used to name the written files and the
+            metadata file, and its parent folder is the root of the parquet dataset.
+        metadata (bool): If True, metadata from the xr.Dataset will be written to a
+            .json file in the root folder, named after `filepath`. Defaults to True. The
+            shared_metadata, json_backend and compact_json keyword arguments control
+            how it is written (see `ncconvert.utils._dump_metadata`).
+        to_parquet_kwargs (Dict[str, Any] | None, optional): Extra arguments to provide
+            to pyarrow.parquet.ParquetWriter as keyword arguments (e.g., compression).
+            Defaults to None.
+        row_group_size (int | None, optional): The maximum number of rows in each row
+            group of the written files. Defaults to None.
+        time_partition (str | None, optional): How finely to partition groups that are
+            dimensioned by time: "day", "month", "year", or None to not partition them
+            by time. Defaults to "day".
+        compression (str | None, optional): The compression codec to use (e.g.,
+            "zstd" or "gzip") if one isn't given in to_parquet_kwargs. Defaults to
+            "snappy".
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem if `filepath` is a URL. See `to_parquet`. Defaults to
+            None.
+        variables, drop_variables, time_start, time_end, isel (optional): Select the
+            part of the dataset to convert before any data is read. See
+            `ncconvert.utils._select_dataset`.
+        profiler (Profiler | None, optional): Records the wall time, peak memory, rows,
+            columns and bytes written of each stage of the conversion. See
+            `ncconvert.profiling.Profiler`. Defaults to None.
+
+    Returns:
+        tuple[tuple[Path, ...], Path | None]: The paths to the written parquet files and
+            associated metadata file.
+    """
+    dataset = _select_dataset(dataset, kwargs)
+    to_parquet_kwargs = _get_to_parquet_kwargs(kwargs)
+    row_group_size = kwargs.get("row_group_size")
+    time_unit = _check_time_partition(kwargs.get("time_partition", "day"))
+    profiler = _get_profiler(kwargs)
+
+    filepath = _as_path(filepath, kwargs)
+    root = filepath.parent
+    _makedirs(root)
+    filename = filepath.with_suffix(".parquet").name
+
+    # Conform every group to its stored schema before writing any of them, so a
+    # dataset that doesn't fit is rejected without leaving a partial append behind
+    tables = []
+    for dim_group, variable_names in _get_dimension_groups(dataset).items():
+        group_dir = root / _get_partition_name(dim_group)
+        with profiler.stage("to_dataframe", output=group_dir.name) as stage:
+            if dim_group == ():
+                df = pd.DataFrame(dataset[variable_names].to_pandas()).T
+                df = df.reset_index(drop=True)
+            else:
+                df = dataset[variable_names].to_dataframe(dim_order=list(dim_group))
+                df = df.reset_index()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            schema_path = group_dir / "_common_metadata"
+            if not _exists(schema_path):
+                # If another process stores the group's schema first, the table is
+                # conformed to that one instead
+                _makedirs(group_dir)
+                _create_exclusive(schema_path, _serialize_schema(table.schema))
+            table = _conform_to_schema(table, group_dir)
+            _describe(stage, table)
+        tables.append((dim_group, group_dir, table))
 
     filepaths = []
-    for fpath, df in data_groups:
-        df.to_parquet(fpath, **to_parquet_kwargs)
-        filepaths.append(fpath)
+    for dim_group, group_dir, table in tables:
+        for partition_dir, partition in _split_by_time(
+            table, group_dir, time_unit if "time" in dim_group else None
+        ):
+            fpath = partition_dir / filename
+            _makedirs(fpath.parent)
+            with profiler.stage("write", output=str(fpath.relative_to(root))) as stage:
+                with _open_output(fpath) as sink:
+                    _write_parquet_chunks(
+                        sink, iter([partition]), row_group_size, **to_parquet_kwargs
+                    )
+                _describe(stage, partition)
+                stage["bytes"] = _get_size(fpath)
+            filepaths.append(fpath)
+
+    _remove_earlier_rows(root, filename, filepaths)
 
-    metadata_path = _dump_metadata(dataset, filepath) if metadata else None
+    metadata_path = _dump_metadata(dataset, filepath, **kwargs) if metadata else None
 
     return tuple(filepaths), metadata_path
+
+
+def compact_parquet_dataset(
+    root: str | Path, target_file_size: int = 128 * 2**20
+) -> tuple[Path, ...]:
+    """Merges the small files in each partition of a parquet dataset written by
+    `to_parquet_dataset` into files of up to about `target_file_size` bytes.
+
+    Files already larger than the target are left alone. Merged files are named
+    `part-<id>.parquet` and list the files their rows came from in their metadata, so
+    converting an input again after it was merged still replaces its rows (see
+    `to_parquet_dataset`). No files may be appended to the dataset while it is
+    compacted.
+
+    Args:
+        root (str | Path): The root folder of the parquet dataset. Only local folders
+            are supported.
+        target_file_size (int, optional): The size in bytes to merge files up to.
+            Defaults to 128 MiB.
+
+    Returns:
+        tuple[Path, ...]: The paths to the merged files that were written.
+    """
+    if _is_url(root):
+        raise ValueError("compact_parquet_dataset only supports local folders")
+    written = []
+    partition_dirs = {f.parent for f in Path(root).rglob("*.parquet")}
+    for partition_dir in sorted(partition_dirs):
+        small_files = sorted(
+            f
+            for f in partition_dir.glob("*.parquet")
+            if f.stat().st_size < target_file_size
+        )
+        batches: list[list[Path]] = [[]]
+        batch_size = 0
+        for f in small_files:
+            if batches[-1] and batch_size + f.stat().st_size > target_file_size:
+                batches.append([])
+                batch_size = 0
+            batches[-1].append(f)
+            batch_size += f.stat().st_size
+
+        for batch in batches:
+            if len(batch) < 2:
+                continue
+            # Files in a partition share the group's schema, see `_conform_to_schema`
+            tables, sources = [], []
+            for f in batch:
+                parquet_file = pq.ParquetFile(f)
+                tables.append(parquet_file.read())
+                sources.extend(
+                    _get_merged_sources(parquet_file.metadata)
+                    or [(f.name, parquet_file.metadata.num_rows)]
+                )
+            table = _with_merged_sources(pa.concat_tables(tables), sources)
+            fpath = partition_dir / f"part-{uuid.uuid4().hex[:8]}.parquet"
+            with _atomic_write(fpath) as tmp_path:
+                pq.write_table(table, tmp_path)
+            for name in dict.fromkeys(name for name, _ in sources):
+                _replace_in_sources_index(Path(root), name, batch, fpath)
+            for f in batch:
+                f.unlink()
+            written.append(fpath)
+
+    return tuple(written)
+
+
+def _remove_earlier_rows(
+    root: OutputPath, filename: str, written: list[OutputPath]
+) -> None:
+    """Removes what an earlier conversion of the file named `filename` left in the
+    parquet dataset at `root` that this conversion didn't overwrite: its files in
+    partitions (or dimension groups) it no longer has rows in, and its rows in files
+    merged by `compact_parquet_dataset`. Then lists the `written` files in its index."""
+    index_path = _get_sources_index_path(root, filename)
+    written_paths = [f.relative_to(root).as_posix() for f in written]
+    earlier = json.loads(_read_bytes(index_path)) if _exists(index_path) else []
+    for relative_path in earlier:
+        if relative_path in written_paths:
+            continue
+        fpath = root / relative_path
+        if fpath.name == filename:
+            _remove(fpath)
+        else:
+            _remove_merged_rows(fpath, filename)
+    _makedirs(index_path.parent)
+    _write_bytes(index_path, json.dumps(written_paths).encode())
+
+
+def _remove_merged_rows(fpath: OutputPath, filename: str) -> None:
+    # Files appended at the same time may have rows in the same merged file
+    with _hold_lock(fpath.with_name(f".{fpath.name}.lock")):
+        if not _exists(fpath):
+            return
+        with _open_input(fpath) as source:
+            sources = _get_merged_sources(pq.read_metadata(source))
+        if all(name != filename for name, _ in sources):
+            return
+
+        # The rows of each merged file follow each other in the order of `sources`
+        with _open_input(fpath) as source:
+            table = pq.read_table(source)
+        offsets = itertools.accumulate((n for _, n in sources), initial=0)
+        kept = [(name, n, offset) for (name, n), offset in zip(sources, offsets)]
+        kept = [(name, n, offset) for name, n, offset in kept if name != filename]
+        if not kept:
+            _remove(fpath)
+            return
+        table = pa.concat_tables(table.slice(offset, n) for _, n, offset in kept)
+        table = _with_merged_sources(table, [(name, n) for name, n, _ in kept])
+        with _open_output(fpath) as sink:
+            pq.write_table(table, sink)
+
+
+# The folder under the root of a parquet dataset with the index of each input, a json
+# list of the files (relative to the root) its rows are in
+SOURCES_DIRNAME = "_sources"
+
+
+def _get_sources_index_path(root: OutputPath, filename: str) -> OutputPath:
+    return root / SOURCES_DIRNAME / f"{filename}.json"
+
+
+def _replace_in_sources_index(
+    root: Path, filename: str, merged: list[Path], fpath: Path
+) -> None:
+    """Replaces the `merged` files in the index of the file named `filename` with the
+    file `fpath` they were merged into."""
+    index_path = _get_sources_index_path(root, filename)
+    if not index_path.exists():
+        return
+    merged_paths = {f.relative_to(root).as_posix() for f in merged}
+    paths = [p for p in json.loads(index_path.read_text()) if p not in merged_paths]
+    paths.append(fpath.relative_to(root).as_posix())
+    _write_bytes(index_path, json.dumps(paths).encode())
+
+
+# The parquet metadata that lists the (file name, number of rows) of the files that a
+# file written by `compact_parquet_dataset` was merged from
+_MERGED_SOURCES_KEY = b"ncconvert.merged_sources"
+
+
+def _get_merged_sources(metadata: pq.FileMetaData) -> list[tuple[str, int]]:
+    sources = (metadata.metadata or {}).get(_MERGED_SOURCES_KEY)
+    return [(name, n) for name, n in json.loads(sources)] if sources else []
+
+
+def _serialize_schema(schema: pa.Schema) -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_metadata(schema, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def _with_merged_sources(table: pa.Table, sources: list[tuple[str, int]]) -> pa.Table:
+    metadata = dict(table.schema.metadata or {})
+    metadata[_MERGED_SOURCES_KEY] = json.dumps(sources).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def _write_parquet_chunks(
+    filepath: Path | IO[bytes],
+    chunks: Iterator[pd.DataFrame | pa.Table],
+    row_group_size: int | None,
+    schema: pa.Schema | None = None,
+    **to_parquet_kwargs: Any,
+) -> None:
+    """Appends each DataFrame (or pyarrow Table) chunk to a single parquet file as its
+    own row group(s).
+
+    Accepts the same keyword arguments as pandas.DataFrame.to_parquet() (with the
+    pyarrow engine) so the file matches what pandas would have written in one go. If
+    `schema` is given, a file with no rows is written when there are no chunks."""
+    to_parquet_kwargs = dict(to_parquet_kwargs)
+    to_parquet_kwargs.pop("engine", None)
+    index = to_parquet_kwargs.pop("index", None)
+    compression = to_parquet_kwargs.pop("compression", "snappy")
+
+    writer: pq.ParquetWriter | None = None
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, pa.Table):
+                table = chunk
+            elif writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=index)
+            else:
+                table = pa.Table.from_pandas(
+                    chunk, schema=writer.schema, preserve_index=index
+                )
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    filepath,
+                    table.schema,
+                    compression=compression,
+                    **to_parquet_kwargs,
+                )
+            writer.write_table(table, row_group_size=row_group_size)
+        if writer is None and schema is not None:
+            writer = pq.ParquetWriter(
+                filepath, schema, compression=compression, **to_parquet_kwargs
+            )
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _get_to_parquet_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
+    to_parquet_kwargs = kwargs.get("to_parquet_kwargs", {})
+    if kwargs.get("compression") is not None:
+        return {"compression": kwargs["compression"], **to_parquet_kwargs}
+    return to_parquet_kwargs
+
+
+def _astype(df: pd.DataFrame, dtypes: dict[str, str]) -> pd.DataFrame:
+    dtypes = {name: dtype for name, dtype in dtypes.items() if name in df.columns}
+    return df.astype(dtypes) if dtypes else df
+
+
+def _get_compact_dtypes(dataset: xr.Dataset) -> dict[str, str]:
+    """Returns the pandas dtype to write each data variable with, for the variables
+    that can be stored in a smaller dtype than the one xarray decoded them to.
+
+    Variables that were integers in the source file but decoded to floats to mask their
+    _FillValue are converted back to nullable integers of their source dtype. Floats
+    packed from 8- or 16-bit integers with scale_factor/add_offset, and float64
+    variables that were float32 in the source file, are written as float32. Variables
+    that are already in memory are also downcast based on their values: integers to the
+    smallest dtype that holds them and float64 to float32 if no value changes. These
+    checks read the data, so they are skipped for dask-backed variables, and different
+    files may be downcast differently."""
+    dtypes = {}
+    for name, var in dataset.data_vars.items():
+        dtype = _get_compact_dtype(var)
+        if dtype is not None and dtype != str(var.dtype):
+            dtypes[str(name)] = dtype
+    return dtypes
+
+
+def _get_compact_dtype(var: xr.DataArray) -> str | None:
+    encoding = var.encoding
+    source = np.dtype(encoding.get("dtype", var.dtype))
+    if source.kind == "i" and str(encoding.get("_Unsigned", "")).lower() == "true":
+        source = np.dtype(f"u{source.itemsize}")
+    packed = "scale_factor" in encoding or "add_offset" in encoding
+    in_memory = var.chunks is None
+
+    if var.dtype.kind == "f" and source.kind in "iu" and not packed:
+        if not in_memory:
+            return _NULLABLE_INTEGERS[source.name]
+        values = var.values[np.isfinite(var.values)]
+        if np.isinf(var.values).any() or (values != np.round(values)).any():
+            return None
+        if values.size == 0 or np.can_cast(_min_int_dtype(values), source):
+            return _NULLABLE_INTEGERS[source.name]
+        return _NULLABLE_INTEGERS[_min_int_dtype(values).name]
+    if var.dtype == np.float64:
+        if (packed and source.kind in "iu" and source.itemsize <= 2) or (
+            source == np.float32
+        ):
+            return "float32"
+        if in_memory:
+            values = var.values
+            with np.errstate(over="ignore"):
+                as_float32 = values.astype(np.float32)
+            if np.array_equal(as_float32, values, equal_nan=True):
+                return "float32"
+        return None
+    if var.dtype.kind in "iu" and in_memory and var.size:
+        return _min_int_dtype(var.values).name
+    return None
+
+
+def _min_int_dtype(values: np.ndarray) -> np.dtype:
+    """Returns the smallest integer dtype that holds the given (integral) values."""
+    low, high = values.min(), values.max()
+    kinds = ["uint8", "uint16", "uint32"] if low >= 0 else []
+    for name in [*kinds, "int8", "int16", "int32"]:
+        info = np.iinfo(name)
+        if info.min <= low and high <= info.max:
+            return np.dtype(name)
+    return np.dtype("uint64" if low >= 0 and high > np.iinfo("int64").max else "int64")
+
+
+# The pandas nullable integer dtypes, which store missing values as nulls instead of
+# promoting the column to float
+_NULLABLE_INTEGERS = {
+    "int8": "Int8",
+    "int16": "Int16",
+    "int32": "Int32",
+    "int64": "Int64",
+    "uint8": "UInt8",
+    "uint16": "UInt16",
+    "uint32": "UInt32",
+    "uint64": "UInt64",
+}
+
+
+def _choose_parquet_encodings(
+    dataset: xr.Dataset,
+    dim_order: list[str],
+    dtypes: dict[str, str],
+    sample_size: int = 10_000,
+) -> dict[str, Any]:
+    """Chooses the parquet encoding of each column of the table the dataset is written
+    as, from statistics of a sample of each variable's values.
+
+    Strings, booleans, variables repeated across dimensions they don't have and
+    variables with few distinct values in the sample (at most 1 in 10) are dictionary
+    encoded. Other floats use BYTE_STREAM_SPLIT, which usually compresses better than
+    plain floats, and sorted integer and datetime columns use DELTA_BINARY_PACKED. Returns
+    keyword arguments for pyarrow.parquet.write_table()."""
+    use_dictionary = []
+    column_encoding = {}
+    for name in [*dim_order, *dataset.data_vars]:
+        if name not in dataset.variables:
+            continue  # A dimension without a coordinate variable
+        var = dataset[name].variable
+        dtype = np.dtype(dtypes[name].lower()) if name in dtypes else var.dtype
+        if var.ndim == 0 or dtype.kind in "OSUb":
+            use_dictionary.append(name)
+            continue
+        sample = _sample_values(var, sample_size)
+        if dtype.kind != "M":
+            sample = sample[~pd.isna(sample)]
+        if set(var.dims) != set(dim_order) or (
+            sample.size and np.unique(sample).size <= sample.size // 10
+        ):
+            use_dictionary.append(name)
+        elif dtype.kind == "f":
+            column_encoding[name] = "BYTE_STREAM_SPLIT"
+        elif dtype.kind in "iuM" and var.ndim == 1 and (np.diff(sample) >= 0).all():
+            column_encoding[name] = "DELTA_BINARY_PACKED"
+    return {"use_dictionary": use_dictionary, "column_encoding": column_encoding}
+
+
+def _sample_values(var: xr.Variable, sample_size: int) -> np.ndarray:
+    """Returns up to about `sample_size` values of the variable, taken from evenly
+    spaced positions along its leading dimension so that only those are read."""
+    rows = max(1, sample_size * var.shape[0] // max(var.size, 1))
+    step = max(1, var.shape[0] // rows)
+    return np.asarray(var[slice(None, None, step)].values).reshape(-1)
+
+
+def _check_engine(engine: str) -> str:
+    if engine not in ("pandas", "arrow"):
+        raise ValueError(f"engine must be 'pandas' or 'arrow', not '{engine}'")
+    return engine
+
+
+def _check_time_partition(time_partition: str | None) -> str | None:
+    units = {"day": "D", "month": "M", "year": "Y", None: None}
+    if time_partition not in units:
+        raise ValueError(
+            "time_partition must be 'day', 'month', 'year' or None, not"
+            f" '{time_partition}'"
+        )
+    return units[time_partition]
+
+
+def _get_partition_name(dim_group: tuple[str, ...]) -> str:
+    return f"dim_group={'.'.join(dim_group) or 'scalar'}"
+
+
+def _conform_to_schema(table: pa.Table, group_dir: OutputPath) -> pa.Table:
+    """Returns the table with the schema stored for its dimension group, or as-is if
+    the group has no stored schema yet.
+
+    Columns missing from the table are filled with nulls and the others are cast to the
+    stored types. Columns that are not in the stored schema raise a ValueError."""
+    schema_path = group_dir / "_common_metadata"
+    if not _exists(schema_path):
+        return table
+
+    with _open_input(schema_path) as source:
+        schema = pq.read_schema(source)
+    extra_columns = set(table.column_names) - set(schema.names)
+    if extra_columns:
+        raise ValueError(
+            f"Columns {sorted(extra_columns)} are not in the schema of the parquet"
+            f" dataset at '{group_dir}'"
+        )
+    columns = [
+        (
+            table[field.name].cast(field.type)
+            if field.name in table.column_names
+            else pa.nulls(len(table), field.type)
+        )
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _split_by_time(
+    table: pa.Table, group_dir: OutputPath, unit: str | None
+) -> Iterator[tuple[OutputPath, pa.Table]]:
+    """Yields the hive partition folder and rows of each period (of the given datetime64
+    unit) in the table's time column, or the whole table if unit is None."""
+    if unit is None:
+        yield group_dir, table
+        return
+
+    periods = table["time"].to_numpy().astype(f"datetime64[{unit}]")
+    missing = np.isnat(periods)
+    for period in np.unique(periods[~missing]):
+        partition = table.filter(pa.array(periods == period))
+        yield group_dir / f"date={np.datetime_as_string(period)}", partition
+    if missing.any():
+        # The name hive-partitioned readers use for null partition values
+        partition = table.filter(pa.array(missing))
+        yield group_dir / "date=__HIVE_DEFAULT_PARTITION__", partition
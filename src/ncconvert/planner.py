@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import math
+import re
+from typing import Any
+
+import numpy as np
+import xarray as xr
+
+from .utils import _get_dimension_groups, _get_faceted_dimension_groups
+
+# Building a DataFrame holds the variables' data and the DataFrame at the same time,
+# so peak memory is estimated as this many times the size of the DataFrame.
+MEMORY_OVERHEAD = 2
+
+# The keyword argument each converter takes to convert in chunks of about N rows
+CHUNK_KWARGS = {
+    "to_csv": "chunk_size",
+    "to_csv_collection": "chunk_size",
+    "to_faceted_dim_csv": "chunk_size",
+    "to_parquet": "row_group_size",
+    "to_parquet_collection": "row_group_size",
+    "to_long_csv": "chunk_size",
+    "to_long_parquet": "row_group_size",
+    "to_arrow_ipc": "chunk_size",
+    "to_arrow_ipc_collection": "chunk_size",
+    "to_feather": "chunk_size",
+    "to_feather_collection": "chunk_size",
+}
+
+# The converter that writes one file per dimension group instead of the cartesian
+# product of every dimension
+SPLIT_METHODS = {
+    "to_csv": "to_csv_collection",
+    "to_parquet": "to_parquet_collection",
+    "to_arrow_ipc": "to_arrow_ipc_collection",
+    "to_feather": "to_feather_collection",
+}
+
+
+class MemoryLimitError(MemoryError):
+    """Raised when converting a dataset is estimated to need more memory than allowed."""
+
+
+def estimate_conversion(dataset: xr.Dataset, method: str) -> dict[str, Any]:
+    """Estimates the size of the DataFrame(s) a converter would build for the dataset
+    using only its dimension sizes and dtypes, without reading any data.
+
+    Args:
+        dataset (xr.Dataset): The dataset to convert.
+        method (str): The name of the converter, e.g., "to_csv".
+
+    Returns:
+        dict[str, Any]: The estimated "rows", "columns" and in-memory "bytes" of each of
+            the "outputs", their totals, and the "peak_bytes" of memory the conversion
+            is estimated to need when it is not chunked.
+    """
+    if method == "to_faceted_dim_csv":
+        outputs = [_estimate_faceted(dataset)]
+    elif method.startswith("to_long_"):
+        outputs = [_estimate_long(dataset)]
+    elif method.endswith("_collection") or method == "to_parquet_dataset":
+        outputs = [
+            _estimate_table(dataset, variable_names, dims)
+            for dims, variable_names in _get_dimension_groups(dataset).items()
+        ]
+    else:
+        variable_names = [str(v) for v in dataset.data_vars]
+        outputs = [_estimate_table(dataset, variable_names, tuple(dataset.dims))]
+
+    total_bytes = sum(output["bytes"] for output in outputs)
+    return {
+        "rows": sum(output["rows"] for output in outputs),
+        "columns": sum(output["columns"] for output in outputs),
+        "bytes": total_bytes,
+        # Collections build every DataFrame before writing any of them
+        "peak_bytes": MEMORY_OVERHEAD * total_bytes,
+        "outputs": outputs,
+    }
+
+
+def plan_conversion(
+    dataset: xr.Dataset,
+    method: str,
+    memory_limit: int | None = None,
+    on_memory_limit: str = "chunk",
+) -> dict[str, Any]:
+    """Decides how to convert the dataset so it fits within a memory limit.
+
+    Args:
+        dataset (xr.Dataset): The dataset to convert.
+        method (str): The name of the converter, e.g., "to_csv".
+        memory_limit (int | None, optional): The number of bytes the conversion may
+            use. Defaults to None (no limit).
+        on_memory_limit (str, optional): What to do if converting the dataset in one go
+            is estimated to use more than `memory_limit`. "refuse" refuses to convert
+            it. "chunk" converts it in chunks small enough to fit, if the converter
+            supports it. "split" first switches to writing one file per dimension group
+            (e.g., to_csv_collection instead of to_csv) and then chunks that if needed.
+            Defaults to "chunk".
+
+    Returns:
+        dict[str, Any]: The estimate from `estimate_conversion`, with the "method" to
+            use, the "strategy" ("default", "chunk", "split" or "refuse") and the extra
+            "kwargs" to pass to the converter.
+    """
+    if on_memory_limit not in ("refuse", "chunk", "split"):
+        raise ValueError(
+            "on_memory_limit must be 'refuse', 'chunk' or 'split', not"
+            f" '{on_memory_limit}'"
+        )
+
+    estimate = estimate_conversion(dataset, method)
+    plan = {"method": method, "strategy": "default", "kwargs": {}, **estimate}
+    if memory_limit is None or estimate["peak_bytes"] <= memory_limit:
+        return plan
+    if on_memory_limit == "refuse":
+        return {**plan, "strategy": "refuse"}
+
+    if on_memory_limit == "split" and method in SPLIT_METHODS:
+        method = SPLIT_METHODS[method]
+        estimate = estimate_conversion(dataset, method)
+        plan = {"method": method, "strategy": "split", "kwargs": {}, **estimate}
+        if estimate["peak_bytes"] <= memory_limit:
+            return plan
+
+    if method not in CHUNK_KWARGS:
+        return {**plan, "strategy": "refuse"}
+
+    # Chunks are sliced from each output separately; size them by the widest one. Two
+    # chunks are in memory at once, see `ncconvert.utils._iter_loaded_slices`
+    bytes_per_row = max(o["bytes"] / max(o["rows"], 1) for o in estimate["outputs"])
+    chunk_rows = memory_limit // (2 * MEMORY_OVERHEAD * max(bytes_per_row, 1))
+    return {
+        **plan,
+        "strategy": "chunk" if plan["strategy"] == "default" else plan["strategy"],
+        "kwargs": {CHUNK_KWARGS[method]: max(int(chunk_rows), 1)},
+        "peak_bytes": min(
+            estimate["peak_bytes"],
+            int(2 * MEMORY_OVERHEAD * bytes_per_row * max(chunk_rows, 1)),
+        ),
+    }
+
+
+def _estimate_group_memory(
+    dataset: xr.Dataset,
+    dim_groups: dict[tuple[str, ...], list[str]],
+    chunk_size: int | None = None,
+) -> list[int]:
+    """Estimates the peak memory of building and writing each dimension group of a
+    collection, in the order of `dim_groups`. With `chunk_size`, two slices of about
+    that many rows are held at a time (see `ncconvert.utils._iter_loaded_slices`)."""
+    peaks = []
+    for dims, variable_names in dim_groups.items():
+        estimate = _estimate_table(dataset, variable_names, dims)
+        if chunk_size and estimate["rows"]:
+            bytes_per_row = estimate["bytes"] / estimate["rows"]
+            estimate["bytes"] = min(estimate["bytes"], 2 * chunk_size * bytes_per_row)
+        peaks.append(int(MEMORY_OVERHEAD * estimate["bytes"]))
+    return peaks
+
+
+def _estimate_table(
+    dataset: xr.Dataset, variable_names: list[str], dims: tuple[str, ...]
+) -> dict[str, Any]:
+    # Matches Dataset.to_dataframe(): one row per element of the cartesian product of
+    # the dims, one column per variable and one index level per dim
+    rows = math.prod(dataset.sizes[d] for d in dims)
+    row_bytes = sum(_itemsize(dataset[v].dtype) for v in variable_names)
+    row_bytes += sum(
+        _itemsize(dataset[d].dtype) if d in dataset.coords else 8 for d in dims
+    )
+    return {
+        "dims": list(dims),
+        "rows": rows,
+        "columns": len(variable_names),
+        "bytes": rows * row_bytes,
+    }
+
+
+def _estimate_faceted(dataset: xr.Dataset) -> dict[str, Any]:
+    # One row per time step; 2D variables get a column per value of their other dim
+    rows = dataset.sizes["time"]
+    columns = 0
+    row_bytes = _itemsize(dataset["time"].dtype)
+    for dims, variable_names in _get_faceted_dimension_groups(dataset).items():
+        other_dims = [d for d in dims if d != "time"]
+        width = dataset.sizes[other_dims[0]] if len(dims) == 2 else 1
+        columns += width * len(variable_names)
+        row_bytes += width * sum(_itemsize(dataset[v].dtype) for v in variable_names)
+    return {
+        "dims": ["time"],
+        "rows": rows,
+        "columns": columns,
+        "bytes": rows * row_bytes,
+    }
+
+
+def _estimate_long(dataset: xr.Dataset) -> dict[str, Any]:
+    # One row per value of each variable, see `ncconvert.utils._to_long_tables`. The
+    # variable column is dictionary-encoded, so it is counted as 4 bytes per row
+    names = [n for n in dataset.variables if n not in dataset.dims]
+    rows = sum(dataset[n].size for n in names)
+    value_bytes = max((_itemsize(dataset[n].dtype) for n in names), default=8)
+    dims_bytes = sum(
+        _itemsize(dataset[d].dtype) if d in dataset.coords else 8 for d in dataset.dims
+    )
+    return {
+        "dims": [str(d) for d in dataset.dims],
+        "rows": rows,
+        "columns": 2 + len(dataset.dims),
+        "bytes": rows * (4 + dims_bytes + value_bytes),
+    }
+
+
+def _itemsize(dtype: np.dtype) -> int:
+    # Strings become python objects in pandas; count the pointer and a short string
+    if dtype.kind in "OUS":
+        return 8 + 50
+    return dtype.itemsize
+
+
+def _parse_size(value: str) -> int:
+    """Parses a number of bytes with an optional unit, e.g., '4GB', '512MiB' or
+    '1000000'."""
+    units = {
+        "": 1,
+        "b": 1,
+        "kb": 1000,
+        "mb": 1000**2,
+        "gb": 1000**3,
+        "tb": 1000**4,
+        "kib": 1024,
+        "mib": 1024**2,
+        "gib": 1024**3,
+        "tib": 1024**4,
+    }
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", value)
+    if match is None or match.group(2).lower() not in units:
+        raise ValueError(f"Could not parse size '{value}'")
+    return int(float(match.group(1)) * units[match.group(2).lower()])
+
+
+def _format_size(n_bytes: int) -> str:
+    size = float(n_bytes)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sized
+
+
+class Profiler:
+    """Records the wall time, peak memory, rows, columns and bytes written by each stage
+    of converting a dataset.
+
+    Pass a profiler to any converter with the `profiler` keyword argument. Converters
+    record the "to_dataframe", "write" and "metadata" stages (for streamed conversions
+    the dataframe chunks are built while writing, so both are recorded as "write").
+    Peak memory is measured with tracemalloc, which is only started while the profiler
+    is in use as a context manager, plus the peak of pyarrow's allocations, which
+    tracemalloc doesn't see (also recorded on their own as "arrow_memory"). Memory
+    allocated by other native libraries (e.g., netCDF) isn't counted. The groups of a
+    collection are written one at a time (ignoring `group_workers`) so that each
+    stage's peak is its own. Without a profiler, converters use `NULL_PROFILER`, which
+    records nothing.
+
+    Example:
+        with Profiler("data.nc") as profiler:
+            to_csv(dataset, "data.csv", profiler=profiler)
+        print(profiler.report())
+
+    Args:
+        file (str | Path | None, optional): The input file the stages belong to.
+            Defaults to None.
+    """
+
+    def __init__(self, file: str | Path | None = None):
+        self.file = str(file) if file is not None else None
+        self.stages: list[dict[str, Any]] = []
+        self._started_tracing = False
+
+    def __enter__(self) -> Profiler:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str, **info: Any) -> Iterator[dict[str, Any]]:
+        """Times the block and yields its record so the caller can fill in the rows,
+        columns and bytes it handled. Stages should not be nested."""
+        record: dict[str, Any] = {
+            "stage": name,
+            **info,
+            "rows": None,
+            "columns": None,
+            "bytes": None,
+        }
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            arrow_monitor = _ArrowMemoryMonitor()
+            memory_before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+            else:
+                # Without reset_peak, the peak since tracing started is reported
+                memory_before = 0
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - start
+            record["peak_memory"] = record["arrow_memory"] = None
+            if tracing:
+                record["arrow_memory"] = arrow_monitor.stop()
+                record["peak_memory"] = (
+                    max(tracemalloc.get_traced_memory()[1] - memory_before, 0)
+                    + record["arrow_memory"]
+                )
+            self.stages.append(record)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "file": self.file,
+            "wall_time": sum(s["wall_time"] for s in self.stages),
+            "peak_memory": max((s["peak_memory"] or 0 for s in self.stages), default=0),
+            "stages": self.stages,
+        }
+
+
+class _ArrowMemoryMonitor:
+    """Measures the peak of pyarrow's allocations from when it is created until `stop`
+    is called, which tracemalloc doesn't see.
+
+    pyarrow's memory pool only keeps its peak since the process started, so that is
+    exact whenever the peak is exceeded; otherwise, the pool's usage is sampled."""
+
+    def __init__(self, interval: float = 0.005):
+        import pyarrow as pa
+
+        self._pool = pa.default_memory_pool()
+        self._before = self._peak = self._pool.bytes_allocated()
+        self._max_before = self._pool.max_memory()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sample, args=(interval,), name="ncconvert-arrow-memory"
+        )
+        self._thread.start()
+
+    def stop(self) -> int:
+        """Returns how many bytes pyarrow allocated at the peak beyond what it held
+        when the monitor was created."""
+        self._stopped.set()
+        self._thread.join()
+        peak = max(self._peak, self._pool.bytes_allocated())
+        if self._pool.max_memory() > self._max_before:
+            peak = max(peak, self._pool.max_memory())
+        return max(peak - self._before, 0)
+
+    def _sample(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self._peak = max(self._peak, self._pool.bytes_allocated())
+
+
+class _NullProfiler:
+    _record: dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str, **info: Any) -> Iterator[dict[str, Any]]:
+        # Callers may write to the record; it is shared and never read
+        yield self._record
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def _get_profiler(kwargs: dict[str, Any]) -> Profiler | _NullProfiler:
+    return kwargs.get("profiler") or NULL_PROFILER
+
+
+def _get_group_workers(kwargs: dict[str, Any]) -> int:
+    """The number of threads to write the groups of a collection with. While profiling,
+    groups are written one at a time: tracemalloc's peak is shared by every thread, so
+    concurrent stages would reset and count each other's memory."""
+    if isinstance(kwargs.get("profiler"), Profiler):
+        return 1
+    return kwargs.get("group_workers") or 1
+
+
+def _count_rows(chunks: Iterable[Any], record: dict[str, Any]) -> Iterator[Any]:
+    """Passes DataFrame or pyarrow Table chunks through, adding up their rows in the
+    stage record."""
+    record["rows"] = 0
+    for chunk in chunks:
+        record["rows"] += len(chunk)
+        record["columns"] = chunk.shape[1]
+        yield chunk
+
+
+def _describe(record: dict[str, Any], table: Sized) -> None:
+    record["rows"] = len(table)
+    record["columns"] = table.shape[1]  # type: ignore
+
+
+def _summarize(reports: list[dict[str, Any]], top: int = 5) -> str:
+    """Formats a table of the slowest files and the total time spent in each stage."""
+    lines = [
+        f"Slowest {min(top, len(reports))} file(s) (wall time, peak Python and pyarrow"
+        " memory):"
+    ]
+    slowest = sorted(reports, key=lambda r: r["wall_time"], reverse=True)[:top]
+    for report in slowest:
+        lines.append(
+            f"  {report['wall_time']:>9.3f} s {report['peak_memory'] / 2**20:>9.1f} MiB"
+            f"  {report['file']}"
+        )
+
+    totals: dict[str, dict[str, float]] = defaultdict(
+        lambda: {"wall_time": 0.0, "bytes": 0, "count": 0}
+    )
+    for report in reports:
+        for stage in report["stages"]:
+            totals[stage["stage"]]["wall_time"] += stage["wall_time"]
+            totals[stage["stage"]]["bytes"] += stage["bytes"] or 0
+            totals[stage["stage"]]["count"] += 1
+
+    lines.append("Time per stage:")
+    for name, total in sorted(totals.items(), key=lambda t: -t[1]["wall_time"]):
+        lines.append(
+            f"  {total['wall_time']:>9.3f} s {total['bytes'] / 2**20:>9.1f} MiB"
+            f"  {name} (x{total['count']:.0f})"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import sys
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterator,
+    Mapping,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+# Packages can add converters by declaring entry points in this group, e.g., in their
+# pyproject.toml:
+#
+#   [project.entry-points."ncconvert.converters"]
+#   to_excel = "my_package.excel:to_excel"
+ENTRY_POINT_GROUP = "ncconvert.converters"
+
+
+class Converter(Protocol):
+    def __call__(
+        self,
+        dataset: xr.Dataset,
+        filepath: Union[Path, str],
+        metadata: bool = False,
+        **kwargs: Optional[Any],
+    ) -> Tuple[Union[Tuple[Path, ...], Path], Optional[Path]]: ...
+
+
+# The converters that ship with ncconvert, as "module:function" so that a format's
+# dependencies are only imported once one of its converters is used
+_BUILTIN_CONVERTERS = {
+    "to_csv": "ncconvert.csv:to_csv",
+    "to_faceted_dim_csv": "ncconvert.csv:to_faceted_dim_csv",
+    "to_csv_collection": "ncconvert.csv:to_csv_collection",
+    "to_long_csv": "ncconvert.csv:to_long_csv",
+    "to_parquet": "ncconvert.parquet:to_parquet",
+    "to_parquet_collection": "ncconvert.parquet:to_parquet_collection",
+    "to_parquet_dataset": "ncconvert.parquet:to_parquet_dataset",
+    "to_long_parquet": "ncconvert.parquet:to_long_parquet",
+    "to_arrow_ipc": "ncconvert.arrow:to_arrow_ipc",
+    "to_arrow_ipc_collection": "ncconvert.arrow:to_arrow_ipc_collection",
+    "to_feather": "ncconvert.arrow:to_feather",
+    "to_feather_collection": "ncconvert.arrow:to_feather_collection",
+}
+
+
+class ConverterRegistry(Mapping[str, Converter]):
+    """A mapping of converter names to converters.
+
+    Holds the built-in converters, converters registered with `register`, and
+    converters declared by installed packages under the "ncconvert.converters" entry
+    point group. Entry points are discovered the first time the registry is used, and a
+    converter's module is only imported the first time that converter is looked up.
+    Built-in and registered converters take precedence over entry points with the same
+    name.
+    """
+
+    def __init__(self, converters: Mapping[str, str | Converter] | None = None):
+        self._converters: dict[str, str | Converter | Any] = dict(converters or {})
+        self._discovered = False
+
+    def register(self, name: str, converter: str | Converter) -> None:
+        """Adds a converter, given as a callable or as a "module:function" string."""
+        self._converters[name] = converter
+
+    def __getitem__(self, name: str) -> Converter:
+        self._discover()
+        converter = self._converters[name]
+        if isinstance(converter, str) or hasattr(converter, "load"):
+            converter = self._converters[name] = _load(converter)
+        return converter
+
+    def __iter__(self) -> Iterator[str]:
+        self._discover()
+        return iter(self._converters)
+
+    def __len__(self) -> int:
+        self._discover()
+        return len(self._converters)
+
+    def __contains__(self, name: object) -> bool:
+        self._discover()
+        return name in self._converters
+
+    def _discover(self) -> None:
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in _get_entry_points(ENTRY_POINT_GROUP):
+            if entry_point.name in self._converters:
+                logger.warning(
+                    "Ignoring converter entry point '%s' (%s); a converter with that"
+                    " name is already registered",
+                    entry_point.name,
+                    entry_point.value,
+                )
+                continue
+            self._converters[entry_point.name] = entry_point
+
+
+def _load(converter: Any) -> Callable[..., Any]:
+    if hasattr(converter, "load"):  # An importlib.metadata.EntryPoint
+        return converter.load()
+    module_name, _, function_name = str(converter).partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _get_entry_points(group: str) -> list[Any]:
+    from importlib.metadata import entry_points
+
+    if sys.version_info >= (3, 10):
+        return list(entry_points(group=group))
+    return list(entry_points().get(group, []))  # type: ignore
+
+
+CONVERTERS = ConverterRegistry(_BUILTIN_CONVERTERS)
+
+
+def register(name: str, converter: str | Converter) -> None:
+    """Registers a converter so it can be used by name from the CLI, e.g.,
+    `register("to_excel", "my_package.excel:to_excel")`."""
+    CONVERTERS.register(name, converter)
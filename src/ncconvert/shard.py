@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Sequence
+
+# Lock files are kept in this folder of the output dir, one per input file name
+LOCK_DIRNAME = ".ncconvert-locks"
+
+# Locks older than this are assumed to be left behind by a process that was killed
+STALE_LOCK_AGE = 24 * 60 * 60
+
+
+class FileLockedError(Exception):
+    """Raised when another process holds the lock on an input file."""
+
+
+def _shard_files(
+    files: Sequence[Path], index: int, count: int, by: str = "hash"
+) -> list[Path]:
+    """Returns the files that shard `index` of `count` should convert.
+
+    Every file is assigned to exactly one shard, and the assignment only depends on the
+    files themselves, so nodes that are given the same inputs agree on it without
+    talking to each other. With "hash", a file's shard is the sha1 hash of its name
+    modulo `count`: files with the same name (which are written to the same outputs) go
+    to the same shard, and a file keeps its shard when others are added. With "size",
+    files are handed out largest first to the shard with the fewest bytes so far, which
+    balances the bytes per shard but needs every node to see the same files and sizes.
+    The files keep their order within each shard.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} is not in the range [0, {count})")
+    if by == "hash":
+        return [f for f in files if _hash_name(f.name) % count == index]
+    if by == "size":
+        sizes = {f: f.stat().st_size for f in files}
+        loads = [0] * count
+        assigned: set[Path] = set()
+        for file in sorted(sizes, key=lambda f: (-sizes[f], f.name, str(f))):
+            shard = min(range(count), key=lambda i: (loads[i], i))
+            loads[shard] += sizes[file]
+            if shard == index:
+                assigned.add(file)
+        return [f for f in files if f in assigned]
+    raise ValueError(f"Shards must be assigned by 'hash' or 'size', not '{by}'")
+
+
+def _hash_name(name: str) -> int:
+    # Python's hash() of a str is salted per process, so it can't be used here
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big")
+
+
+def _acquire_lock(
+    lock_dir: Path, file: Path, stale_after: float = STALE_LOCK_AGE
+) -> Path:
+    """Creates the lock file of an input file and returns its path, or raises a
+    FileLockedError if another process holds it.
+
+    Locks are created with O_EXCL, so only one process can create each one. A lock is
+    broken if it is older than `stale_after` seconds, or if it was taken on this host
+    by a process that no longer exists (see `_break_lock`)."""
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = _get_lock_path(lock_dir, file)
+    if _create_lock(lock_path):
+        return lock_path
+    if (
+        _is_stale(lock_path, stale_after)
+        and _break_lock(lock_path, stale_after)
+        and _create_lock(lock_path)
+    ):
+        return lock_path
+    raise FileLockedError(f"{file.name} is being converted by another process")
+
+
+def _get_lock_path(lock_dir: Path, file: Path) -> Path:
+    # Keyed by name, like the outputs, so inputs that would overwrite each other's
+    # outputs also share a lock
+    return lock_dir / f"{file.name}.lock"
+
+
+def _release_lock(lock_path: Path) -> None:
+    try:
+        lock_path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _break_lock(lock_path: Path, stale_after: float) -> bool:
+    """Moves a lock that was found to be stale aside, and returns whether it was.
+
+    Several processes may find the same stale lock, and one of them may have broken it
+    and taken a fresh lock by the time another gets to it. The lock is therefore
+    renamed (which is atomic) instead of removed, checked again, and put back if it
+    turns out to be a fresh one."""
+    moved_path = lock_path.with_name(f"{lock_path.name}.stale.{uuid.uuid4().hex[:8]}")
+    try:
+        os.rename(lock_path, moved_path)
+    except FileNotFoundError:
+        return True  # Already removed, so the lock can be created
+    try:
+        if _is_stale(moved_path, stale_after):
+            return True
+        try:
+            # Linking fails if yet another process has created the lock since
+            os.link(moved_path, lock_path)
+        except FileExistsError:
+            pass
+        return False
+    finally:
+        moved_path.unlink()
+
+
+def _create_lock(lock_path: Path) -> bool:
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump({"host": socket.gethostname(), "pid": os.getpid()}, f)
+    return True
+
+
+def _is_stale(lock_path: Path, stale_after: float) -> bool:
+    try:
+        if time.time() - lock_path.stat().st_mtime > stale_after:
+            return True
+        owner = json.loads(lock_path.read_text())
+    except FileNotFoundError:
+        return True
+    except ValueError:
+        return False  # Still being written by the process that created it
+    if owner.get("host") != socket.gethostname():
+        return False
+    try:
+        os.kill(owner["pid"], 0)
+    except OSError as e:
+        return e.errno == errno.ESRCH
+    return False
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import IO, TYPE_CHECKING, Any, Iterator, Union
+
+if TYPE_CHECKING:
+    import fsspec
+
+
+class _URL(str):
+    """An fsspec URL, e.g., "s3://bucket/folder/name.csv", with the parts of the
+    pathlib.Path interface the converters use to derive output paths from each other.
+
+    Being a str, it is returned to callers as the URL itself. Paths derived from it
+    keep its storage options (the keyword arguments for the fsspec filesystem)."""
+
+    storage_options: dict[str, Any]
+
+    def __new__(cls, url: str, storage_options: dict[str, Any] | None = None) -> _URL:
+        obj = super().__new__(cls, url)
+        obj.storage_options = storage_options or {}
+        return obj
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return _URL, (str(self), self.storage_options)
+
+    @property
+    def name(self) -> str:
+        return self._split()[1]
+
+    @property
+    def parent(self) -> _URL:
+        folder, name = self._split()
+        return self._derive(folder) if name else self
+
+    def with_name(self, name: str) -> _URL:
+        return self._derive(f"{self._split()[0]}/{name}")
+
+    def with_suffix(self, suffix: str) -> _URL:
+        # PurePosixPath decides what the suffix is, so names are derived like Path's
+        return self.with_name(PurePosixPath(self.name).with_suffix(suffix).name)
+
+    def relative_to(self, other: str) -> PurePosixPath:
+        prefix = str(other).rstrip("/") + "/"
+        if not self.startswith(prefix):
+            raise ValueError(f"'{self}' is not in '{other}'")
+        return PurePosixPath(self[len(prefix) :])
+
+    def __truediv__(self, name: str) -> _URL:
+        return self._derive(f"{self.rstrip('/')}/{name}")
+
+    def get_filesystem(self) -> tuple[fsspec.AbstractFileSystem, str]:
+        """Returns the fsspec filesystem of the URL and the path on it. Filesystems are
+        cached by fsspec, so this is cheap to call for every file."""
+        from fsspec.core import url_to_fs
+
+        return url_to_fs(str(self), **self.storage_options)
+
+    def _split(self) -> tuple[str, str]:
+        scheme, _, path = self.partition("://")
+        folder, _, name = path.rstrip("/").rpartition("/")
+        return f"{scheme}://{folder}", name
+
+    def _derive(self, url: str) -> _URL:
+        return _URL(url, self.storage_options)
+
+
+# Where an output is written: a local path or a URL of any fsspec filesystem
+OutputPath = Union[Path, _URL]
+
+# How many seconds `_hold_lock` waits for a lock held by another process
+LOCK_TIMEOUT = 60.0
+
+
+def _is_url(filepath: Any) -> bool:
+    return isinstance(filepath, str) and "://" in filepath
+
+
+def _as_path(filepath: str | Path, kwargs: dict[str, Any] | None = None) -> Any:
+    """Returns `filepath` as a Path, or as a `_URL` if it is a URL (e.g.,
+    "s3://bucket/name.csv"), with the storage_options in `kwargs` if there are any.
+
+    Typed as Any since the converters treat both the same way; see `OutputPath`."""
+    storage_options = (kwargs or {}).get("storage_options")
+    if isinstance(filepath, _URL) and storage_options is None:
+        return filepath
+    if _is_url(filepath):
+        return _URL(str(filepath), storage_options)
+    return Path(filepath)
+
+
+@contextmanager
+def _atomic_write(filepath: str | Path) -> Iterator[Path]:
+    """Yields a temporary path next to `filepath` to write to, which is renamed to
+    `filepath` only if the block completes. An interrupted or failed write therefore
+    never leaves a partial file at `filepath`."""
+    filepath = Path(filepath)
+    tmp_path = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, filepath)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _as_local(filepath: OutputPath) -> OutputPath:
+    """Returns `file://` URLs as local paths, and other paths as they are."""
+    if isinstance(filepath, _URL):
+        from fsspec.implementations.local import LocalFileSystem
+
+        fs, path = filepath.get_filesystem()
+        if isinstance(fs, LocalFileSystem):
+            return Path(path)
+    return filepath
+
+
+@contextmanager
+def _open_output(filepath: OutputPath) -> Iterator[Path | IO[bytes]]:
+    """Yields what to write an output to: a temporary path for local files (see
+    `_atomic_write`), or a buffered binary file for URLs.
+
+    Files on fsspec filesystems are written to their final path as they are streamed,
+    one block at a time (e.g., as the parts of a multipart upload to S3), without a
+    local copy. Object stores only make an upload visible once it completes, so if the
+    block fails the upload is discarded and any earlier version of the file is kept.
+    `file://` URLs are written like local paths. pandas and pyarrow accept both kinds
+    of targets."""
+    filepath = _as_local(filepath)
+    if not isinstance(filepath, _URL):
+        with _atomic_write(filepath) as tmp_path:
+            yield tmp_path
+        return
+
+    from fsspec.spec import AbstractBufferedFile
+
+    fs, path = filepath.get_filesystem()
+    f = fs.open(path, "wb")
+    try:
+        yield f
+    except BaseException:
+        f.discard()  # e.g., aborts the multipart upload on S3
+        if isinstance(f, AbstractBufferedFile):
+            # Closing the file, even when it's garbage collected, completes the upload
+            f.closed = True
+        raise
+    f.close()
+
+
+@contextmanager
+def _open_input(filepath: OutputPath) -> Iterator[Path | IO[bytes]]:
+    """Yields what to read an output that was written earlier from: the path itself
+    for local files, or a buffered binary file for URLs."""
+    if not isinstance(filepath, _URL):
+        yield filepath
+        return
+    fs, path = filepath.get_filesystem()
+    with fs.open(path, "rb") as f:
+        yield f
+
+
+def _write_bytes(filepath: OutputPath, data: bytes) -> int:
+    with _open_output(filepath) as sink:
+        if isinstance(sink, Path):
+            return sink.write_bytes(data)
+        return sink.write(data)
+
+
+def _read_bytes(filepath: OutputPath) -> bytes:
+    if not isinstance(filepath, _URL):
+        return filepath.read_bytes()
+    fs, path = filepath.get_filesystem()
+    return fs.cat_file(path)
+
+
+def _makedirs(folder: OutputPath) -> None:
+    if not isinstance(folder, _URL):
+        folder.mkdir(parents=True, exist_ok=True)
+        return
+    fs, path = folder.get_filesystem()
+    fs.makedirs(path, exist_ok=True)
+
+
+def _exists(filepath: OutputPath) -> bool:
+    if not isinstance(filepath, _URL):
+        return filepath.exists()
+    fs, path = filepath.get_filesystem()
+    return fs.exists(path)
+
+
+def _get_size(filepath: OutputPath) -> int:
+    if not isinstance(filepath, _URL):
+        return filepath.stat().st_size
+    fs, path = filepath.get_filesystem()
+    return fs.size(path)
+
+
+def _remove(filepath: OutputPath) -> None:
+    if not isinstance(filepath, _URL):
+        filepath.unlink(missing_ok=True)
+        return
+    fs, path = filepath.get_filesystem()
+    if fs.exists(path):
+        fs.rm(path)
+
+
+def _create_exclusive(filepath: OutputPath, data: bytes) -> bool:
+    """Writes `data` to `filepath` and returns True, or returns False if the file
+    already exists. If several processes create the same file at once, only one of
+    them succeeds, and the file is never seen partially written."""
+    filepath = _as_local(filepath)
+    if not isinstance(filepath, _URL):
+        # Linking a complete temporary file fails if the target exists, unlike renaming
+        tmp_path = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex[:8]}.tmp")
+        tmp_path.write_bytes(data)
+        try:
+            os.link(tmp_path, filepath)
+        except FileExistsError:
+            return False
+        finally:
+            tmp_path.unlink()
+        return True
+    fs, path = filepath.get_filesystem()
+    try:
+        # e.g., a conditional put on S3, which only succeeds if the key doesn't exist
+        with fs.open(path, "xb") as f:
+            f.write(data)
+    except FileExistsError:
+        return False
+    return True
+
+
+@contextmanager
+def _hold_lock(lock_path: OutputPath, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """Waits until the lock file at `lock_path` can be created, and removes it once the
+    block completes. Raises a TimeoutError after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while not _create_exclusive(lock_path, b""):
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"Timed out waiting for the lock '{lock_path}'; remove it if it was"
+                " left behind by a process that was killed"
+            )
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        _remove(lock_path)
@@ -1,46 +1,443 @@
 from __future__ import annotations
 
+import hashlib
+import itertools
 import json
 import logging
-from collections import defaultdict
+import math
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Iterator, Sequence, TypeVar
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import xarray as xr
 
+from .profiling import _get_profiler
+from .storage import (
+    OutputPath,
+    _as_path,
+    _exists,
+    _read_bytes,
+    _write_bytes,
+)
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def _dump_metadata(
+    dataset: xr.Dataset, filepath: str | Path, **kwargs: Any
+) -> OutputPath:
+    """Writes the dataset's metadata to a .json file next to `filepath`.
 
-def _dump_metadata(dataset: xr.Dataset, filepath: str | Path) -> Path:
-    metadata = dataset.to_dict(data=False, encoding=True)
-    metadata_json = json.dumps(metadata, default=str, indent=4)
-    metadata_path = Path(filepath).with_suffix(".json")
-    metadata_path.write_text(metadata_json)
+    Keyword arguments are the metadata options accepted by every converter:
+
+    - shared_metadata (bool): Write metadata shared by every dataset with the same
+      structure (see `_get_metadata_fingerprint`) to a single `_schema.<hash>.json`
+      file in the output folder, and only the values that differ from it (e.g.,
+      history or dimension sizes) to the per-file .json. Use `load_metadata` to read
+      the combined metadata back. Defaults to False.
+    - json_backend (str): "json" or "orjson". orjson is faster but must be installed
+      separately. Defaults to "json".
+    - compact_json (bool): Write json without indentation or extra whitespace.
+      Defaults to False.
+    - profiler (Profiler | None): Records the time taken as the "metadata" stage.
+    """
+    dumps = _get_json_encoder(
+        kwargs.get("json_backend", "json"), kwargs.get("compact_json", False)
+    )
+    metadata_path = _as_path(filepath, kwargs).with_suffix(".json")
+    with _get_profiler(kwargs).stage("metadata") as stage:
+        metadata = dataset.to_dict(data=False, encoding=True)
+        if kwargs.get("shared_metadata"):
+            metadata = _share_metadata(metadata, metadata_path.parent, dumps)
+        stage["bytes"] = _write_bytes(metadata_path, dumps(metadata))
     return metadata_path
 
 
+def load_metadata(
+    filepath: str | Path, storage_options: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """Reads a metadata .json file written by any of the converters.
+
+    If the metadata was written with shared_metadata=True, the shared schema file it
+    refers to is read as well and the per-file values are applied on top of it, giving
+    the same metadata that would otherwise have been written.
+
+    Args:
+        filepath (str | Path): The path or fsspec URL of the metadata .json file.
+        storage_options (dict[str, Any] | None, optional): Keyword arguments for the
+            fsspec filesystem of a URL, e.g., credentials. Defaults to None.
+
+    Returns:
+        dict[str, Any]: The dataset metadata.
+    """
+    filepath = _as_path(filepath, {"storage_options": storage_options})
+    metadata = json.loads(_read_bytes(filepath))
+    if set(metadata) != {"schema", "changes"}:
+        return metadata
+    shared = json.loads(_read_bytes(filepath.parent / metadata["schema"]))
+    return _apply_metadata_changes(shared, metadata["changes"])
+
+
+def open_dataset(
+    filepath: str | Path,
+    engine: str | None = None,
+    chunk_cache: int | None = None,
+    mmap: bool | None = None,
+    **kwargs: Any,
+) -> xr.Dataset:
+    """Opens a netCDF file with xr.open_dataset(), with options for how it is read.
+
+    Args:
+        filepath (str | Path): The netCDF file to open.
+        engine (str | None, optional): The library to read the file with: "netcdf4",
+            "h5netcdf" (netCDF4 files only) or "scipy" (netCDF3 files only). Defaults
+            to None (xarray's default, netcdf4 if it is installed).
+        chunk_cache (int | None, optional): The size in bytes of the HDF5 chunk cache
+            of each variable in netCDF4 files, for the netcdf4 engine. A compressed
+            variable whose chunks don't all fit in the cache is decompressed again by
+            every slice of it that is read, e.g., when a variable chunked along height
+            is converted in chunks along time. This sets the cache size of every file
+            the process opens from then on. Defaults to None (netCDF's default, 64 MiB
+            in netCDF-C 4.9).
+        mmap (bool | None, optional): Whether to memory-map netCDF3 files, for the
+            scipy engine. Defaults to None (scipy's default, True for files opened by
+            path).
+        **kwargs: Passed to xr.open_dataset(), e.g., mask_and_scale, decode_times,
+            drop_variables or chunks.
+
+    Returns:
+        xr.Dataset: The (lazily loaded) dataset.
+    """
+    if engine not in (None, "netcdf4", "h5netcdf", "scipy"):
+        raise ValueError(
+            f"engine must be 'netcdf4', 'h5netcdf', 'scipy' or None, not '{engine}'"
+        )
+
+    if chunk_cache is not None:
+        # h5netcdf opens a variable's HDF5 dataset again for every read, which starts
+        # it with an empty cache, so only netcdf4 benefits from a larger one
+        if engine not in (None, "netcdf4"):
+            raise ValueError("chunk_cache is only supported by the netcdf4 engine")
+        import netCDF4
+
+        netCDF4.set_chunk_cache(
+            size=chunk_cache, nelems=_get_chunk_cache_slots(chunk_cache)
+        )
+    if mmap is not None:
+        if engine != "scipy":
+            raise ValueError("mmap is only supported by the scipy engine")
+        kwargs["mmap"] = mmap
+
+    return xr.open_dataset(filepath, engine=engine, **kwargs)
+
+
+def _get_chunk_cache_slots(chunk_cache: int) -> int:
+    """Returns the number of hash table slots for an HDF5 chunk cache of the given size.
+
+    HDF5 recommends a prime about 100 times the number of chunks that fit in the cache,
+    which is estimated assuming chunks of about 64 KiB."""
+    slots = max(521, chunk_cache // 2**16 * 100)
+    while any(slots % i == 0 for i in range(2, math.isqrt(slots) + 1)):
+        slots += 1
+    return slots
+
+
+def _get_json_encoder(backend: str, compact: bool) -> Callable[[Any], bytes]:
+    if backend == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            raise ImportError(
+                "json_backend='orjson' requires orjson. Please run 'pip install orjson'"
+            )
+        # orjson only supports an indent of 2
+        option = 0 if compact else orjson.OPT_INDENT_2
+        return lambda obj: orjson.dumps(obj, default=str, option=option)
+    elif backend != "json":
+        raise ValueError(f"json_backend must be 'json' or 'orjson', not '{backend}'")
+
+    if compact:
+        return lambda obj: json.dumps(obj, default=str, separators=(",", ":")).encode()
+    return lambda obj: json.dumps(obj, default=str, indent=4).encode()
+
+
+# Shared schema documents already read or written by this process, by path
+_shared_metadata_cache: dict[OutputPath, dict[str, Any]] = {}
+
+
+def _share_metadata(
+    metadata: dict[str, Any], folder: OutputPath, dumps: Callable[[Any], bytes]
+) -> dict[str, Any]:
+    """Makes sure the shared schema document for this metadata exists in `folder` and
+    returns the per-file document: the name of the schema file and the values that
+    differ from it."""
+    metadata = json.loads(json.dumps(metadata, default=str))  # as it would be read
+    shared_path = folder / f"_schema.{_get_metadata_fingerprint(metadata)}.json"
+
+    shared = _shared_metadata_cache.get(shared_path)
+    if shared is None or not _exists(shared_path):
+        if _exists(shared_path):
+            shared = json.loads(_read_bytes(shared_path))
+        else:
+            shared = metadata
+            _write_bytes(shared_path, dumps(shared))
+        _shared_metadata_cache[shared_path] = shared
+
+    return {
+        "schema": shared_path.name,
+        "changes": _diff_metadata(shared, metadata),
+    }
+
+
+def _get_metadata_fingerprint(metadata: dict[str, Any]) -> str:
+    """Hashes the structure of the metadata: its variables, their dims and dtypes, and
+    the names (but not the values) of all attributes and encodings. Datasets with the
+    same fingerprint share a schema document."""
+
+    def _skeleton(obj: Any, key: str | None = None) -> Any:
+        if isinstance(obj, dict):
+            return {k: _skeleton(v, k) for k, v in obj.items()}
+        return obj if key in ("dims", "dtype") else None
+
+    skeleton = json.dumps(_skeleton(metadata), sort_keys=True, default=str)
+    return hashlib.sha256(skeleton.encode()).hexdigest()[:16]
+
+
+def _diff_metadata(base: dict[str, Any], other: dict[str, Any]) -> dict[str, Any]:
+    # Since both have the same fingerprint they have the same keys at every level
+    diff: dict[str, Any] = {}
+    for key, value in other.items():
+        base_value = base.get(key)
+        if isinstance(value, dict) and isinstance(base_value, dict):
+            nested = _diff_metadata(base_value, value)
+            if nested:
+                diff[key] = nested
+        elif value != base_value and not (value != value and base_value != base_value):
+            diff[key] = value
+    return diff
+
+
+def _apply_metadata_changes(
+    base: dict[str, Any], changes: dict[str, Any]
+) -> dict[str, Any]:
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _apply_metadata_changes(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _select_dataset(dataset: xr.Dataset, kwargs: dict[str, Any]) -> xr.Dataset:
+    """Selects the part of the dataset to convert from the selection options accepted
+    by every converter, applied in this order:
+
+    - variables (list[str]): The data variables to keep (with the coordinates of their
+      dimensions). Raises a ValueError if any are not in the dataset.
+    - drop_variables (list[str]): Variables to leave out. Variables that are not in the
+      dataset are ignored, like in xr.open_dataset().
+    - time_start, time_end (str | datetime): Keep only the time steps from time_start
+      to time_end (inclusive), by label on the 'time' index.
+    - isel (dict[str, int | slice]): Positional selections along dimensions, e.g.,
+      {"height": slice(0, 10)}. An int selects a single position but keeps the
+      dimension.
+
+    Selecting is lazy, so data that isn't selected is never read from disk. The
+    metadata written by the converters then describes only the selected subset."""
+    variables = kwargs.get("variables")
+    if variables is not None:
+        missing = [v for v in variables if v not in dataset.variables]
+        if missing:
+            raise ValueError(f"Variables {missing} are not in the dataset")
+        dataset = dataset[list(variables)]
+
+    if kwargs.get("drop_variables"):
+        dataset = dataset.drop_vars(kwargs["drop_variables"], errors="ignore")
+
+    time_start, time_end = kwargs.get("time_start"), kwargs.get("time_end")
+    if time_start is not None or time_end is not None:
+        if "time" not in dataset.indexes:
+            raise ValueError("Selecting a time range requires a 'time' coordinate")
+        dataset = dataset.sel(time=slice(time_start, time_end))
+
+    isel = kwargs.get("isel")
+    if isel:
+        missing = [d for d in isel if d not in dataset.dims]
+        if missing:
+            raise ValueError(f"Dimensions {missing} are not in the dataset")
+        dataset = dataset.isel(
+            {
+                d: slice(i, i + 1 or None) if isinstance(i, int) else i
+                for d, i in isel.items()
+            }
+        )
+
+    return dataset
+
+
 def _to_dataframe(
     dataset: xr.Dataset, filepath: str | Path, extension: str
-) -> tuple[Path, pd.DataFrame]:
+) -> tuple[OutputPath, pd.DataFrame]:
     extension = extension if extension.startswith(".") else "." + extension
 
     df = dataset.to_dataframe(dim_order=list(dataset.dims))
 
-    return Path(filepath).with_suffix(extension), df
+    return _as_path(filepath).with_suffix(extension), df
+
+
+def _to_dataframe_chunks(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    extension: str,
+    chunk_size: int | None = None,
+) -> tuple[OutputPath, Iterator[pd.DataFrame]]:
+    """Like `_to_dataframe`, but lazily yields the DataFrame in pieces by slicing the
+    dataset along its leading dimension. Concatenating the pieces gives the same
+    DataFrame that `_to_dataframe` would have returned.
+
+    Each piece has about `chunk_size` rows, or if `chunk_size` is not provided, covers
+    one dask chunk of the leading dimension (see `_get_slices`)."""
+    extension = extension if extension.startswith(".") else "." + extension
+
+    dim_order = list(dataset.dims)
+
+    return _as_path(filepath).with_suffix(extension), _iter_dataframe_chunks(
+        dataset, dim_order, chunk_size
+    )
+
+
+def _iter_dataframe_chunks(
+    dataset: xr.Dataset, dim_order: list[str], chunk_size: int | None
+) -> Iterator[pd.DataFrame]:
+    if not dim_order:
+        yield dataset.to_dataframe(dim_order=dim_order)
+        return
+
+    leading_dim, inner_dims = dim_order[0], dim_order[1:]
+    rows_per_step = math.prod(dataset.sizes[d] for d in inner_dims)
+    slices = _get_slices(dataset, leading_dim, chunk_size, rows_per_step)
+
+    for chunk in _iter_loaded_slices(dataset, leading_dim, slices):
+        yield chunk.to_dataframe(dim_order=dim_order)
+
+
+def _is_chunked(dataset: xr.Dataset) -> bool:
+    """Returns True if any variable in the dataset is a (lazy) dask array."""
+    return any(var.chunks is not None for var in dataset.variables.values())
+
+
+def _get_slices(
+    dataset: xr.Dataset, dim: str, chunk_size: int | None, rows_per_step: int = 1
+) -> list[slice]:
+    """Splits `dim` into consecutive slices for chunked conversion.
+
+    If `chunk_size` is given, each slice covers about `chunk_size` rows, where one step
+    along `dim` accounts for `rows_per_step` rows. Otherwise, slices follow the dask
+    chunks along `dim` so each dask block is pulled exactly once; a dataset that is not
+    chunked along `dim` gives one slice. An empty `dim` also gives one (empty) slice,
+    so writers still get a chunk with the columns to write a header or schema from."""
+    size = dataset.sizes[dim]
+    if chunk_size:
+        step = max(1, chunk_size // max(1, rows_per_step))
+        return [slice(start, start + step) for start in range(0, max(size, 1), step)]
+
+    for var in dataset.variables.values():
+        if var.chunks is not None and dim in var.dims:
+            block_sizes = var.chunks[var.dims.index(dim)]
+            bounds = [0, *itertools.accumulate(block_sizes)]
+            return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    return [slice(0, size)]
+
+
+def _iter_loaded_slices(
+    dataset: xr.Dataset, dim: str, slices: list[slice]
+) -> Iterator[xr.Dataset]:
+    """Yields each slice of the dataset along `dim` with its data loaded into memory.
+
+    The next slice is read (or computed, for dask arrays) in a background thread while
+    the caller works on the current one, so reading block N+1 overlaps with writing
+    block N. At most two slices are held in memory at a time."""
+    if len(slices) == 1 and not _is_chunked(dataset):
+        yield dataset.isel({dim: slices[0]})
+        return
+
+    # pandas numbers a dimension without a coordinate variable from 0 in each slice,
+    # and pyarrow stores the numbers of a slice as a RangeIndex in the parquet
+    # metadata rather than as a column, so give these dimensions their positions
+    dataset = dataset.assign_coords(
+        {d: np.arange(n) for d, n in dataset.sizes.items() if d not in dataset.indexes}
+    )
+
+    def _load(s: slice) -> xr.Dataset:
+        return dataset.isel({dim: s}).load()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = deque(executor.submit(_load, s) for s in slices[:1])
+        for s in slices[1:]:
+            current = pending.popleft()
+            pending.append(executor.submit(_load, s))
+            yield current.result()
+        if pending:
+            yield pending.popleft().result()
+
+
+def _map_concurrently(
+    func: Callable[..., T],
+    items: Sequence[tuple[Any, ...]],
+    workers: int = 1,
+    costs: Sequence[int] | None = None,
+    budget: int | None = None,
+) -> list[T]:
+    """Calls `func(*item)` for each item in a pool of `workers` threads and returns the
+    results in the order of `items`.
+
+    If a `budget` is given, an item only starts once the summed `costs` (e.g., the
+    estimated bytes of memory) of the items running alongside it fit within the
+    budget. An item that costs more than the whole budget runs on its own. With one
+    worker, the items are run one after another in the calling thread."""
+    if workers <= 1 or len(items) <= 1:
+        return [func(*item) for item in items]
+
+    costs = costs if costs is not None else [0] * len(items)
+    condition = threading.Condition()
+    in_use = 0
+
+    def _run(item: tuple[Any, ...], cost: int) -> T:
+        nonlocal in_use
+        with condition:
+            condition.wait_for(
+                lambda: budget is None or in_use == 0 or in_use + cost <= budget
+            )
+            in_use += cost
+        try:
+            return func(*item)
+        finally:
+            with condition:
+                in_use -= cost
+                condition.notify_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run, item, c) for item, c in zip(items, costs)]
+        return [future.result() for future in futures]
 
 
 def _to_dataframe_collection(
     dataset: xr.Dataset, filepath: str | Path, extension: str
-) -> tuple[tuple[Path, pd.DataFrame], ...]:
-    outputs: list[tuple[Path, pd.DataFrame]] = []
+) -> tuple[tuple[OutputPath, pd.DataFrame], ...]:
+    outputs: list[tuple[OutputPath, pd.DataFrame]] = []
 
     extension = extension[1:] if extension.startswith(".") else extension
 
-    # Get variable dimension groupings
-    dimension_groups: dict[tuple[str, ...], list[str]] = defaultdict(list)
-    for var_name, data_var in dataset.data_vars.items():
-        dims = tuple(str(d) for d in data_var.dims)
-        dimension_groups[dims].append(var_name)
+    dimension_groups = _get_dimension_groups(dataset)
 
     # Create DataFrame collection
     for dim_group, variable_names in dimension_groups.items():
@@ -48,23 +445,91 @@ def _to_dataframe_collection(
             # to_dataframe() doesn't support 0-D data so we make it into a series and
             # then convert it into a DataFrame
             df = pd.DataFrame(dataset[variable_names].to_pandas()).T
-            dim_group_path = Path(filepath).with_suffix(f".{extension}")
         else:
             df = dataset[variable_names].to_dataframe(dim_order=dim_group)
-            dim_group_path = Path(filepath).with_suffix(
-                f".{'.'.join(dim_group)}.{extension}"
+        outputs.append((_get_dim_group_path(filepath, dim_group, extension), df))
+
+    return tuple(outputs)
+
+
+def _to_dataframe_collection_chunks(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    extension: str,
+    chunk_size: int | None = None,
+) -> tuple[tuple[OutputPath, Iterator[pd.DataFrame]], ...]:
+    """Like `_to_dataframe_collection`, but each DataFrame is lazily yielded in pieces
+    (see `_to_dataframe_chunks`)."""
+    outputs: list[tuple[OutputPath, Iterator[pd.DataFrame]]] = []
+
+    extension = extension[1:] if extension.startswith(".") else extension
+
+    dimension_groups = _get_dimension_groups(dataset)
+
+    for dim_group, variable_names in dimension_groups.items():
+        if dim_group == ():
+            chunks = iter([pd.DataFrame(dataset[variable_names].to_pandas()).T])
+        else:
+            chunks = _iter_dataframe_chunks(
+                dataset[variable_names], list(dim_group), chunk_size
             )
-        outputs.append((dim_group_path, df))
+        outputs.append((_get_dim_group_path(filepath, dim_group, extension), chunks))
 
     return tuple(outputs)
 
 
+def _get_dimension_groups(dataset: xr.Dataset) -> dict[tuple[str, ...], list[str]]:
+    dimension_groups: dict[tuple[str, ...], list[str]] = defaultdict(list)
+    for var_name, data_var in dataset.data_vars.items():
+        dims = tuple(str(d) for d in data_var.dims)
+        dimension_groups[dims].append(str(var_name))
+    return dimension_groups
+
+
+def _get_dim_group_path(
+    filepath: str | Path, dim_group: tuple[str, ...], extension: str
+) -> OutputPath:
+    if dim_group == ():
+        return _as_path(filepath).with_suffix(f".{extension}")
+    return _as_path(filepath).with_suffix(f".{'.'.join(dim_group)}.{extension}")
+
+
 def _to_faceted_dim_dataframe(
     dataset: xr.Dataset, filepath: str | Path, extension: str
-) -> tuple[Path, pd.DataFrame]:
+) -> tuple[OutputPath, pd.DataFrame]:
+    extension = extension if extension.startswith(".") else "." + extension
+
+    layout = _get_faceted_layout(dataset)
+    df = _build_faceted_dim_dataframe(dataset, layout)
+
+    return _as_path(filepath).with_suffix(extension), df
+
+
+def _to_faceted_dim_dataframe_chunks(
+    dataset: xr.Dataset,
+    filepath: str | Path,
+    extension: str,
+    chunk_size: int | None = None,
+) -> tuple[OutputPath, Iterator[pd.DataFrame]]:
+    """Like `_to_faceted_dim_dataframe`, but lazily yields the DataFrame in pieces of
+    `chunk_size` time steps, or one dask chunk of 'time' at a time if `chunk_size` is
+    not provided. The column layout is worked out once for the whole dataset and each
+    piece is built from a slice of the dataset along 'time'."""
     extension = extension if extension.startswith(".") else "." + extension
 
-    # Get variable dimension groupings
+    layout = _get_faceted_layout(dataset)
+    slices = _get_slices(dataset, "time", chunk_size)
+
+    def _iter_chunks() -> Iterator[pd.DataFrame]:
+        for chunk in _iter_loaded_slices(dataset, "time", slices):
+            yield _build_faceted_dim_dataframe(chunk, layout)
+
+    return _as_path(filepath).with_suffix(extension), _iter_chunks()
+
+
+def _get_faceted_dimension_groups(
+    dataset: xr.Dataset,
+) -> dict[tuple[str, ...], list[str]]:
     dimension_groups: dict[tuple[str, ...], list[str]] = defaultdict(list)
     for var_name, data_var in dataset.data_vars.items():
         dims = tuple(str(d) for d in data_var.dims)
@@ -88,65 +553,279 @@ def _to_faceted_dim_dataframe(
                 dims,
             )
             continue
-        dimension_groups[dims].append(var_name)
-
-    ds = dataset[["time"]].copy()
-    for dims, var_list in dimension_groups.items():
-        # simple case
-        if dims == ("time",):
-            ds.update(dataset[var_list])
+        dimension_groups[dims].append(str(var_name))
+    return dimension_groups
+
+
+def _get_faceted_layout(dataset: xr.Dataset) -> list[tuple[str, str, int | None]]:
+    """Plans the columns of the faceted DataFrame before any data is touched.
+
+    Returns a list of (column name, variable name, index) tuples in output order. The
+    index is None if the column is the variable itself (broadcast across 'time' if it
+    isn't dimensioned by time), or the position along the variable's second (non-time)
+    dimension that the column is taken from."""
+    # Non-index coordinates come first, like they would with
+    # dataset[["time"]].to_dataframe(). Those along a second dimension (e.g., labels of
+    # each height) are flattened like data variables
+    layout: list[tuple[str, str, int | None]] = []
+    for name, coord in dataset.coords.items():
+        other_dims = [str(d) for d in coord.dims if d != "time"]
+        if name in dataset.dims or len(other_dims) > 1:
             continue
-
-        shape = dataset[var_list[0]].shape
-
-        # If scalar, expand to make time the first dimension
-        if not shape:
-            _tmp = dataset[var_list].expand_dims({"time": dataset["time"]})
-            ds.update(_tmp[var_list])
+        if not other_dims:
+            layout.append((str(name), str(name), None))
             continue
-
-        _tmp = dataset[var_list]
-
-        # If 1D, expand to make time a dimension (2D)
-        if len(shape) == 1:
-            _tmp = _tmp.expand_dims({"time": dataset["time"]})
-
-        # For 2D, make time the first dimension and flatten the second
-        new_dims = ("time", [d for d in dims if d != "time"][0])
-        _tmp = _tmp.transpose(*new_dims)
-        _tmp = _flatten_dataset(_tmp, new_dims[1])
-        ds = ds.merge(_tmp)
-
-    df = ds.to_dataframe()
-
-    return Path(filepath).with_suffix(extension), df
-
-
-def _flatten_dataset(ds: xr.Dataset, second_dim: str) -> xr.Dataset:
-    """Transforms a 2D dataset into 1D by adding variables for each value of the second
-    dimension. The first dimension must be 'time'.
-
-    Args:
-        ds (xr.Dataset): The dataset to flatten. Must only contain two dimensions/coords
-            and only the variables to flatten.
-
-    Returns:
-        xr.Dataset: The flattened dataset. Preserves attributes.
-    """
-
-    output = ds[["time"]]
-
+        suffixes = _get_flattened_suffixes(dataset, other_dims[0])
+        layout.extend(
+            (f"{name}_{suffix}", str(name), i) for i, suffix in enumerate(suffixes)
+        )
+
+    for dims, var_list in _get_faceted_dimension_groups(dataset).items():
+        if dims in ((), ("time",)):
+            layout.extend((var_name, var_name, None) for var_name in var_list)
+            continue
+        second_dim = next(d for d in dims if d != "time")
+        suffixes = _get_flattened_suffixes(dataset, second_dim)
+        layout.extend(
+            (f"{var_name}_{suffix}", var_name, i)
+            for var_name in var_list
+            for i, suffix in enumerate(suffixes)
+        )
+
+    return layout
+
+
+def _build_faceted_dim_dataframe(
+    dataset: xr.Dataset, layout: list[tuple[str, str, int | None]]
+) -> pd.DataFrame:
+    """Fills the columns planned by `_get_faceted_layout` in a single pass.
+
+    Each variable is viewed as a (time, second dim) array, broadcasting scalars and
+    variables that aren't dimensioned by time without copying them, so the only copy of
+    the data made is the DataFrame itself."""
+    n_times = dataset.sizes["time"]
+
+    blocks: dict[str, np.ndarray] = {}
+    columns: dict[str, np.ndarray] = {}
+    for column_name, var_name, index in layout:
+        if var_name not in blocks:
+            var = dataset[var_name].variable
+            var_dims = sorted(var.dims, key=lambda d: d != "time")
+            values = np.asarray(var.transpose(*var_dims).values)
+            if "time" not in var.dims:
+                values = np.broadcast_to(values, (n_times, *values.shape))
+            blocks[var_name] = values
+        values = blocks[var_name]
+        columns[column_name] = values if index is None else values[:, index]
+
+    return pd.DataFrame(columns, index=dataset.get_index("time"))
+
+
+def _supports_arrow_engine(dataset: xr.Dataset, dim_order: list[str]) -> bool:
+    # Dimensions without a coordinate variable get a RangeIndex from pandas, which is
+    # stored in the parquet metadata rather than as a column. Leave those to pandas.
+    return bool(dim_order) and all(
+        d in dataset.indexes and not isinstance(dataset.indexes[d], pd.MultiIndex)
+        for d in dim_order
+    )
+
+
+def _iter_arrow_tables(
+    dataset: xr.Dataset,
+    dim_order: list[str],
+    chunk_size: int | None,
+    index: bool | None = None,
+    dtypes: dict[str, Any] | None = None,
+) -> Iterator[pa.Table]:
+    """Yields the dataset as pyarrow Tables, sliced along the leading dimension in the
+    same way as `_to_dataframe_chunks`, without building pandas DataFrames.
+
+    The tables have the same schema (including the pandas metadata) as
+    pa.Table.from_pandas(dataset.to_dataframe(dim_order)) would have, or as
+    pa.Table.from_pandas(dataset.to_dataframe(dim_order).astype(dtypes)) if `dtypes`
+    is given. The schema is taken from an empty DataFrame so that only the column
+    dtypes have to be known."""
+    empty = dataset.isel({d: slice(0, 0) for d in dim_order})
+    schema = pa.Schema.from_pandas(
+        empty.to_dataframe(dim_order=dim_order).astype(dtypes or {}),
+        preserve_index=index,
+    )
+    # Empty object columns (e.g., strings) have no values to infer their type from
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type) and dataset[field.name].dtype.kind in "OUS":
+            string_type = _get_string_type(dataset[field.name].dtype)
+            schema = schema.set(i, field.with_type(string_type))
+
+    leading_dim, inner_dims = dim_order[0], dim_order[1:]
+    rows_per_step = math.prod(dataset.sizes[d] for d in inner_dims)
+    slices = _get_slices(dataset, leading_dim, chunk_size, rows_per_step)
+
+    for chunk in _iter_loaded_slices(dataset, leading_dim, slices):
+        yield _to_arrow_table(chunk, dim_order, schema)
+
+
+def _to_arrow_table(
+    dataset: xr.Dataset, dim_order: list[str], schema: pa.Schema
+) -> pa.Table:
+    shape = tuple(dataset.sizes[d] for d in dim_order)
+
+    arrays = []
+    for field in schema:
+        # Index columns are coordinates repeated/tiled over the cartesian product and
+        # data columns are variables broadcast over the dimensions they don't have
+        var = dataset[field.name].variable
+        var_dims = [d for d in dim_order if d in var.dims]
+        expanded_shape = [n if d in var_dims else 1 for d, n in zip(dim_order, shape)]
+        values = np.asarray(var.transpose(*var_dims).values).reshape(expanded_shape)
+        # Only copies if the variable doesn't already span every dimension
+        column = np.broadcast_to(values, shape).reshape(-1)
+        arrays.append(pa.array(column, type=field.type, from_pandas=True))
+
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _iter_group_tables(
+    group: xr.Dataset,
+    dim_group: tuple[str, ...],
+    chunk_size: int | None,
+    index: bool | None = None,
+    dtypes: dict[str, Any] | None = None,
+) -> Iterator[pd.DataFrame | pa.Table]:
+    """Yields one dimension group of a collection as pyarrow Tables (see
+    `_iter_arrow_tables`), or as a single DataFrame if the group has a dimension without
+    a coordinate variable or no dimensions at all."""
+    if _supports_arrow_engine(group, list(dim_group)):
+        yield from _iter_arrow_tables(group, list(dim_group), chunk_size, index, dtypes)
+    elif dim_group == ():
+        yield pd.DataFrame(group.to_pandas()).T.astype(dtypes or {})
+    else:
+        yield group.to_dataframe(dim_order=list(dim_group)).astype(dtypes or {})
+
+
+def _to_long_tables(
+    dataset: xr.Dataset, chunk_size: int | None = None
+) -> tuple[pa.Schema, Iterator[pa.Table]]:
+    """Converts the dataset to long (tidy) format: one record per value of each
+    variable, with a "variable" column, a column for each dimension of the dataset and
+    a "value" column.
+
+    Each value is written once, so the number of records is the total size of the
+    variables rather than the product of the dimension lengths. Dimension columns that
+    a variable isn't dimensioned by are null. Dimensions without a coordinate variable
+    get their integer positions. "value" has the common numeric type of the variables,
+    or is a string column if any of them are not numeric (e.g., datetimes or strings).
+
+    Returns the schema of the tables and an iterator of pyarrow Tables, one per
+    variable, or one per slice of about `chunk_size` records along each variable's
+    leading dimension (or per dask chunk), so only one variable (or slice) is in memory
+    at a time."""
+    positions = {d: np.arange(n) for d, n in dataset.sizes.items()}
+    dataset = dataset.assign_coords(
+        {d: p for d, p in positions.items() if d not in dataset.indexes}
+    )
+    names = [str(n) for n in dataset.variables if n not in dataset.dims]
+    dims = [str(d) for d in dataset.dims]
+
+    dtypes = [dataset[n].dtype for n in names]
+    if all(dtype.kind in "biuf" for dtype in dtypes):
+        value_type = pa.from_numpy_dtype(np.result_type(*dtypes, np.int8))
+    else:
+        value_type = pa.string()
+    schema = pa.schema(
+        [
+            pa.field("variable", pa.dictionary(pa.int32(), pa.string())),
+            *(pa.field(d, _get_arrow_type(dataset[d].dtype)) for d in dims),
+            pa.field("value", value_type),
+        ]
+    )
+
+    def _iter_tables() -> Iterator[pa.Table]:
+        for name in names:
+            var_dims = [str(d) for d in dataset[name].dims]
+            if not var_dims:
+                yield _to_long_table(dataset[[name]], name, schema)
+                continue
+            rows_per_step = math.prod(dataset.sizes[d] for d in var_dims[1:])
+            var_dataset = dataset[[name]]
+            slices = _get_slices(var_dataset, var_dims[0], chunk_size, rows_per_step)
+            for chunk in _iter_loaded_slices(var_dataset, var_dims[0], slices):
+                yield _to_long_table(chunk, name, schema)
+
+    return schema, _iter_tables()
+
+
+def _to_long_table(dataset: xr.Dataset, name: str, schema: pa.Schema) -> pa.Table:
+    var = dataset[name].variable
+    n_values = var.size
+
+    columns = [
+        pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(n_values, dtype="int32")), pa.array([name])
+        )
+    ]
+    for field in schema:
+        if field.name in ("variable", "value"):
+            continue
+        if field.name not in var.dims:
+            columns.append(pa.nulls(n_values, field.type))
+            continue
+        # Repeat/tile the coordinate over the variable's other dimensions
+        expanded_shape = [-1 if d == field.name else 1 for d in var.dims]
+        coord = dataset[field.name].values.reshape(expanded_shape)
+        values = np.broadcast_to(coord, var.shape).reshape(-1)
+        columns.append(pa.array(values, type=field.type, from_pandas=True))
+
+    values = np.asarray(var.values).reshape(-1)
+    value = pa.array(values, from_pandas=values.dtype.kind != "f")
+    columns.append(value.cast(schema.field("value").type))
+
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _get_arrow_type(dtype: np.dtype) -> pa.DataType:
+    if dtype.kind in "OUS":
+        return pa.string()
+    return pa.from_numpy_dtype(dtype)
+
+
+def _get_string_type(dtype: np.dtype) -> pa.DataType:
+    # Like pandas, bytes are written as binary rather than decoded to strings
+    return pa.binary() if dtype.kind == "S" else pa.string()
+
+
+def _get_datetime_units(df_or_ds: pd.DataFrame | xr.Dataset) -> dict[str, str]:
+    """Maps each datetime column (or index level) of a DataFrame, or each datetime
+    variable of a Dataset, to the unit pandas uses when it formats it as text."""
+    if isinstance(df_or_ds, xr.Dataset):
+        columns = {str(k): v.values for k, v in df_or_ds.variables.items()}
+    else:
+        columns = {str(k): v.values for k, v in df_or_ds.reset_index().items()}
+    return {
+        name: _get_datetime_unit(values)
+        for name, values in columns.items()
+        if values.dtype.kind == "M"
+    }
+
+
+def _get_datetime_unit(values: np.ndarray) -> str:
+    # pandas picks the precision for a whole column at once: date-only if every value
+    # is at midnight, otherwise the finest of seconds, ms, us or ns that is needed.
+    # Chunks of a column must be formatted with the unit of the entire column.
+    nanoseconds = values.astype("datetime64[ns]")
+    nanoseconds = nanoseconds[~np.isnat(nanoseconds)].view("i8")
+    for unit, factor in (("D", 86_400 * 10**9), ("s", 10**9), ("ms", 10**6)):
+        if np.all(nanoseconds % factor == 0):
+            return unit
+    return "us" if np.all(nanoseconds % 10**3 == 0) else "ns"
+
+
+def _get_flattened_suffixes(ds: xr.Dataset, second_dim: str) -> list[str]:
+    """The suffixes for the columns a variable is flattened into: each value of the
+    second dimension, followed by its units."""
     dim_values = ds[second_dim].values
 
     dim_units = ds[second_dim].attrs.get("units")
     if not dim_units or dim_units == "1":
         dim_units = ""
 
-    dim_suffixes = [f"{dim_val}{dim_units}" for dim_val in dim_values]
-
-    for var_name, data in ds.data_vars.items():
-        for i, suffix in enumerate(dim_suffixes):
-            output[f"{var_name}_{suffix}"] = data[:, i]
-
-    output = output.drop_vars(second_dim)  # remove from coords
-    return output
+    return [f"{dim_val}{dim_units}" for dim_val in dim_values]
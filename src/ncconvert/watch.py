@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Event masks from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]}
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """Watches directories for files matching a pattern and reports each file once it
+    has stopped changing.
+
+    On Linux, changes are detected with inotify, so waiting for files costs nothing
+    however many files the directories hold. Elsewhere, if inotify can't be used (e.g.,
+    the watch limit is reached), or if `polling` is True, the directories are listed
+    every `poll_interval` seconds instead. Either way, a file is only reported once its
+    size and mtime have not changed for `settle` seconds, so files that are still being
+    written or copied into place are not reported half-way through. A file is reported
+    again if it changes after it was reported, and files that are deleted or moved away
+    are forgotten.
+
+    Example:
+        with FileWatcher(["incoming/"], pattern="*.nc") as watcher:
+            while True:
+                for file in watcher.poll(timeout=1.0):
+                    convert(file)
+
+    Args:
+        directories (Iterable[str | Path]): The directories to watch. Subdirectories
+            are not watched.
+        pattern (str, optional): A glob pattern the names of the files to report must
+            match. Defaults to "*.nc".
+        settle (float, optional): How many seconds a file must go unchanged before it is
+            reported. Defaults to 2.0.
+        poll_interval (float, optional): How often to list the directories when polling,
+            in seconds. Defaults to 1.0.
+        polling (bool, optional): If True, poll even if inotify is available. Defaults
+            to False.
+        existing (bool, optional): If True, files that are already in the directories
+            when the watcher starts are reported as well. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        directories: Iterable[str | Path],
+        pattern: str = "*.nc",
+        settle: float = 2.0,
+        poll_interval: float = 1.0,
+        polling: bool = False,
+        existing: bool = True,
+    ):
+        self.directories = [Path(d).resolve() for d in directories]
+        self.pattern = pattern
+        self.settle = settle
+        self.poll_interval = poll_interval
+        # The (size, mtime_ns) of each file when it was reported
+        self._reported: dict[Path, tuple[int, int]] = {}
+        # The (size, mtime_ns) of each file waiting to settle, and when it last changed
+        self._pending: dict[Path, tuple[tuple[int, int], float]] = {}
+        # Started before the first scan so that no file written during it is missed
+        self._inotify = None if polling else _Inotify.create(self.directories)
+        self._last_scan = time.monotonic()
+        for file in self._list_files():
+            key = _stat_key(file)
+            if existing:
+                self._see(file)
+            elif key is not None:
+                self._reported[file] = key
+
+    @property
+    def polling(self) -> bool:
+        """True if the directories are polled rather than watched with inotify."""
+        return self._inotify is None
+
+    def poll(self, timeout: float) -> list[Path]:
+        """Waits up to `timeout` seconds for files to settle and returns the files that
+        did, in the order they were first seen. Returns as soon as any file is ready."""
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = self._collect_settled()
+            now = time.monotonic()
+            if ready or now >= deadline:
+                return ready
+            wait = deadline - now
+            if self._pending:
+                next_settled = min(since for _, since in self._pending.values())
+                wait = min(wait, max(next_settled + self.settle - now, 0.0))
+            if self._inotify is not None:
+                files, overflowed = self._inotify.read(wait)
+                if overflowed:
+                    # The kernel dropped events, so look at every file instead
+                    self._scan()
+                for file in dict.fromkeys(files):
+                    if fnmatch.fnmatch(file.name, self.pattern):
+                        self._see(file)
+            else:
+                next_scan = self._last_scan + self.poll_interval
+                time.sleep(max(min(wait, next_scan - now), 0.0))
+                if time.monotonic() >= next_scan:
+                    self._last_scan = time.monotonic()
+                    self._scan()
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self) -> FileWatcher:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _list_files(self) -> list[Path]:
+        files = []
+        for directory in self.directories:
+            with os.scandir(directory) as entries:
+                files.extend(
+                    directory / entry.name
+                    for entry in entries
+                    if fnmatch.fnmatch(entry.name, self.pattern) and entry.is_file()
+                )
+        return sorted(files)
+
+    def _scan(self) -> None:
+        files = self._list_files()
+        for file in files:
+            self._see(file)
+        # Forget the files that are gone, so long-running watchers don't keep them
+        for file in self._reported.keys() - set(files):
+            del self._reported[file]
+
+    def _see(self, file: Path) -> None:
+        # Starts (or restarts) the settle timer of a file that is new or has changed
+        key = _stat_key(file)
+        if key is None:
+            self._reported.pop(file, None)
+            return
+        if key == self._reported.get(file):
+            return
+        pending = self._pending.get(file)
+        if pending is None or pending[0] != key:
+            self._pending[file] = (key, time.monotonic())
+
+    def _collect_settled(self) -> list[Path]:
+        now = time.monotonic()
+        ready = []
+        for file, (key, since) in list(self._pending.items()):
+            if now - since < self.settle:
+                continue
+            # Checked again in case the file changed without an event, e.g., when
+            # polling or on filesystems that don't report every write
+            current = _stat_key(file)
+            if current is None:
+                del self._pending[file]
+            elif current != key:
+                self._pending[file] = (current, now)
+            else:
+                del self._pending[file]
+                self._reported[file] = key
+                ready.append(file)
+        return ready
+
+
+class _Inotify:
+    """A minimal inotify(7) wrapper that reports the paths of changed files in the
+    watched directories."""
+
+    def __init__(self, fd: int, watches: dict[int, Path]):
+        self.fd = fd
+        self.watches = watches
+
+    @classmethod
+    def create(cls, directories: list[Path]) -> _Inotify | None:
+        """Returns an inotify instance watching the directories, or None if inotify
+        can't be used."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            logger.warning(
+                "Could not start inotify (%s), polling instead",
+                os.strerror(ctypes.get_errno()),
+            )
+            return None
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                logger.warning(
+                    "Could not watch '%s' with inotify (%s), polling instead",
+                    directory,
+                    os.strerror(ctypes.get_errno()),
+                )
+                os.close(fd)
+                return None
+            watches[wd] = directory
+        return cls(fd, watches)
+
+    def read(self, timeout: float) -> tuple[list[Path], bool]:
+        """Waits up to `timeout` seconds for events and returns the paths of the files
+        they were for, and whether the kernel's event queue overflowed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+
+        files = []
+        overflowed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                overflowed = True
+            elif name and wd in self.watches:
+                files.append(self.watches[wd] / os.fsdecode(name))
+        return files, overflowed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _stat_key(file: Path) -> tuple[int, int] | None:
+    try:
+        stat = file.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
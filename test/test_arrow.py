@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+
+@pytest.mark.parametrize("compression", [None, "lz4", "zstd"])
+def test_arrow_ipc(dataset: xr.Dataset, compression: str):
+    import pyarrow as pa
+
+    from ncconvert.arrow import to_arrow_ipc
+
+    filepath = Path(".tmp/data/arrow.20220405.000000.nc")
+
+    output_path, metadata_path = to_arrow_ipc(
+        dataset, filepath, compression=compression
+    )
+
+    assert output_path == filepath.with_suffix(".arrow")
+    assert metadata_path == filepath.with_suffix(".json")
+
+    # The file can be memory-mapped and matches what to_parquet would write
+    with pa.memory_map(str(output_path)) as source:
+        df = pa.ipc.open_file(source).read_all().to_pandas()
+    expected = dataset.to_dataframe(dim_order=list(dataset.dims))
+    pd.testing.assert_frame_equal(df, expected)
+
+    chunked_path, _ = to_arrow_ipc(
+        dataset,
+        filepath.with_suffix(".chunked.nc"),
+        metadata=False,
+        chunk_size=4,
+        compression=compression,
+    )
+    with pa.memory_map(str(chunked_path)) as source:
+        reader = pa.ipc.open_file(source)
+        assert reader.num_record_batches == 3
+        pd.testing.assert_frame_equal(reader.read_all().to_pandas(), expected)
+
+    os.remove(output_path)
+    os.remove(chunked_path)
+    os.remove(metadata_path)
+
+    with pytest.raises(ValueError, match="compression"):
+        to_arrow_ipc(dataset, filepath, compression="gzip")
+
+
+def test_feather_collection(dataset: xr.Dataset):
+    from ncconvert.arrow import to_feather, to_feather_collection
+    from ncconvert.parquet import to_parquet_collection
+
+    filepath = Path(".tmp/data/feather.20220405.000000.nc")
+
+    output_paths, metadata_path = to_feather_collection(dataset, filepath)
+    parquet_paths, _ = to_parquet_collection(dataset, filepath, metadata=False)
+
+    assert len(output_paths) == 4
+    assert filepath.with_suffix(".time.height.feather") in output_paths
+    for output_path, parquet_path in zip(output_paths, parquet_paths):
+        pd.testing.assert_frame_equal(
+            pd.read_feather(output_path), pd.read_parquet(parquet_path)
+        )
+
+    for path in (*output_paths, *parquet_paths, metadata_path):
+        os.remove(path)
+
+    output_path, _ = to_feather(dataset, filepath, metadata=False)
+    assert output_path == filepath.with_suffix(".feather")
+    assert len(pd.read_feather(output_path)) == len(dataset.time) * len(dataset.height)
+    os.remove(output_path)
+
+
+def test_arrow_ipc_strings(dataset: xr.Dataset):
+    import numpy as np
+
+    from ncconvert.arrow import to_arrow_ipc, to_feather, to_feather_collection
+
+    dataset = dataset.copy()
+    dataset["flag"] = ("time", np.array(["good", "bad", "good"], dtype=object))
+    filepath = Path(".tmp/data/strings.20220405.000000.nc")
+
+    output_path, _ = to_arrow_ipc(dataset, filepath, metadata=False, chunk_size=4)
+    df = pd.read_feather(output_path)
+    assert list(df["flag"]) == ["good"] * 4 + ["bad"] * 4 + ["good"] * 4
+    os.remove(output_path)
+
+    output_path, _ = to_feather(dataset, filepath, metadata=False)
+    pd.testing.assert_frame_equal(
+        pd.read_feather(output_path),
+        dataset.to_dataframe(dim_order=list(dataset.dims)),
+        check_dtype=False,
+    )
+    os.remove(output_path)
+
+    output_paths, _ = to_feather_collection(dataset, filepath, metadata=False)
+    time_path = filepath.with_suffix(".time.feather")
+    assert list(pd.read_feather(time_path)["flag"]) == ["good", "bad", "good"]
+    for path in output_paths:
+        os.remove(path)
@@ -1,6 +1,8 @@
+import json
 import sys
 from pathlib import Path
 
+import pandas as pd
 import pytest
 import xarray as xr
 from typer.testing import CliRunner
@@ -69,3 +71,541 @@ def test_convert_cli(dataset: xr.Dataset):
 
             assert len(list(Path("./outputs").glob("*.csv"))) == 7
             assert len(list(Path("./outputs").glob("*.json"))) == 7
+
+
+def test_convert_cli_workers(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        for day in range(1, 6):
+            dataset.to_netcdf(f"test.2022040{day}.000000.nc")
+        Path("test.20220409.000000.nc").write_text("not a netCDF file")
+
+        result = runner.invoke(
+            app,
+            args=(
+                "to_csv",
+                "test.*.nc",
+                "--output-dir",
+                "outputs",
+                "--workers",
+                "2",
+                "--verbose",
+            ),
+        )
+
+        # The bad file is reported at the end, but the others are still converted
+        assert result.exit_code == 1
+        assert "Failed to convert 1 file(s)" in result.output
+        assert "test.20220409.000000.nc" in result.output
+        assert len(list(Path("./outputs").glob("*.csv"))) == 5
+        assert len(list(Path("./outputs").glob("*.json"))) == 5
+
+
+def test_convert_cli_incremental(dataset: xr.Dataset):
+    from ncconvert.cli import app
+    from ncconvert.manifest import MANIFEST_FILENAME
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        dataset.to_netcdf("test.20220406.000000.nc")
+        args = ("to_csv", "test.*.nc", "--output-dir", "outputs", "--incremental")
+
+        result = runner.invoke(app, args=(*args, "--verbose"))
+        assert result.exit_code == 0
+        assert "Skipping" not in result.stdout
+        assert Path("outputs", MANIFEST_FILENAME).exists()
+        assert not list(Path("outputs").glob("*.tmp"))
+
+        result = runner.invoke(app, args=(*args, "--verbose"))
+        assert result.exit_code == 0
+        assert "Skipping 2 up-to-date file(s)" in result.stdout
+        assert "Wrote data" not in result.stdout
+
+        # A deleted output or a different option means the file is converted again
+        Path("outputs/test.20220405.000000.csv").unlink()
+        result = runner.invoke(app, args=(*args, "--verbose"))
+        assert "Skipping 1 up-to-date file(s)" in result.stdout
+        assert Path("outputs/test.20220405.000000.csv").exists()
+
+        result = runner.invoke(app, args=(*args, "--verbose", "--no-metadata"))
+        assert "Skipping" not in result.stdout
+
+
+def test_convert_cli_chunks(dataset: xr.Dataset):
+    pytest.importorskip("dask")
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+
+        for output_dir, extra_args in [("eager", ()), ("lazy", ("--chunks", "time=1"))]:
+            result = runner.invoke(
+                app,
+                args=("to_csv", "test.20220405.000000.nc", "--output-dir", output_dir)
+                + extra_args,
+            )
+            assert result.exit_code == 0
+
+        eager = Path("eager/test.20220405.000000.csv").read_bytes()
+        assert Path("lazy/test.20220405.000000.csv").read_bytes() == eager
+
+        result = runner.invoke(
+            app, args=("to_csv", "test.20220405.000000.nc", "--chunks", "time=x")
+        )
+        assert result.exit_code != 0
+
+
+def test_convert_cli_profile(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        dataset.to_netcdf("test.20220406.000000.nc")
+
+        result = runner.invoke(
+            app,
+            args=(
+                "to_csv_collection",
+                "test.*.nc",
+                "--output-dir",
+                "outputs",
+                "--profile",
+                "profile.json",
+            ),
+        )
+        assert result.exit_code == 0
+        assert "Slowest 2 file(s)" in result.stdout
+        assert "Time per stage" in result.stdout
+
+        report = json.loads(Path("profile.json").read_text())
+        assert len(report["files"]) == 2
+        stages = [s["stage"] for s in report["files"][0]["stages"]]
+        n_groups = len(list(Path("outputs").glob("test.20220405.000000*.csv")))
+        assert stages == ["open", "to_dataframe", *["write"] * n_groups, "metadata"]
+
+
+def test_convert_cli_memory_limit(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        args = ("to_csv", "test.20220405.000000.nc")
+
+        result = runner.invoke(app, args=(*args, "--dry-run", "--memory-limit", "1KB"))
+        assert result.exit_code == 0
+        assert "to_csv" in result.stdout and "chunk" in result.stdout
+        assert not Path("data").exists()
+
+        result = runner.invoke(
+            app, args=(*args, "--memory-limit", "1KB", "--on-memory-limit", "refuse")
+        )
+        assert result.exit_code == 1
+        assert "MemoryLimitError" in result.output
+
+        result = runner.invoke(app, args=(*args, "--output-dir", "eager"))
+        assert result.exit_code == 0
+        result = runner.invoke(
+            app, args=(*args, "--output-dir", "chunked", "--memory-limit", "1KB")
+        )
+        assert result.exit_code == 0
+        eager = Path("eager/test.20220405.000000.csv").read_bytes()
+        assert Path("chunked/test.20220405.000000.csv").read_bytes() == eager
+
+        result = runner.invoke(app, args=(*args, "--memory-limit", "a lot"))
+        assert result.exit_code != 0
+
+
+def test_convert_cli_prefetch(dataset: xr.Dataset, monkeypatch: pytest.MonkeyPatch):
+    import time
+
+    from ncconvert import cli
+    from ncconvert.cli import _prefetch_datasets, app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        for day in range(1, 5):
+            dataset.to_netcdf(f"test.2022040{day}.000000.nc")
+        Path("test.20220409.000000.nc").write_text("not a netCDF file")
+
+        result = runner.invoke(
+            app, args=("to_csv", "test.*.nc", "--output-dir", "eager")
+        )
+        assert result.exit_code == 1
+        result = runner.invoke(
+            app,
+            args=(
+                "to_csv",
+                "test.*.nc",
+                "--output-dir",
+                "prefetched",
+                "--prefetch",
+                "2",
+                "--profile",
+                "profile.json",
+            ),
+        )
+
+        # The bad file is reported at the end, but the others are still converted
+        assert result.exit_code == 1
+        assert "Failed to convert 1 file(s)" in result.output
+        assert "test.20220409.000000.nc" in result.output
+        for eager in Path("eager").glob("*.csv"):
+            assert (Path("prefetched") / eager.name).read_bytes() == eager.read_bytes()
+        assert len(list(Path("prefetched").glob("*.csv"))) == 4
+
+        report = json.loads(Path("profile.json").read_text())
+        assert {Path(r["file"]).name for r in report["files"]} == {
+            f"test.2022040{day}.000000.nc" for day in range(1, 5)
+        }
+        assert report["files"][0]["stages"][0]["stage"] == "open"
+
+        # Stopping early closes the datasets that were read ahead
+        files = sorted(Path(".").glob("test.2022040[1-4].*.nc"))
+        datasets = _prefetch_datasets("to_csv", files, 1, {}, {})
+        file, ds, error = next(datasets)
+        assert file == files[0] and error is None
+        ds.close()
+        datasets.close()
+
+        # Only `prefetch` files are read ahead of the one being converted
+        read_dataset = cli._read_dataset
+        reads = []
+        monkeypatch.setattr(
+            cli,
+            "_read_dataset",
+            lambda *args: reads.append(args[1]) or read_dataset(*args),
+        )
+        datasets = _prefetch_datasets("to_csv", files, 1, {}, {})
+        file, ds, error = next(datasets)
+        time.sleep(0.5)
+        assert reads == files[:2]
+        ds.close()
+        datasets.close()
+
+        result = runner.invoke(
+            app, args=("to_csv", "test.*.nc", "--prefetch", "2", "--workers", "2")
+        )
+        assert result.exit_code != 0
+        assert "--prefetch" in result.output
+
+
+def test_cli_lazy_imports():
+    import subprocess
+
+    # The CLI should start without importing the heavy dependencies of the converters
+    code = (
+        "import sys, ncconvert, ncconvert.cli\n"
+        "heavy = {'xarray', 'pandas', 'pyarrow'} & set(sys.modules)\n"
+        "assert not heavy, heavy\n"
+        "assert ncconvert.to_csv.__module__ == 'ncconvert.csv'\n"
+        "assert set(ncconvert.__all__) == {'__version__', *ncconvert._LAZY_ATTRIBUTES}\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_convert_cli_selection(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        args = (
+            "to_csv",
+            "test.20220405.000000.nc",
+            "--variables",
+            "temperature,humidity",
+            "--time-end",
+            "2022-04-05T08:00",
+            "--isel",
+            "height=1:3",
+        )
+
+        result = runner.invoke(app, args=(*args, "--dry-run"))
+        assert result.exit_code == 0
+        assert " 4 " in result.stdout  # 2 times x 2 heights
+
+        result = runner.invoke(app, args=(*args, "--prefetch", "1"))
+        assert result.exit_code == 0
+        df = pd.read_csv("data/test.20220405.000000.csv")
+        assert list(df.columns) == ["time", "height", "temperature", "humidity"]
+        assert df["height"].unique().tolist() == [10, 20]
+        meta = json.loads(Path("data/test.20220405.000000.json").read_text())
+        assert sorted(meta["data_vars"]) == ["humidity", "temperature"]
+
+        result = runner.invoke(app, args=(*args[:2], "--isel", "height=a"))
+        assert result.exit_code != 0
+
+
+def test_convert_cli_compact(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+    dataset["other"].encoding.update({"dtype": "int16"})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        result = runner.invoke(
+            app, args=("to_parquet", "test.20220405.000000.nc", "--compact")
+        )
+        assert result.exit_code == 0
+        df = pd.read_parquet("data/test.20220405.000000.parquet")
+        # Decoded to float to mask its _FillValue, written as the source int16
+        assert df["other"].dtype == "Int16"
+
+
+def test_convert_cli_read_options(dataset: xr.Dataset):
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+    dataset["temperature"].encoding.update({"dtype": "int16", "scale_factor": 0.5})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        dataset.to_netcdf("test.20220405.000000.nc")
+        args = ("to_parquet", "test.20220405.000000.nc", "--incremental")
+        result = runner.invoke(
+            app, args=(*args, "--engine", "netcdf4", "--chunk-cache", "16MiB")
+        )
+        assert result.exit_code == 0
+        df = pd.read_parquet("data/test.20220405.000000.parquet")
+        assert df["temperature"].dtype == "float64"
+
+        # Not decoding changes the outputs, so the file is converted again
+        result = runner.invoke(
+            app, args=(*args, "--no-mask-and-scale", "--no-decode-times", "--verbose")
+        )
+        assert result.exit_code == 0
+        assert "up-to-date" not in result.stdout
+        df = pd.read_parquet("data/test.20220405.000000.parquet")
+        assert df["temperature"].dtype == "int16"
+        assert df.index.get_level_values("time").dtype == "int64"
+
+        for options in (
+            ("--engine", "zarr"),
+            ("--engine", "h5netcdf", "--chunk-cache", "16MiB"),
+            ("--chunk-cache", "lots"),
+            ("--mmap",),
+        ):
+            result = runner.invoke(app, args=(*args, *options))
+            assert result.exit_code == 2, options
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_watch_cli(dataset: xr.Dataset, workers: int, monkeypatch: pytest.MonkeyPatch):
+    from ncconvert.cli import watch_app
+    from ncconvert.manifest import Manifest
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        Path("incoming").mkdir()
+        for name in ("a", "b"):
+            dataset.to_netcdf(f"incoming/{name}.20220405.000000.nc")
+        args = (
+            "to_csv",
+            "incoming",
+            "--settle",
+            "0",
+            "--workers",
+            str(workers),
+            "--incremental",
+            "--max-files",
+            "2",
+        )
+
+        # The manifest isn't saved after every file, but it is saved on exit
+        saves = []
+        save = Manifest.save
+        monkeypatch.setattr(Manifest, "save", lambda self: saves.append(save(self)))
+        result = runner.invoke(watch_app, args=args)
+        assert result.exit_code == 0, result.stdout
+        assert sorted(p.name for p in Path("data").glob("*.csv")) == [
+            "a.20220405.000000.csv",
+            "b.20220405.000000.csv",
+        ]
+        assert len(saves) == 1
+
+        # Restarting skips the files recorded in the manifest
+        dataset.to_netcdf("incoming/c.20220405.000000.nc")
+        result = runner.invoke(watch_app, args=(*args[:-1], "1"))
+        assert result.exit_code == 0, result.stdout
+        assert len(list(Path("data").glob("*.csv"))) == 3
+
+
+def test_watch_cli_shares_manifest(dataset: xr.Dataset):
+    from ncconvert.cli import app, watch_app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        Path("incoming").mkdir()
+        for name in ("a", "b"):
+            dataset.to_netcdf(f"incoming/{name}.nc")
+        options = ("--incremental", "--variables", "humidity", "--compact-json")
+
+        result = runner.invoke(app, args=("to_csv", "incoming/a.nc", *options))
+        assert result.exit_code == 0, result.stdout
+
+        # The watcher skips the file converted above and converts the other one with
+        # the same selection
+        result = runner.invoke(
+            watch_app,
+            args=("to_csv", "incoming", "--settle", "0", "--max-files", "1", *options),
+        )
+        assert result.exit_code == 0, result.stdout
+        assert list(pd.read_csv("data/b.csv").columns) == ["time", "humidity"]
+
+        result = runner.invoke(
+            app,
+            args=("to_csv", "incoming/a.nc", "incoming/b.nc", *options, "--verbose"),
+        )
+        assert result.exit_code == 0, result.stdout
+        assert "Skipping 2 up-to-date file(s)" in result.stdout
+
+
+def test_main_dispatches_watch(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+):
+    from ncconvert.cli import main
+
+    monkeypatch.setattr(sys, "argv", ["ncconvert", "watch", "--help"])
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 0
+    assert "ncconvert watch [OPTIONS] METHOD DIRECTORIES" in capsys.readouterr().out
+
+    monkeypatch.setattr(sys, "argv", ["ncconvert", "--help"])
+    with pytest.raises(SystemExit):
+        main()
+    assert "METHOD FILES..." in capsys.readouterr().out
+
+
+def test_convert_cli_shards(dataset: xr.Dataset):
+    from ncconvert.cli import app, merge_app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        for i in range(6):
+            dataset.to_netcdf(f"test.{i}.nc")
+
+        # Another node is converting test.0.nc, whichever shard it is in
+        Path("data/.ncconvert-locks").mkdir(parents=True)
+        Path("data/.ncconvert-locks/test.0.nc.lock").write_text(
+            json.dumps({"host": "another-node", "pid": 1})
+        )
+
+        for index in range(2):
+            result = runner.invoke(
+                app,
+                args=(
+                    "to_csv",
+                    "test.*.nc",
+                    "--shard",
+                    f"{index}/2",
+                    "--incremental",
+                    "--profile",
+                    f"profiles/shard-{index}.json",
+                ),
+            )
+            assert result.exit_code == 0, result.stdout
+
+        # Each file was converted exactly once, except the locked one
+        assert sorted(p.name for p in Path("data").glob("*.csv")) == [
+            f"test.{i}.csv" for i in range(1, 6)
+        ]
+        assert len(list(Path("data").glob(".ncconvert-manifest.shard-*"))) == 2
+
+        result = runner.invoke(merge_app, args=("data", "--verbose"))
+        assert result.exit_code == 0, result.stdout
+        assert "Merged 2 shard manifest(s)" in result.stdout
+
+        result = runner.invoke(
+            merge_app,
+            args=("data", "--profiles", "profiles/*.json", "--profile", "all.json"),
+        )
+        assert result.exit_code == 0, result.stdout
+        manifest = json.loads(Path("data/.ncconvert-manifest.json").read_text())
+        assert len(manifest) == 5
+        assert len(json.loads(Path("all.json").read_text())["files"]) == 5
+
+        result = runner.invoke(app, args=("to_csv", "test.0.nc", "--shard", "2/2"))
+        assert result.exit_code != 0
+
+
+def test_convert_cli_url_output(dataset: xr.Dataset):
+    import fsspec
+
+    from ncconvert.cli import app
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+
+    runner = CliRunner()
+    fs = fsspec.filesystem("memory")
+
+    with runner.isolated_filesystem() as folder:
+        dataset.to_netcdf("test.nc")
+        output_dir = f"memory://{Path(folder).name}/outputs"
+
+        result = runner.invoke(
+            app, args=("to_csv", "test.nc", "--output-dir", output_dir)
+        )
+        assert result.exit_code == 0, result.stdout
+        assert fs.exists(f"{output_dir}/test.csv")
+        assert fs.exists(f"{output_dir}/test.json")
+
+        # The manifest is kept in the output dir, which must be local for it
+        result = runner.invoke(
+            app, args=("to_csv", "test.nc", "--output-dir", output_dir, "--incremental")
+        )
+        assert result.exit_code == 2
+        fs.rm(f"/{Path(folder).name}", recursive=True)
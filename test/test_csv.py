@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 
 import pandas as pd
+import pytest
 import xarray as xr
 
 
@@ -115,3 +116,258 @@ def test_faceted_csv(dataset: xr.Dataset, bad_dataset: xr.Dataset):
 
     os.remove(output_path)
     os.remove(metadata_path)
+
+
+def test_chunked_csv(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv, to_faceted_dim_csv
+
+    for converter in [to_csv, to_faceted_dim_csv]:
+        expected_path, _ = converter(dataset, Path(".tmp/data/expected.csv"), False)
+
+        filepath = Path(".tmp/data/chunked.csv")
+        output_path, metadata_path = converter(
+            dataset, filepath, metadata=False, chunk_size=len(dataset.height)
+        )
+
+        assert output_path == filepath
+        assert metadata_path is None
+        assert output_path.read_bytes() == expected_path.read_bytes()
+
+        os.remove(output_path)
+        os.remove(expected_path)
+
+
+def test_chunked_csv_dim_without_coords(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv
+
+    # Neither dimension has a coordinate variable, so rows are numbered by position
+    dataset = dataset.drop_vars(["time", "height"])
+
+    expected_path, _ = to_csv(dataset, Path(".tmp/data/expected.csv"), False)
+    output_path, _ = to_csv(
+        dataset, Path(".tmp/data/chunked.csv"), False, chunk_size=2 * 4
+    )
+    assert output_path.read_bytes() == expected_path.read_bytes()
+
+    os.remove(output_path)
+    os.remove(expected_path)
+
+
+def test_chunked_csv_empty_selection(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv, to_csv_collection, to_faceted_dim_csv
+
+    for converter in [to_csv, to_faceted_dim_csv, to_csv_collection]:
+        expected, _ = converter(
+            dataset, Path(".tmp/data/expected.nc"), False, time_start="2023-01-01"
+        )
+        output, _ = converter(
+            dataset,
+            Path(".tmp/data/chunked.nc"),
+            False,
+            time_start="2023-01-01",
+            chunk_size=4,
+        )
+        # The header is written even though there are no rows
+        output_paths = output if isinstance(output, tuple) else (output,)
+        expected_paths = expected if isinstance(expected, tuple) else (expected,)
+        for output_path, expected_path in zip(output_paths, expected_paths):
+            assert output_path.read_text() == expected_path.read_text() != ""
+            os.remove(output_path)
+            os.remove(expected_path)
+
+
+def test_dask_chunked_csv(dataset: xr.Dataset):
+    pytest.importorskip("dask")
+    from ncconvert.csv import to_csv, to_csv_collection, to_faceted_dim_csv
+
+    chunked = dataset.chunk({"time": 1})
+
+    for converter in [to_csv, to_faceted_dim_csv]:
+        expected_path, _ = converter(dataset, Path(".tmp/data/expected.csv"), False)
+        output_path, _ = converter(chunked, Path(".tmp/data/dask.csv"), False)
+        assert output_path.read_bytes() == expected_path.read_bytes()
+        os.remove(output_path)
+        os.remove(expected_path)
+
+    expected_paths, _ = to_csv_collection(dataset, Path(".tmp/data/expected"), False)
+    output_paths, _ = to_csv_collection(chunked, Path(".tmp/data/dask"), False)
+    for output_path, expected_path in zip(output_paths, expected_paths):
+        assert output_path.read_bytes() == expected_path.read_bytes()
+        os.remove(output_path)
+        os.remove(expected_path)
+
+
+def test_faceted_csv_dim_without_coords(dataset: xr.Dataset):
+    from ncconvert.csv import to_faceted_dim_csv
+
+    dataset = dataset.copy()
+    dataset["bounds"] = (("time", "bound"), [[0, 1], [1, 2], [2, 3]])
+
+    filepath = Path(".tmp/data/faceted_bounds.csv")
+    output_path, _ = to_faceted_dim_csv(dataset, filepath, metadata=False)
+
+    df = pd.read_csv(output_path)
+    assert list(df.columns)[-2:] == ["bounds_0", "bounds_1"]
+    assert list(df["bounds_1"]) == [1, 2, 3]
+
+    os.remove(output_path)
+
+
+def test_faceted_csv_second_dim_coords(dataset: xr.Dataset):
+    from ncconvert.csv import to_faceted_dim_csv
+
+    dataset = dataset.assign_coords(label=("height", ["a", "b", "c", "d"]))
+
+    filepath = Path(".tmp/data/faceted_labels.csv")
+    output_path, metadata_path = to_faceted_dim_csv(dataset, filepath)
+
+    # A coordinate along the second dimension is flattened like a data variable
+    df = pd.read_csv(output_path)
+    labels = [f"label_{h}m" for h in dataset.height.values]
+    assert list(df.columns[1:5]) == labels
+    assert df[labels].values.tolist() == [["a", "b", "c", "d"]] * len(dataset.time)
+    assert "label" in json.loads(metadata_path.read_text())["coords"]
+
+    os.remove(output_path)
+    os.remove(metadata_path)
+
+
+def test_long_csv(dataset: xr.Dataset):
+    from ncconvert.csv import to_long_csv
+
+    filepath = Path(".tmp/data/long.csv")
+
+    output_path, metadata_path = to_long_csv(dataset, filepath)
+    assert output_path == filepath
+    assert metadata_path == filepath.with_suffix(".json")
+
+    df = pd.read_csv(output_path)
+    assert list(df.columns) == ["variable", "time", "height", "value"]
+    # Each value is written once instead of broadcast over every dimension
+    assert len(df) == sum(dataset[v].size for v in dataset.data_vars)
+    static = df[df["variable"] == "static"]
+    assert static["time"].isna().all() and static["height"].isna().all()
+    assert static["value"].tolist() == [1.5]
+    assert df["height"].dropna().tolist() == [0, 10, 20, 30] * 3 + [0, 10, 20, 30]
+
+    # Chunking gives the same bytes
+    chunked_path, _ = to_long_csv(
+        dataset, ".tmp/data/long_chunked.csv", metadata=False, chunk_size=4
+    )
+    assert chunked_path.read_text() == output_path.read_text()
+    assert "10.0" not in output_path.read_text()  # Nullable ints aren't floats
+
+    os.remove(output_path)
+    os.remove(metadata_path)
+    os.remove(chunked_path)
+
+
+def test_long_csv_empty_selection(dataset: xr.Dataset):
+    from ncconvert.csv import to_long_csv
+
+    # Only variables dimensioned by time, none of which have values after time_start
+    dataset = dataset[["temperature", "humidity"]]
+
+    for kwargs in [{}, {"chunk_size": 4}, {"csv_engine": "pyarrow"}]:
+        output_path, _ = to_long_csv(
+            dataset,
+            Path(".tmp/data/long_empty.csv"),
+            metadata=False,
+            time_start="2023-01-01",
+            **kwargs,
+        )
+        assert output_path.read_text() == "variable,time,height,value\n"
+        os.remove(output_path)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+def test_csv_engines(dataset: xr.Dataset, compression: str):
+    import io
+
+    import pyarrow as pa
+
+    from ncconvert.csv import to_csv, to_csv_collection, to_faceted_dim_csv
+
+    def read_bytes(path: Path) -> bytes:
+        if compression is None:
+            return path.read_bytes()
+        with pa.input_stream(str(path), compression=compression) as f:
+            return f.read()
+
+    # Without floats, the pyarrow engine writes the same bytes as pandas
+    int_dataset = dataset.copy()
+    for name in int_dataset.data_vars:
+        int_dataset[name] = (int_dataset[name] * 10).astype("int64")
+    int_dataset["label"] = ("height", ["a", "b", "c, d", 'e "f"'])
+
+    for converter in (to_csv, to_csv_collection, to_faceted_dim_csv):
+        expected, _ = converter(int_dataset, ".tmp/data/engines.pandas.csv", False)
+        for chunk_size in (None, 4):
+            actual, _ = converter(
+                int_dataset,
+                ".tmp/data/engines.pyarrow.csv",
+                False,
+                csv_engine="pyarrow",
+                compression=compression,
+                chunk_size=chunk_size,
+            )
+            expected_paths = expected if isinstance(expected, tuple) else (expected,)
+            actual_paths = actual if isinstance(actual, tuple) else (actual,)
+            for expected_path, actual_path in zip(expected_paths, actual_paths):
+                if compression == "gzip":
+                    assert actual_path.name.endswith(".csv.gz")
+                assert read_bytes(actual_path) == expected_path.read_bytes()
+                os.remove(actual_path)
+        for expected_path in expected_paths:
+            os.remove(expected_path)
+
+    # Floats are formatted differently but have the same values
+    expected, _ = to_csv(dataset, ".tmp/data/engines.pandas.csv", False)
+    actual, _ = to_csv(
+        dataset,
+        ".tmp/data/engines.pyarrow.csv",
+        False,
+        csv_engine="pyarrow",
+        compression=compression,
+    )
+    pd.testing.assert_frame_equal(
+        pd.read_csv(io.BytesIO(read_bytes(actual))), pd.read_csv(expected)
+    )
+    os.remove(expected)
+    os.remove(actual)
+
+    with pytest.raises(ValueError, match="not supported by the pyarrow csv engine"):
+        to_csv(
+            dataset,
+            ".tmp/data/engines.csv",
+            False,
+            csv_engine="pyarrow",
+            to_csv_kwargs={"float_format": "%.2f"},
+        )
+
+
+@pytest.mark.parametrize("chunk_size", [None, 5])
+def test_csv_collection_group_workers(dataset: xr.Dataset, chunk_size: int):
+    from ncconvert.csv import to_csv_collection
+
+    filepath = Path(".tmp/data/group_workers.20220405.000000.csv")
+
+    expected_paths, _ = to_csv_collection(
+        dataset, filepath, metadata=False, chunk_size=chunk_size
+    )
+    expected = {path: path.read_bytes() for path in expected_paths}
+
+    output_paths, _ = to_csv_collection(
+        dataset,
+        filepath,
+        metadata=False,
+        chunk_size=chunk_size,
+        group_workers=4,
+        group_memory_budget=1000,
+    )
+
+    # The same files with the same contents, in the same order
+    assert output_paths == expected_paths
+    for path in output_paths:
+        assert path.read_bytes() == expected[path]
+        os.remove(path)
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+import pytest
+
+
+def test_manifest(tmp_path: Path):
+    from ncconvert.manifest import Manifest
+
+    input_file = tmp_path / "input.nc"
+    input_file.write_bytes(b"data")
+    output_file = tmp_path / "output" / "input.csv"
+    output_file.parent.mkdir()
+    output_file.write_text("a,b\n")
+
+    manifest = Manifest.load(output_file.parent)
+    options = {"metadata": True}
+    assert not manifest.is_current(input_file, "to_csv", options)
+
+    manifest.record(input_file, "to_csv", options, [output_file], content_hash=True)
+    manifest.save()
+
+    manifest = Manifest.load(output_file.parent)
+    assert manifest.is_current(input_file, "to_csv", options)
+    assert not manifest.is_current(input_file, "to_parquet", options)
+    assert not manifest.is_current(input_file, "to_csv", {"metadata": False})
+
+    # Touching the input invalidates the entry unless the content hash is checked
+    stat = input_file.stat()
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not manifest.is_current(input_file, "to_csv", options)
+    assert manifest.is_current(input_file, "to_csv", options, content_hash=True)
+
+    # Changing the output means it is no longer current
+    output_file.write_text("a,b\n1,2\n")
+    assert not manifest.is_current(input_file, "to_csv", options, content_hash=True)
+
+
+def test_atomic_write(tmp_path: Path):
+    from ncconvert.storage import _atomic_write
+
+    filepath = tmp_path / "out.csv"
+    with pytest.raises(RuntimeError):
+        with _atomic_write(filepath) as tmp:
+            tmp.write_text("partial")
+            raise RuntimeError("interrupted")
+
+    assert not filepath.exists()
+    assert not list(tmp_path.iterdir())
+
+    with _atomic_write(filepath) as tmp:
+        tmp.write_text("complete")
+    assert filepath.read_text() == "complete"
+    assert list(tmp_path.iterdir()) == [filepath]
+
+
+def test_merge_manifests(tmp_path: Path):
+    from ncconvert.manifest import MANIFEST_FILENAME, Manifest, merge_manifests
+
+    outputs = []
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.nc").write_bytes(b"data")
+        outputs.append(tmp_path / f"{name}.csv")
+        outputs[-1].write_text("data")
+
+    # "a" was converted before the run, "b" and "c" by one shard each
+    manifest = Manifest.load(tmp_path)
+    manifest.record(tmp_path / "a.nc", "to_csv", {}, [outputs[0]])
+    manifest.save()
+    for index, name in enumerate(("b", "c")):
+        shard_manifest = Manifest.load(tmp_path, shard=(index, 2))
+        assert shard_manifest.is_current(tmp_path / "a.nc", "to_csv", {})
+        shard_manifest.record(
+            tmp_path / f"{name}.nc", "to_csv", {}, [outputs[index + 1]]
+        )
+        shard_manifest.save()
+    assert len(list(tmp_path.glob(".ncconvert-manifest.shard-*.json"))) == 2
+
+    manifest, shard_paths = merge_manifests(tmp_path)
+
+    assert len(shard_paths) == 2
+    assert not any(path.exists() for path in shard_paths)
+    assert manifest.path == tmp_path / MANIFEST_FILENAME
+    manifest = Manifest.load(tmp_path)
+    assert sorted(manifest.entries) == [str(tmp_path / f"{n}.nc") for n in "abc"]
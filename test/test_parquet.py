@@ -2,7 +2,9 @@ import json
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pytest
 import xarray as xr
 
 
@@ -67,3 +69,414 @@ def test_parquet_collection(dataset: xr.Dataset):
     for output_path in output_paths:
         os.remove(output_path)
     os.remove(metadata_path)
+
+
+def test_streaming_parquet_collection_dim_without_coords(dataset: xr.Dataset):
+    from ncconvert.parquet import to_parquet_collection
+
+    dataset = dataset.copy()
+    dataset["bounds"] = (("time", "bound"), [[0, 1], [1, 2], [2, 3]])
+    dataset["bound_width"] = ("bound", [1.0, 2.0])
+
+    expected_paths, _ = to_parquet_collection(
+        dataset, Path(".tmp/data/expected"), False
+    )
+    output_paths, _ = to_parquet_collection(
+        dataset, Path(".tmp/data/streamed"), False, row_group_size=2
+    )
+
+    assert len(output_paths) == 6
+    for output_path, expected_path in zip(output_paths, expected_paths):
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(output_path), pd.read_parquet(expected_path)
+        )
+        os.remove(output_path)
+        os.remove(expected_path)
+
+
+def test_streaming_parquet(dataset: xr.Dataset):
+    import pyarrow.parquet as pq
+
+    from ncconvert.parquet import to_parquet
+
+    expected_path, _ = to_parquet(dataset, Path(".tmp/data/expected.parquet"), False)
+
+    filepath = Path(".tmp/data/streamed.parquet")
+    output_path, metadata_path = to_parquet(
+        dataset, filepath, metadata=False, row_group_size=len(dataset.height)
+    )
+
+    assert output_path == filepath
+    assert metadata_path is None
+
+    # One row group per time step, but the same data as the non-streaming writer
+    assert pq.ParquetFile(output_path).num_row_groups == len(dataset.time)
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(output_path), pd.read_parquet(expected_path)
+    )
+
+    os.remove(output_path)
+    os.remove(expected_path)
+
+
+def test_streaming_parquet_dim_without_coords(dataset: xr.Dataset):
+    from ncconvert.parquet import to_parquet
+
+    dataset = dataset.drop_vars(["time", "height"])
+
+    for sizes in [{}, {"height": 1}]:
+        ds = dataset.isel(sizes)
+        expected_path, _ = to_parquet(ds, Path(".tmp/data/expected.parquet"), False)
+        output_path, _ = to_parquet(
+            ds, Path(".tmp/data/streamed.parquet"), False, row_group_size=2 * 4
+        )
+        # Positions continue across row groups rather than starting again at 0
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(output_path), pd.read_parquet(expected_path)
+        )
+        os.remove(output_path)
+        os.remove(expected_path)
+
+
+def test_streaming_parquet_empty_selection(dataset: xr.Dataset):
+    from ncconvert.parquet import to_parquet
+
+    expected_path, _ = to_parquet(
+        dataset, Path(".tmp/data/expected.parquet"), False, time_start="2023-01-01"
+    )
+    for engine in ["pandas", "arrow"]:
+        output_path, _ = to_parquet(
+            dataset,
+            Path(".tmp/data/streamed.parquet"),
+            metadata=False,
+            time_start="2023-01-01",
+            row_group_size=4,
+            engine=engine,
+        )
+        # An empty file with the same columns as the non-streaming writer's
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(output_path), pd.read_parquet(expected_path)
+        )
+        os.remove(output_path)
+    os.remove(expected_path)
+
+
+def test_dask_chunked_parquet(dataset: xr.Dataset):
+    pytest.importorskip("dask")
+    import pyarrow.parquet as pq
+
+    from ncconvert.parquet import to_parquet, to_parquet_collection
+
+    chunked = dataset.chunk({"time": 1})
+
+    expected_path, _ = to_parquet(dataset, Path(".tmp/data/expected.parquet"), False)
+    output_path, _ = to_parquet(chunked, Path(".tmp/data/dask.parquet"), False)
+
+    # One row group per dask chunk
+    assert pq.ParquetFile(output_path).num_row_groups == len(dataset.time)
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(output_path), pd.read_parquet(expected_path)
+    )
+    os.remove(output_path)
+    os.remove(expected_path)
+
+    expected_paths, _ = to_parquet_collection(
+        dataset, Path(".tmp/data/expected"), False
+    )
+    output_paths, _ = to_parquet_collection(chunked, Path(".tmp/data/dask"), False)
+    for output_path, expected_path in zip(output_paths, expected_paths):
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(output_path), pd.read_parquet(expected_path)
+        )
+        os.remove(output_path)
+        os.remove(expected_path)
+
+
+def test_dask_chunked_dim_without_coords(dataset: xr.Dataset):
+    pytest.importorskip("dask")
+    from ncconvert.csv import to_csv
+    from ncconvert.parquet import to_parquet
+
+    dataset = dataset.drop_vars(["time", "height"])
+    chunked = dataset.chunk({"time": 2, "height": 3})
+
+    expected_path, _ = to_parquet(dataset, Path(".tmp/data/expected.parquet"), False)
+    output_path, _ = to_parquet(chunked, Path(".tmp/data/dask.parquet"), False)
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(output_path), pd.read_parquet(expected_path)
+    )
+
+    expected_csv, _ = to_csv(dataset, Path(".tmp/data/expected.csv"), False)
+    output_csv, _ = to_csv(chunked, Path(".tmp/data/dask.csv"), False)
+    assert output_csv.read_bytes() == expected_csv.read_bytes()
+
+    for path in (output_path, expected_path, output_csv, expected_csv):
+        os.remove(path)
+
+
+def test_arrow_engine_parquet(dataset: xr.Dataset):
+    import pyarrow.parquet as pq
+
+    from ncconvert.parquet import to_parquet, to_parquet_collection
+
+    def assert_same_file(output_path: Path, expected_path: Path):
+        output, expected = pq.read_table(output_path), pq.read_table(expected_path)
+        assert output.schema.equals(expected.schema, check_metadata=True)
+        assert output.equals(expected)
+
+    expected_path, _ = to_parquet(dataset, Path(".tmp/data/expected.parquet"), False)
+    for row_group_size in [None, len(dataset.height)]:
+        output_path, _ = to_parquet(
+            dataset,
+            Path(".tmp/data/arrow.parquet"),
+            metadata=False,
+            engine="arrow",
+            row_group_size=row_group_size,
+        )
+        assert_same_file(output_path, expected_path)
+        os.remove(output_path)
+    os.remove(expected_path)
+
+    expected_paths, _ = to_parquet_collection(
+        dataset, Path(".tmp/data/expected"), False
+    )
+    output_paths, _ = to_parquet_collection(
+        dataset, Path(".tmp/data/arrow"), False, engine="arrow"
+    )
+    for output_path, expected_path in zip(output_paths, expected_paths):
+        assert_same_file(output_path, expected_path)
+        os.remove(output_path)
+        os.remove(expected_path)
+
+    with pytest.raises(ValueError):
+        to_parquet(dataset, Path(".tmp/data/bad.parquet"), False, engine="bad")
+
+
+def test_arrow_engine_parquet_strings(dataset: xr.Dataset):
+    from ncconvert.parquet import to_parquet
+
+    dataset = dataset.copy()
+    dataset["flag"] = ("time", np.array(["good", "bad", "good"], dtype=object))
+    dataset["code"] = ("height", np.array([b"a", b"b", b"c", b"d"]))
+
+    expected_path, _ = to_parquet(dataset, Path(".tmp/data/expected.parquet"), False)
+    for row_group_size in [None, len(dataset.height)]:
+        output_path, _ = to_parquet(
+            dataset,
+            Path(".tmp/data/arrow.parquet"),
+            metadata=False,
+            engine="arrow",
+            row_group_size=row_group_size,
+        )
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(output_path), pd.read_parquet(expected_path)
+        )
+        os.remove(output_path)
+    os.remove(expected_path)
+
+
+def test_parquet_dataset(dataset: xr.Dataset):
+    import json
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    from ncconvert.parquet import compact_parquet_dataset, to_parquet_dataset
+
+    root = Path(".tmp/data/dataset")
+    shutil.rmtree(root, ignore_errors=True)
+
+    next_day = dataset.assign_coords(time=dataset.time + pd.Timedelta("1D"))
+    output_paths, metadata_path = to_parquet_dataset(
+        dataset.assign(pressure=dataset.humidity), root / "test.20220405.000000.nc"
+    )
+    to_parquet_dataset(next_day, root / "test.20220406.000000.nc", False)
+
+    assert metadata_path == root / "test.20220405.000000.json"
+    assert (
+        root / "dim_group=time.height/date=2022-04-05/test.20220405.000000.parquet"
+        in (output_paths)
+    )
+    assert root / "dim_group=height/test.20220405.000000.parquet" in output_paths
+
+    df = pd.read_parquet(root / "dim_group=time.height")
+    assert len(df) == 2 * len(dataset.time) * len(dataset.height)
+    assert sorted(df["date"].unique()) == ["2022-04-05", "2022-04-06"]
+
+    # Columns missing from later appends are filled with nulls
+    df = pd.read_parquet(root / "dim_group=time")
+    assert df["pressure"].isna().sum() == len(dataset.time)
+
+    # Re-converting a file replaces its rows rather than duplicating them
+    to_parquet_dataset(dataset, root / "test.20220405.000000.nc", False)
+    assert len(pd.read_parquet(root / "dim_group=height")) == 2 * len(dataset.height)
+
+    with pytest.raises(ValueError, match="not in the schema"):
+        to_parquet_dataset(
+            dataset.assign(extra=dataset.humidity), root / "bad.nc", False
+        )
+
+    merged = compact_parquet_dataset(root)
+    # Only the partitions without a time dimension have more than one file to merge
+    assert len(merged) == 2
+    assert len(list((root / "dim_group=height").glob("*.parquet"))) == 1
+    assert len(pd.read_parquet(root / "dim_group=height")) == 2 * len(dataset.height)
+
+    # Re-converting a file after it was merged replaces its rows in the merged file
+    to_parquet_dataset(dataset, root / "test.20220405.000000.nc", False)
+    assert len(list((root / "dim_group=height").glob("*.parquet"))) == 2
+    assert len(pd.read_parquet(root / "dim_group=height")) == 2 * len(dataset.height)
+
+    # and its files in partitions it no longer has rows in are removed
+    compact_parquet_dataset(root)
+    to_parquet_dataset(next_day, root / "test.20220405.000000.nc", False)
+    df = pd.read_parquet(root / "dim_group=time.height")
+    assert len(df) == 2 * len(dataset.time) * len(dataset.height)
+    assert list(df["date"].unique()) == ["2022-04-06"]
+    assert not list((root / "dim_group=time.height").glob("date=2022-04-05/*"))
+    assert len(pd.read_parquet(root / "dim_group=height")) == 2 * len(dataset.height)
+
+    # Each file's index lists the files its rows are in, so only those are visited
+    index = json.loads(
+        (root / "_sources/test.20220405.000000.parquet.json").read_text()
+    )
+    assert "dim_group=height/test.20220405.000000.parquet" in index
+    assert not any("2022-04-05" in path for path in index)
+
+    # Files that were merged together can be converted again at the same time
+    compact_parquet_dataset(root)
+    with ThreadPoolExecutor(2) as executor:
+        names = ["test.20220405.000000.nc", "test.20220406.000000.nc"]
+        list(
+            executor.map(lambda n: to_parquet_dataset(dataset, root / n, False), names)
+        )
+    assert len(list((root / "dim_group=height").glob("*.parquet"))) == 2
+    assert len(pd.read_parquet(root / "dim_group=height")) == 2 * len(dataset.height)
+
+    shutil.rmtree(root)
+
+
+def test_long_parquet(dataset: xr.Dataset):
+    import pyarrow.parquet as pq
+
+    from ncconvert.parquet import to_long_parquet
+
+    filepath = Path(".tmp/data/long.parquet")
+
+    output_path, metadata_path = to_long_parquet(dataset, filepath, row_group_size=4)
+    assert output_path == filepath
+
+    table = pq.read_table(output_path)
+    assert table.column_names == ["variable", "time", "height", "value"]
+    assert table.num_rows == sum(dataset[v].size for v in dataset.data_vars)
+    assert str(table.schema.field("height").type) == "int64"
+    assert pq.ParquetFile(output_path).metadata.num_row_groups == 6
+
+    df = table.to_pandas()
+    humidity = df[df["variable"] == "humidity"]
+    assert humidity["value"].tolist() == dataset.humidity.values.tolist()
+    assert (humidity["time"].values == dataset.time.values).all()
+
+    os.remove(output_path)
+    os.remove(metadata_path)
+
+
+@pytest.mark.parametrize("engine", ["pandas", "arrow"])
+def test_parquet_collection_group_workers(dataset: xr.Dataset, engine: str):
+    from ncconvert.parquet import to_parquet_collection
+
+    filepath = Path(".tmp/data/group_workers.20220405.000000.parquet")
+
+    expected_paths, _ = to_parquet_collection(
+        dataset, filepath, metadata=False, engine=engine
+    )
+    expected = {path: pd.read_parquet(path) for path in expected_paths}
+
+    output_paths, _ = to_parquet_collection(
+        dataset, filepath, metadata=False, engine=engine, group_workers=4
+    )
+
+    assert output_paths == expected_paths
+    for path in output_paths:
+        pd.testing.assert_frame_equal(pd.read_parquet(path), expected[path])
+        os.remove(path)
+
+
+def test_parquet_selection(dataset: xr.Dataset):
+    from ncconvert.parquet import to_parquet_collection
+
+    filepath = Path(".tmp/data/selection.20220405.000000.parquet")
+
+    output_paths, metadata_path = to_parquet_collection(
+        dataset,
+        filepath,
+        variables=["temperature", "humidity"],
+        time_start="2022-04-05T08:00",
+        isel={"height": slice(0, 2)},
+    )
+
+    assert output_paths == (
+        filepath.with_suffix(".time.height.parquet"),
+        filepath.with_suffix(".time.parquet"),
+    )
+    df = pd.read_parquet(output_paths[0])
+    assert len(df.index) == 2 * 2
+    assert len(pd.read_parquet(output_paths[1]).index) == 2
+
+    # The metadata only describes the selected subset
+    meta = json.loads(metadata_path.read_text())
+    assert sorted(meta["data_vars"]) == ["humidity", "temperature"]
+    assert meta["dims"] == {"time": 2, "height": 2}
+
+    for path in (*output_paths, metadata_path):
+        os.remove(path)
+
+
+@pytest.mark.parametrize("engine", ["pandas", "arrow"])
+def test_compact_parquet(dataset: xr.Dataset, engine: str):
+    import numpy as np
+    import pyarrow.parquet as pq
+
+    from ncconvert.parquet import to_parquet, to_parquet_collection
+
+    # An int16 source variable that xarray decoded to float to mask its _FillValue
+    dataset = dataset.assign(
+        counts=("time", [1.0, np.nan, 3.0]), pressure=("time", [1000.1, 999.9, 1001.3])
+    )
+    dataset["counts"].encoding.update(dtype="int16", _FillValue=-9999)
+    filepath = Path(f".tmp/data/compact_{engine}.20220405.000000.parquet")
+
+    output_path, _ = to_parquet(
+        dataset, filepath, metadata=False, compact=True, engine=engine
+    )
+
+    df = pd.read_parquet(output_path)
+    assert df["counts"].dtype == "Int16"
+    assert df["counts"].isna().tolist() == [False] * 4 + [True] * 4 + [False] * 4
+    assert df["other"].dtype == "uint8"
+    assert df["temperature"].dtype == "float32"  # Every value is exact in float32
+    assert df["temperature"].tolist() == dataset["temperature"].values.ravel().tolist()
+    assert df["pressure"].dtype == "float64"  # 1000.1 isn't
+
+    columns = pq.ParquetFile(output_path).metadata.row_group(0)
+    encodings = {
+        columns.column(i).path_in_schema: columns.column(i).encodings
+        for i in range(columns.num_columns)
+    }
+    assert "BYTE_STREAM_SPLIT" in encodings["temperature"]
+    assert "RLE_DICTIONARY" in encodings["humidity"]  # Repeated across height
+    assert "RLE_DICTIONARY" in encodings["height"]  # Tiled across time
+    os.remove(output_path)
+
+    output_paths, _ = to_parquet_collection(
+        dataset, filepath, metadata=False, compact=True, engine=engine
+    )
+    time_df = pd.read_parquet(filepath.with_suffix(".time.parquet"))
+    assert time_df["counts"].dtype == "Int16"
+    assert time_df["counts"].tolist()[:2] == [1, pd.NA]
+    file_metadata = pq.ParquetFile(filepath.with_suffix(".time.parquet")).metadata
+    time_index = file_metadata.schema.names.index("time")
+    time_column = file_metadata.row_group(0).column(time_index)
+    assert "DELTA_BINARY_PACKED" in time_column.encodings  # Sorted integers
+
+    for path in output_paths:
+        os.remove(path)
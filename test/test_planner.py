@@ -0,0 +1,56 @@
+import pytest
+import xarray as xr
+
+
+def test_estimate_conversion(dataset: xr.Dataset):
+    from ncconvert.planner import estimate_conversion
+
+    estimate = estimate_conversion(dataset, "to_csv")
+    assert estimate["rows"] == dataset.sizes["time"] * dataset.sizes["height"]
+    assert estimate["columns"] == len(dataset.data_vars)
+    assert estimate["peak_bytes"] > estimate["bytes"] > 0
+
+    # Collections only take the cartesian product of each variable's own dims
+    estimate = estimate_conversion(dataset, "to_csv_collection")
+    assert [o["dims"] for o in estimate["outputs"]] == [
+        list(dims) for dims in [("time", "height"), ("time",), ("height",), ()]
+    ]
+
+    estimate = estimate_conversion(dataset, "to_faceted_dim_csv")
+    assert estimate["rows"] == dataset.sizes["time"]
+
+
+def test_plan_conversion(dataset: xr.Dataset):
+    from ncconvert.planner import plan_conversion
+
+    # Add an unrelated dimension that blows up the cartesian product
+    wide = dataset.expand_dims(wavelength=range(1000)).assign(
+        static=dataset.static.expand_dims(wavelength=range(1000))
+    )
+    full = plan_conversion(wide, "to_csv")
+    assert full["strategy"] == "default"
+
+    limit = full["peak_bytes"] // 10
+    plan = plan_conversion(wide, "to_csv", limit)
+    assert plan["strategy"] == "chunk"
+    assert plan["peak_bytes"] <= limit
+    assert 0 < plan["kwargs"]["chunk_size"] < plan["rows"]
+
+    plan = plan_conversion(wide, "to_parquet", limit, "split")
+    assert plan["method"] == "to_parquet_collection"
+
+    assert plan_conversion(wide, "to_csv", limit, "refuse")["strategy"] == "refuse"
+    assert plan_conversion(wide, "to_csv", 1)["kwargs"] == {"chunk_size": 1}
+
+    with pytest.raises(ValueError):
+        plan_conversion(wide, "to_csv", limit, "ignore")
+
+
+def test_parse_size():
+    from ncconvert.planner import _parse_size
+
+    assert _parse_size("4GB") == 4 * 1000**3
+    assert _parse_size("512 MiB") == 512 * 1024**2
+    assert _parse_size("1000") == 1000
+    with pytest.raises(ValueError):
+        _parse_size("lots")
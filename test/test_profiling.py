@@ -0,0 +1,83 @@
+import os
+
+import xarray as xr
+
+
+def test_profiler(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv
+    from ncconvert.parquet import to_parquet
+    from ncconvert.profiling import Profiler
+
+    with Profiler("test.nc") as profiler:
+        to_csv(dataset, ".tmp/data/profiled.csv", profiler=profiler)
+        to_parquet(
+            dataset, ".tmp/data/profiled.parquet", profiler=profiler, row_group_size=4
+        )
+
+    report = profiler.report()
+    assert report["file"] == "test.nc"
+    assert [s["stage"] for s in report["stages"]] == [
+        "to_dataframe",
+        "write",
+        "metadata",
+        "write",
+        "metadata",
+    ]
+    to_dataframe, csv_write, _, parquet_write, _ = report["stages"]
+    assert to_dataframe["rows"] == 12
+    assert to_dataframe["columns"] == len(dataset.data_vars)
+    assert to_dataframe["peak_memory"] > 0
+    assert csv_write["bytes"] == os.path.getsize(".tmp/data/profiled.csv")
+    assert parquet_write["rows"] == 12
+    # pyarrow's allocations aren't seen by tracemalloc, so they are counted separately
+    assert parquet_write["arrow_memory"] > 0
+    assert parquet_write["peak_memory"] >= parquet_write["arrow_memory"]
+    assert all(s["wall_time"] > 0 for s in report["stages"])
+
+    for name in ["profiled.csv", "profiled.json", "profiled.parquet"]:
+        os.remove(f".tmp/data/{name}")
+
+
+def test_profiler_off(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv
+    from ncconvert.profiling import NULL_PROFILER
+
+    # Converters use the null profiler by default, which records nothing
+    to_csv(dataset, ".tmp/data/unprofiled.csv")
+    assert not hasattr(NULL_PROFILER, "stages")
+
+    os.remove(".tmp/data/unprofiled.csv")
+    os.remove(".tmp/data/unprofiled.json")
+
+
+def test_profiler_group_workers(dataset: xr.Dataset):
+    from contextlib import contextmanager
+
+    from ncconvert.parquet import to_parquet_collection
+    from ncconvert.profiling import Profiler
+
+    # tracemalloc's peak is shared by every thread, so groups are written one at a time
+    class CountingProfiler(Profiler):
+        active = overlapping = 0
+
+        @contextmanager
+        def stage(self, name, **info):
+            self.active += 1
+            self.overlapping = max(self.overlapping, self.active)
+            try:
+                with super().stage(name, **info) as record:
+                    yield record
+            finally:
+                self.active -= 1
+
+    with CountingProfiler("test.nc") as profiler:
+        filepaths, metadata_path = to_parquet_collection(
+            dataset, ".tmp/data/profiled.parquet", profiler=profiler, group_workers=4
+        )
+
+    assert len(filepaths) > 1
+    assert profiler.overlapping == 1
+    assert [s["stage"] for s in profiler.stages].count("write") == len(filepaths)
+
+    for filepath in [*filepaths, metadata_path]:
+        os.remove(filepath)
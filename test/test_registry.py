@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+import xarray as xr
+
+
+def test_registry(monkeypatch: pytest.MonkeyPatch):
+    from importlib.metadata import EntryPoint
+
+    import ncconvert.registry
+    from ncconvert.csv import to_csv
+    from ncconvert.registry import ConverterRegistry
+
+    def to_nothing(dataset: xr.Dataset, filepath: Path, **kwargs: Any):
+        return Path(filepath), None
+
+    entry_points = [
+        EntryPoint(
+            "to_nothing", "my_package.nothing:to_nothing", "ncconvert.converters"
+        ),
+        EntryPoint("to_csv", "not_a_module:to_csv", "ncconvert.converters"),
+    ]
+    monkeypatch.setattr(
+        ncconvert.registry, "_get_entry_points", lambda group: entry_points
+    )
+    monkeypatch.setattr(EntryPoint, "load", lambda self: to_nothing, raising=False)
+
+    registry = ConverterRegistry({"to_csv": "ncconvert.csv:to_csv"})
+    assert list(registry) == ["to_csv", "to_nothing"]
+
+    # Built-in converters take precedence over entry points with the same name
+    assert registry["to_csv"] is to_csv
+    assert registry["to_nothing"] is to_nothing
+
+    registry.register("to_something", to_nothing)
+    assert "to_something" in registry and len(registry) == 3
+
+    with pytest.raises(KeyError):
+        registry["to_excel"]
+
+
+def test_builtin_converters():
+    from ncconvert.registry import CONVERTERS
+
+    for name in CONVERTERS:
+        assert callable(CONVERTERS[name])
+        assert CONVERTERS[name].__name__ == name
@@ -0,0 +1,74 @@
+import os
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.parametrize("by", ["hash", "size"])
+def test_shard_files(tmp_path: Path, by: str):
+    from ncconvert.shard import _shard_files
+
+    files = []
+    for i in range(20):
+        file = tmp_path / f"input.{i:02d}.nc"
+        file.write_bytes(b"x" * (i + 1) * 100)
+        files.append(file)
+
+    shards = [_shard_files(files, index, 3, by=by) for index in range(3)]
+
+    # Every file is in exactly one shard, in the original order
+    assert sorted(f for shard in shards for f in shard) == files
+    assert all(shard == sorted(shard) for shard in shards)
+    # The assignment doesn't depend on the order of the files
+    assert _shard_files(files[::-1], 1, 3, by=by) == shards[1][::-1]
+    if by == "size":
+        sizes = [sum(f.stat().st_size for f in shard) for shard in shards]
+        assert max(sizes) - min(sizes) <= 2000  # At most the largest file
+    else:
+        # Adding a file doesn't move any of the others
+        extra = tmp_path / "input.20.nc"
+        extra.write_bytes(b"x")
+        assert set(shards[0]) <= set(_shard_files([*files, extra], 0, 3, by=by))
+
+    with pytest.raises(ValueError):
+        _shard_files(files, 3, 3)
+    with pytest.raises(ValueError):
+        _shard_files(files, 0, 3, by="name")
+
+
+def test_file_locks(tmp_path: Path):
+    import json
+    import socket
+
+    from ncconvert.shard import (
+        STALE_LOCK_AGE,
+        FileLockedError,
+        _acquire_lock,
+        _break_lock,
+        _release_lock,
+    )
+
+    lock_dir = tmp_path / ".ncconvert-locks"
+    lock_path = _acquire_lock(lock_dir, Path("input.nc"))
+    with pytest.raises(FileLockedError):
+        _acquire_lock(lock_dir, Path("other/input.nc"))  # Same name, same outputs
+    _release_lock(lock_path)
+    assert not lock_path.exists()
+
+    # Locks of processes on this host that no longer exist are broken (pids are at
+    # most 2**22 on Linux)...
+    lock_path.write_text(json.dumps({"host": socket.gethostname(), "pid": 2**22 + 1}))
+    assert _acquire_lock(lock_dir, Path("input.nc")) == lock_path
+
+    # ...but locks taken on other hosts are only broken once they are old
+    lock_path.write_text(json.dumps({"host": "another-node", "pid": os.getpid()}))
+    with pytest.raises(FileLockedError):
+        _acquire_lock(lock_dir, Path("input.nc"))
+    assert _acquire_lock(lock_dir, Path("input.nc"), stale_after=-1) == lock_path
+
+    # A process that found the lock stale after another process broke it and took a
+    # fresh one leaves the fresh lock in place
+    owner = lock_path.read_text()
+    assert not _break_lock(lock_path, STALE_LOCK_AGE)
+    assert lock_path.read_text() == owner
+    assert [p.name for p in lock_dir.iterdir()] == [lock_path.name]
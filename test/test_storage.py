@@ -0,0 +1,155 @@
+import pickle
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+
+@pytest.fixture
+def memory_root(tmp_path: Path):
+    import fsspec
+
+    # The memory filesystem is shared by the whole process, so each test gets a folder
+    fs = fsspec.filesystem("memory")
+    root = f"/{tmp_path.name}"
+    yield fs, root
+    if fs.exists(root):
+        fs.rm(root, recursive=True)
+
+
+def test_url_paths():
+    from ncconvert.storage import _URL, _as_path
+
+    url = _as_path("s3://bucket/folder/name.nc", {"storage_options": {"anon": True}})
+    assert isinstance(url, _URL) and url == "s3://bucket/folder/name.nc"
+    assert url.name == "name.nc"
+    assert url.parent == "s3://bucket/folder"
+    assert url.with_suffix(".time.csv") == "s3://bucket/folder/name.time.csv"
+    assert url.parent / "_schema.json" == "s3://bucket/folder/_schema.json"
+    assert str((url.parent / "a" / "b.csv").relative_to(url.parent)) == "a/b.csv"
+
+    # Derived and unpickled URLs keep the filesystem's options
+    derived = pickle.loads(pickle.dumps(url.with_name("other.csv")))
+    assert derived.storage_options == {"anon": True}
+    assert _as_path(derived) is derived
+
+    assert _as_path("folder/name.nc") == Path("folder/name.nc")
+
+
+@pytest.mark.parametrize(
+    "method, kwargs",
+    [
+        ("to_csv", {}),
+        ("to_csv", {"compression": "zstd", "chunk_size": 4}),
+        ("to_parquet", {"row_group_size": 4}),
+        ("to_parquet_collection", {"group_workers": 2}),
+        ("to_arrow_ipc_collection", {}),
+        ("to_long_parquet", {}),
+    ],
+)
+def test_convert_to_url(
+    dataset: xr.Dataset,
+    tmp_path: Path,
+    memory_root: Any,
+    method: str,
+    kwargs: dict,
+):
+    import ncconvert
+
+    fs, root = memory_root
+    converter: Callable[..., Any] = getattr(ncconvert, method)
+
+    local_outputs, local_metadata = converter(dataset, tmp_path / "test.nc", **kwargs)
+    outputs, metadata = converter(dataset, f"memory://{root}/out/test.nc", **kwargs)
+
+    # The same files are written, and their URLs are returned
+    if isinstance(outputs, str):
+        outputs, local_outputs = (outputs,), (local_outputs,)
+    assert [o.rpartition("/")[2] for o in outputs] == [o.name for o in local_outputs]
+    for url, path in zip(outputs, local_outputs):
+        assert url.startswith(f"memory://{root}/out/")
+        assert fs.cat_file(url) == path.read_bytes()
+    assert fs.cat_file(metadata) == local_metadata.read_bytes()
+    # Nothing was left behind in the filesystem's (unused) transaction
+    assert not fs.transaction.files
+
+
+def test_parquet_dataset_url(dataset: xr.Dataset, memory_root: Any):
+    from ncconvert import to_parquet_dataset
+
+    fs, root = memory_root
+    to_parquet_dataset(dataset, f"memory://{root}/a.nc")
+    # The stored schemas are read back from the filesystem for later appends
+    outputs, _ = to_parquet_dataset(dataset.drop_vars("other"), f"memory://{root}/b.nc")
+
+    assert f"memory://{root}/dim_group=time/date=2022-04-05/b.parquet" in outputs
+    df = pd.read_parquet(f"memory://{root}/dim_group=time/date=2022-04-05/")
+    assert len(df) == 6 and df["humidity"].notna().all()
+    assert fs.exists(f"{root}/dim_group=time.height/_common_metadata")
+
+    # Converting b.nc again with other times removes its files from the old partition
+    next_day = dataset.assign_coords(time=dataset.time + pd.Timedelta("1D"))
+    to_parquet_dataset(next_day, f"memory://{root}/b.nc")
+    assert not fs.exists(f"{root}/dim_group=time/date=2022-04-05/b.parquet")
+    assert fs.exists(f"{root}/dim_group=time/date=2022-04-06/b.parquet")
+
+
+def test_shared_metadata_url(dataset: xr.Dataset, memory_root: Any):
+    from ncconvert import load_metadata, to_csv
+
+    fs, root = memory_root
+    _, metadata = to_csv(dataset, f"memory://{root}/a.nc", shared_metadata=True)
+    _, expected = to_csv(dataset, f"memory://{root}/expected/a.nc")
+
+    assert len(fs.glob(f"{root}/_schema.*.json")) == 1
+    assert load_metadata(metadata) == load_metadata(expected)
+
+
+def test_failed_write_is_discarded(tmp_path: Path):
+    from ncconvert.storage import _as_path, _open_output, _write_bytes
+
+    url = _as_path(f"file://{tmp_path}/out.csv")
+    _write_bytes(url, b"old")
+
+    # file:// URLs are written like local paths, so the file keeps its contents
+    with pytest.raises(RuntimeError):
+        with _open_output(url) as sink:
+            sink.write_bytes(b"new")
+            raise RuntimeError("interrupted")
+    assert (tmp_path / "out.csv").read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.csv"]
+
+
+def test_url_output_is_written_in_place(memory_root: Any, monkeypatch: Any):
+    from ncconvert.storage import _as_path, _open_output
+
+    # Outputs on object stores are streamed to their final key, never copied or moved
+    fs, root = memory_root
+    monkeypatch.setattr(fs, "mv", None)
+    monkeypatch.setattr(fs, "copy", None)
+    url = _as_path(f"memory://{root}/out.csv")
+    with _open_output(url) as sink:
+        sink.write(b"new")
+    assert fs.cat_file(f"{root}/out.csv") == b"new"
+    assert fs.ls(root, detail=False) == [f"{root}/out.csv"]
+
+
+@pytest.mark.parametrize("scheme", ["", "memory://"])
+def test_create_exclusive(tmp_path: Path, memory_root: Any, scheme: str):
+    from ncconvert.storage import _as_path, _create_exclusive, _hold_lock, _read_bytes
+
+    folder = f"memory://{memory_root[1]}" if scheme else str(tmp_path)
+    filepath = _as_path(f"{folder}/_common_metadata")
+    assert _create_exclusive(filepath, b"first")
+    assert not _create_exclusive(filepath, b"second")
+    assert _read_bytes(filepath) == b"first"
+
+    lock_path = _as_path(f"{folder}/.file.lock")
+    with _hold_lock(lock_path):
+        with pytest.raises(TimeoutError):
+            with _hold_lock(lock_path, timeout=0.1):
+                pass
+    with _hold_lock(lock_path):
+        pass
@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+import xarray as xr
+
+
+def test_shared_metadata(dataset: xr.Dataset):
+    from ncconvert.csv import to_csv
+    from ncconvert.utils import load_metadata
+
+    folder = Path(".tmp/data/shared")
+    shutil.rmtree(folder, ignore_errors=True)
+    dataset = dataset.assign_attrs(history="day 1")
+    day2 = dataset.isel(time=slice(0, 2)).assign_attrs(history="day 2")
+
+    expected = load_metadata(to_csv(dataset, folder / "expected.csv")[1])  # type: ignore
+
+    outputs = [
+        to_csv(ds, folder / f"shared.{i}.csv", shared_metadata=True)
+        for i, ds in enumerate([dataset, day2, dataset])
+    ]
+    schemas = list(folder.glob("_schema.*.json"))
+    assert len(schemas) == 1
+
+    # Per-file metadata only holds what differs from the shared schema
+    sidecar = json.loads(outputs[1][1].read_text())  # type: ignore
+    assert sidecar["schema"] == schemas[0].name
+    assert sidecar["changes"] == {
+        "attrs": {"history": "day 2"},
+        "dims": {"time": 2},
+        "coords": {"time": {"shape": [2]}},
+        "data_vars": {"temperature": {"shape": [2, 4]}, "humidity": {"shape": [2]}},
+    }
+    assert json.loads(outputs[2][1].read_text())["changes"] == {}  # type: ignore
+
+    assert load_metadata(outputs[0][1]) == expected  # type: ignore
+    assert load_metadata(outputs[1][1])["attrs"]["history"] == "day 2"  # type: ignore
+
+    # A dataset with a different structure gets its own schema
+    to_csv(dataset.drop_vars("static"), folder / "other.csv", shared_metadata=True)
+    assert len(list(folder.glob("_schema.*.json"))) == 2
+
+    shutil.rmtree(folder)
+
+
+def test_json_backends(dataset: xr.Dataset):
+    from ncconvert.utils import _dump_metadata
+
+    filepath = Path(".tmp/data/backend.csv")
+
+    expected = json.loads(_dump_metadata(dataset, filepath).read_text())
+
+    compact = _dump_metadata(dataset, filepath, compact_json=True).read_text()
+    assert "\n" not in compact
+    assert json.loads(compact) == expected
+
+    pytest.importorskip("orjson")
+    for compact_json in [True, False]:
+        metadata_path = _dump_metadata(
+            dataset, filepath, json_backend="orjson", compact_json=compact_json
+        )
+        assert json.loads(metadata_path.read_text()) == expected
+
+    with pytest.raises(ValueError):
+        _dump_metadata(dataset, filepath, json_backend="bad")
+
+    os.remove(metadata_path)
+
+
+def test_map_concurrently():
+    import threading
+    import time
+
+    from ncconvert.utils import _map_concurrently
+
+    running, peak = [], []
+    lock = threading.Lock()
+
+    def work(i: int) -> int:
+        with lock:
+            running.append(i)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(i)
+        return i * 10
+
+    items = [(i,) for i in range(6)]
+
+    # Results are in the order of the items; at most `workers` run at once
+    assert _map_concurrently(work, items, workers=3) == [0, 10, 20, 30, 40, 50]
+    assert 1 < max(peak) <= 3
+
+    # Items only run together while their costs fit in the budget, and an item that
+    # costs more than the budget runs alone
+    peak.clear()
+    costs = [40, 40, 40, 40, 40, 200]
+    assert _map_concurrently(work, items, 4, costs, budget=100) == [
+        0,
+        10,
+        20,
+        30,
+        40,
+        50,
+    ]
+    assert max(peak) == 2
+
+
+def test_select_dataset(dataset: xr.Dataset):
+    from ncconvert.utils import _select_dataset
+
+    assert _select_dataset(dataset, {}) is dataset
+
+    selected = _select_dataset(dataset, {"variables": ["humidity"]})
+    assert list(selected.data_vars) == ["humidity"]
+    assert "height" not in selected.dims
+
+    selected = _select_dataset(dataset, {"drop_variables": ["humidity", "missing"]})
+    assert "humidity" not in selected and "temperature" in selected
+
+    selected = _select_dataset(
+        dataset, {"time_start": "2022-04-05T06:00", "time_end": "2022-04-05T16:00"}
+    )
+    assert selected.sizes["time"] == 2
+
+    # A single index keeps the dimension
+    selected = _select_dataset(dataset, {"isel": {"height": -1, "time": slice(0, 2)}})
+    assert dict(selected.sizes) == {"time": 2, "height": 1}
+    assert selected["height"].values.tolist() == [30]
+
+    with pytest.raises(ValueError, match="not in the dataset"):
+        _select_dataset(dataset, {"variables": ["missing"]})
+    with pytest.raises(ValueError, match="not in the dataset"):
+        _select_dataset(dataset, {"isel": {"depth": 0}})
+
+
+def test_open_dataset(dataset: xr.Dataset, tmp_path: Path):
+    from ncconvert.utils import _get_chunk_cache_slots, open_dataset
+
+    dataset = dataset.copy()
+    dataset["time"].encoding.update({"units": dataset["time"].attrs.pop("units")})
+    dataset["temperature"].encoding.update({"dtype": "int16", "scale_factor": 0.5})
+    dataset.to_netcdf(tmp_path / "test.nc", engine="netcdf4")
+    dataset.to_netcdf(tmp_path / "test3.nc", format="NETCDF3_64BIT")
+
+    with open_dataset(tmp_path / "test.nc", chunk_cache=2**20) as ds:
+        xr.testing.assert_identical(ds, xr.open_dataset(tmp_path / "test.nc"))
+    with open_dataset(tmp_path / "test.nc", engine="h5netcdf") as ds:
+        assert ds["temperature"].values[0, 0] == 88
+    with open_dataset(tmp_path / "test.nc", mask_and_scale=False) as ds:
+        assert ds["temperature"].dtype == "int16"
+        assert ds["temperature"].attrs["scale_factor"] == 0.5
+    with open_dataset(tmp_path / "test3.nc", engine="scipy", mmap=False) as ds:
+        assert ds["humidity"].values.tolist() == [60.5, 65.5, 63]
+
+    with pytest.raises(ValueError, match="engine must be"):
+        open_dataset(tmp_path / "test.nc", engine="zarr")
+    with pytest.raises(ValueError, match="netcdf4 engine"):
+        open_dataset(tmp_path / "test.nc", engine="h5netcdf", chunk_cache=2**20)
+    with pytest.raises(ValueError, match="scipy engine"):
+        open_dataset(tmp_path / "test.nc", mmap=True)
+
+    # A prime, about 100 times the number of 64 KiB chunks in the cache
+    assert _get_chunk_cache_slots(2**20) == 1601
+    assert _get_chunk_cache_slots(0) == 521
@@ -0,0 +1,54 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_file_watcher(tmp_path: Path, polling: bool):
+    from ncconvert.watch import FileWatcher
+
+    (tmp_path / "existing.nc").write_text("x")
+    (tmp_path / "ignored.txt").write_text("x")
+
+    with FileWatcher(
+        [tmp_path], settle=0.2, poll_interval=0.05, polling=polling
+    ) as watcher:
+        assert watcher.poll(timeout=2) == [tmp_path / "existing.nc"]
+
+        def write_slowly():
+            with open(tmp_path / "new.nc", "w") as f:
+                for _ in range(4):
+                    f.write("data")
+                    f.flush()
+                    time.sleep(0.1)
+
+        writer = threading.Thread(target=write_slowly)
+        start = time.monotonic()
+        writer.start()
+        # Not reported until the writer has stopped changing it for `settle` seconds
+        assert watcher.poll(timeout=5) == [tmp_path / "new.nc"]
+        assert time.monotonic() - start >= 0.3 + 0.2  # The last write + settle
+        writer.join()
+        assert watcher.poll(timeout=0.3) == []
+
+        # Reported again once it changes
+        (tmp_path / "existing.nc").write_text("changed")
+        assert watcher.poll(timeout=2) == [tmp_path / "existing.nc"]
+
+        # Files that are deleted are forgotten
+        (tmp_path / "existing.nc").unlink()
+        assert watcher.poll(timeout=0.3) == []
+        assert tmp_path / "existing.nc" not in watcher._reported
+
+
+def test_file_watcher_skips_existing(tmp_path: Path):
+    from ncconvert.watch import FileWatcher
+
+    (tmp_path / "existing.nc").write_text("x")
+
+    with FileWatcher([tmp_path], settle=0, existing=False) as watcher:
+        assert watcher.poll(timeout=0.2) == []
+        (tmp_path / "new.nc").write_text("x")
+        assert watcher.poll(timeout=2) == [tmp_path / "new.nc"]